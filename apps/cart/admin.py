@@ -1,8 +1,12 @@
 from django.contrib import admin
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.utils.html import format_html
 
+from apps.tasks.queue import run_or_enqueue
 from .models import Cart, CartItem
+from .tasks import ADMIN_ASYNC_THRESHOLD, clear_carts, duplicate_cart_items, reprice_cart_items
 
 
 class CartItemInline(admin.TabularInline):
@@ -110,40 +114,62 @@ class CartAdmin(admin.ModelAdmin):
 
     def get_items_count(self, obj):
         """Количество уникальных товаров"""
-        count = obj.items.count()
-        return format_html('<b>{}</b>', count)
+        return format_html('<b>{}</b>', obj.items_count)
 
     get_items_count.short_description = 'Кол-во позиций'
+    get_items_count.admin_order_field = 'items_count'
 
     def get_total_quantity(self, obj):
         """Общее количество товаров"""
-        total = obj.get_total_quantity()
-        return format_html('<b>{} шт.</b>', total)
+        return format_html('<b>{} шт.</b>', obj.total_quantity)
     get_total_quantity.short_description = 'Всего товаров'
+    get_total_quantity.admin_order_field = 'total_quantity'
 
     def get_total_price_formatted(self, obj):
         """Форматированная общая стоимость"""
-        total = obj.get_total_price()
         return format_html(
             '<span style="color: green; font-weight: bold;">{} ₽</span>',
-            f'{total:.2f}'  # Форматируем число отдельно
+            f'{obj.total_price:.2f}'  # Форматируем число отдельно
         )
     get_total_price_formatted.short_description = 'Общая стоимость'
+    get_total_price_formatted.admin_order_field = 'total_price'
 
     # Действия над корзинами
-    actions = ['clear_selected_carts']
+    actions = ['clear_selected_carts', 'reprice_selected_carts']
 
     def clear_selected_carts(self, request, queryset):
         """Очистить выбранные корзины"""
-        for cart in queryset:
-            cart.clear()
-        self.message_user(request, f'Очищено {queryset.count()} корзин')
+        cart_ids = list(queryset.values_list('pk', flat=True))
+        cleared = run_or_enqueue(clear_carts, cart_ids,
+                                 size=len(cart_ids), threshold=ADMIN_ASYNC_THRESHOLD)
+        if cleared is None:
+            self.message_user(request, f'Очистка {len(cart_ids)} корзин поставлена в очередь')
+        else:
+            self.message_user(request, f'Очищено {len(cart_ids)} корзин')
     clear_selected_carts.short_description = 'Очистить выбранные корзины'
 
-    # Переопределяем queryset для оптимизации
+    def reprice_selected_carts(self, request, queryset):
+        """Обновить цены в выбранных корзинах до актуальных"""
+        cart_ids = list(queryset.values_list('pk', flat=True))
+        updated = run_or_enqueue(reprice_cart_items, 'cart_id', cart_ids,
+                                 size=len(cart_ids), threshold=ADMIN_ASYNC_THRESHOLD)
+        if updated is None:
+            self.message_user(request, f'Обновление цен в {len(cart_ids)} корзинах поставлено в очередь')
+        else:
+            self.message_user(request, f'Обновлено цен: {updated}')
+    reprice_selected_carts.short_description = 'Обновить цены в выбранных корзинах'
+
+    # Итоги считаются в БД одним запросом для всей страницы списка
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('items', 'items__product')
+        return qs.annotate(
+            items_count=Count('items'),
+            total_quantity=Coalesce(Sum('items__quantity'), 0),
+            total_price=Coalesce(
+                Sum(F('items__price') * F('items__quantity'), output_field=DecimalField()),
+                0, output_field=DecimalField()
+            )
+        )
 
 
 @admin.register(CartItem)
@@ -209,23 +235,25 @@ class CartItemAdmin(admin.ModelAdmin):
     actions = ['duplicate_item', 'update_prices']
 
     def duplicate_item(self, request, queryset):
-        """Дублировать выбранные позиции"""
-        for item in queryset:
-            item.pk = None
-            item.quantity = 1
-            item.save()
-        self.message_user(request, f'Создано дубликатов: {queryset.count()}')
+        """Дублировать выбранные позиции: добавить в каждую еще одну штуку товара"""
+        item_ids = list(queryset.values_list('pk', flat=True))
+        updated = run_or_enqueue(duplicate_cart_items, item_ids,
+                                 size=len(item_ids), threshold=ADMIN_ASYNC_THRESHOLD)
+        if updated is None:
+            self.message_user(request, f'Дублирование {len(item_ids)} позиций поставлено в очередь')
+        else:
+            self.message_user(request, f'Добавлено по одной штуке в позиций: {updated}')
 
     duplicate_item.short_description = 'Дублировать позиции'
 
     def update_prices(self, request, queryset):
         """Обновить цены до актуальных"""
-        updated = 0
-        for item in queryset:
-            if item.price != item.product.price:
-                item.price = item.product.price
-                item.save()
-                updated += 1
-        self.message_user(request, f'Обновлено цен: {updated}')
+        item_ids = list(queryset.values_list('pk', flat=True))
+        updated = run_or_enqueue(reprice_cart_items, 'id', item_ids,
+                                 size=len(item_ids), threshold=ADMIN_ASYNC_THRESHOLD)
+        if updated is None:
+            self.message_user(request, f'Обновление цен {len(item_ids)} позиций поставлено в очередь')
+        else:
+            self.message_user(request, f'Обновлено цен: {updated}')
 
     update_prices.short_description = 'Обновить цены'
\ No newline at end of file
@@ -0,0 +1,22 @@
+from django.core.cache import cache
+
+from .models import CartItem
+
+
+CART_COUNT_KEY = 'cart:count:{}'
+# Время жизни счетчика позиций корзины (сек); после истечения пересчитывается
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
+
+def set_cart_count(cart_id, count):
+    """Запоминает количество позиций корзины для значка в шапке"""
+    cache.set(CART_COUNT_KEY.format(cart_id), count, CART_COUNT_TIMEOUT)
+
+
+def get_cart_count(cart_id):
+    """Возвращает количество позиций корзины; запрос к БД только при промахе кэша"""
+    count = cache.get(CART_COUNT_KEY.format(cart_id))
+    if count is None:
+        count = CartItem.objects.filter(cart_id=cart_id).count()
+        set_cart_count(cart_id, count)
+    return count
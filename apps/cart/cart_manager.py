@@ -1,96 +1,55 @@
-from decimal import Decimal
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 
-from .models import Cart, CartItem
+from apps.catalog import reservations
+from apps.catalog.models import Product
+from .models import MAX_ITEM_QUANTITY
+from .storage import get_cart_storage, empty_summary
 
 
 class CartManager:
-    """Менеджер для работы с корзиной"""
+    """Менеджер для работы с корзиной.
+
+    Позиции хранятся в хранилище, выбранном для посетителя (см. get_cart_storage):
+    в БД для авторизованного пользователя, в сессии для анонимного. Добавляемый
+    товар резервируется на складе на время RESERVATION_TTL
+    """
     def __init__(self, request):
         self.request = request
-        self.user = request.user if request.user.is_authenticated else None
-        self.session_key = request.session.session_key
-
-        # Создаем сессию если её нет
-        if not self.session_key:
-            self.request.session.save()
-            self.session_key = self.request.session.session_key
-
-        self.cart = self._get_cart()
-
-    def _get_cart(self):
-        """Получить корзину для пользователя или сессии"""
-        # Для авторизованного пользователя
-        if self.user and self.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=self.user)
-            return cart
-
-        # Для неавторизованного пользователя - по сессии
-        cart, created = Cart.objects.get_or_create(session_key=self.session_key)
-        return cart
-
-    def _merge_session_cart(self, user_cart):
-        """Переносит товары из сессионной корзины в корзину пользователя"""
-        try:
-            session_cart = Cart.objects.get(session_key=self.session_key)
-
-            if session_cart and session_cart != user_cart:
-                with transaction.atomic():
-                    for item in session_cart.items.all():
-                        self._add_item(
-                            user_cart,
-                            item.product,
-                            item.quantity,
-                            save=False
-                        )
-                    # Деактивируем сессионную корзину
-                    session_cart.is_active = False
-                    session_cart.save()
-
-        except Cart.DoesNotExist:
-            pass
-
-    @staticmethod
-    def _add_item(cart, product, quantity=1):
-        """Добавляет товар в корзину (внутренний метод)"""
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={
-                'quantity': quantity,
-                'price': product.price
-            }
-        )
-
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-
-        return cart_item
-
-    @staticmethod
-    def _remove_item(cart, product, quantity=1):
-        """Удаляет товар из корзины (внутренний метод)"""
-        cart_item = CartItem.objects.get(cart=cart, product=product)
-
-        cart_item.quantity -= quantity
-
-        if cart_item.quantity <= 0:
-            cart_item.delete()
-        else:
-            cart_item.save()
+        self.storage = get_cart_storage(request)
+        # Итоги корзины, вычисленные summary(); сбрасываются при изменении корзины
+        self._summary = None
 
     def add(self, product, quantity=1):
         """Публичный метод добавление товара в корзину"""
         if quantity < 1:
             raise ValueError("Количество должно быть положительным")
 
-        return self._add_item(self.cart, product, quantity)
+        holder = reservations.get_holder(self.request)
+        # Сначала корзина, затем резерв: строка товара блокируется только
+        # на время резервирования, а не на время записи в сессию или корзину
+        item_quantity = self.storage.add(product, quantity)
+        try:
+            with transaction.atomic():
+                # OutOfStock (подкласс ValueError), если товара на складе не хватает
+                reserved = reservations.reserve(holder, product, quantity)
+                # Корзина ограничивает количество MAX_ITEM_QUANTITY - лишний резерв возвращаем
+                if reserved > item_quantity:
+                    reservations.release(holder, product, reserved - item_quantity)
+        except reservations.OutOfStock:
+            self._restore_reserved_quantity(holder, product)
+            raise
+
+        self._refresh_summary()
+        return item_quantity
 
     def remove(self, product):
         """Удалить товар из корзины"""
-        self._remove_item(self.cart, product)
+        self.storage.remove(product)
+        holder = reservations.get_holder(self.request, create=False)
+        if holder is not None:
+            reservations.release(holder, product, 1)
+        self._refresh_summary()
 
     def update_quantity(self, product, quantity):
         """Уменьшить количество товара в корзине"""
@@ -98,40 +57,92 @@ class CartManager:
             self.remove(product)
             return
 
-        cart_item = get_object_or_404(
-            CartItem,
-            cart=self.cart,
-            product=product
-        )
-        cart_item.quantity = quantity
-        cart_item.save()
+        holder = reservations.get_holder(self.request)
+        if not self.storage.update_quantity(product, quantity):
+            raise Http404('Товар не найден в корзине')
+        try:
+            reservations.ensure_reserved(holder, product, min(quantity, MAX_ITEM_QUANTITY))
+        except reservations.OutOfStock:
+            self._restore_reserved_quantity(holder, product)
+            raise
+        self._refresh_summary()
+
+    def _restore_reserved_quantity(self, holder, product):
+        """Возвращает количество товара в корзине к размеру резерва, если зарезервировать не удалось"""
+        held = reservations.held_quantity(holder, product)
+        if held:
+            self.storage.update_quantity(product, held)
+        else:
+            self.storage.remove(product, MAX_ITEM_QUANTITY)
+        self._summary = None
+
+    def renew_reservations(self):
+        """Продлевает резервы под товары корзины.
+
+        Если резерв истек, а товара на складе уже не хватает, количество в корзине
+        уменьшается до зарезервированного. Возвращает [(товар, сколько не хватило)]
+        """
+        quantities = self.storage.quantities()
+        holder = reservations.get_holder(self.request, create=False)
+        if not quantities or holder is None:
+            return []
+
+        shortfall = reservations.renew(holder, quantities)
+        if not shortfall:
+            return []
+
+        products = Product.objects.in_bulk(list(shortfall))
+        for product_id, missing in shortfall.items():
+            product = products[product_id]
+            if missing < quantities[product_id]:
+                self.storage.update_quantity(product, quantities[product_id] - missing)
+            else:
+                self.storage.remove(product, MAX_ITEM_QUANTITY)
+        self._summary = None
+        return [(products[product_id], missing) for product_id, missing in shortfall.items()]
 
     def clear(self):
         """Очистить корзину"""
-        self.cart.items.all().delete()
+        self.storage.clear()
+        holder = reservations.get_holder(self.request, create=False)
+        if holder is not None:
+            reservations.release_all(holder)
+        self._summary = empty_summary()
 
     def get_items(self):
         """Возвращает все товары в корзине"""
-        return self.cart.items.select_related('product').all()
+        return self.storage.get_items()
+
+    def summary(self):
+        """Возвращает итоги корзины: количество позиций, товаров и общую стоимость.
+
+        Итоги запоминаются до следующего изменения корзины через этот менеджер
+        """
+        if self._summary is None:
+            self._summary = self.storage.summary()
+        return self._summary
+
+    def _refresh_summary(self):
+        """Пересчитывает итоги после изменения корзины.
+
+        Итоги нужны и ответу на AJAX-запрос, и счетчику позиций в шапке,
+        поэтому считаются сразу
+        """
+        self._summary = None
+        self.summary()
 
     def get_total_price(self):
         """Получить общую стоимость"""
-        total = Decimal(0)
-        for item in self.get_items():
-            total += item.price * item.quantity
-        return total
+        return self.summary()['total_price']
 
     def get_total_quantity(self):
         """Возвращает общее количество товаров"""
-        total = 0
-        for item in self.get_items():
-            total += item.quantity
-        return total
+        return self.summary()['total_quantity']
 
     def count_items(self):
         """Возвращает количество позиций"""
-        return self.cart.items.count()
+        return self.summary()['items_count']
 
     def is_empty(self):
         """Проверяет, пустая ли корзина"""
-        return not self.cart.items.exists()
\ No newline at end of file
+        return self.count_items() == 0
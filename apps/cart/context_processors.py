@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .storage import get_cart_storage
+
+
+def get_badge_count(request):
+    """Количество позиций корзины для значка в шапке"""
+    # Без cookie сессии нет и корзины; к сессии не обращаемся, чтобы ответ
+    # не получил заголовок Vary: Cookie
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return 0
+    return get_cart_storage(request).badge_count()
+
+
+def cart_len(request):
+    """Добавляет количество позиций корзины в контекст шаблона (значок в шапке).
+
+    Значение берется из счетчика в кэше по id корзины в БД, который обновляет
+    CartManager при каждом изменении корзины, или из корзины в сессии.
+    Значение вычисляется лениво - только если шаблон его использует
+    """
+    return {
+        'cart_len': SimpleLazyObject(lambda: get_badge_count(request))
+    }
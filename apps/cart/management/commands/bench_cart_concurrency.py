@@ -0,0 +1,69 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.cart.models import Cart, CartItem, MAX_ITEM_QUANTITY
+from apps.cart.storage import DatabaseCartStorage
+from apps.catalog.models import Product
+
+
+BENCH_SESSION_KEY = 'bench-cart-concurrency'
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка: параллельно добавляет товар в одну корзину и сверяет количество'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Количество параллельных потоков')
+        parser.add_argument('--adds', type=int, default=10,
+                            help='Сколько раз каждый поток добавляет товар')
+
+    def handle(self, *args, **options):
+        threads_count, adds = options['threads'], options['adds']
+        product = Product.objects.order_by('pk').first()
+        if product is None:
+            raise CommandError('В каталоге нет товаров')
+
+        Cart.objects.filter(session_key=BENCH_SESSION_KEY).delete()
+        cart = Cart.objects.create(session_key=BENCH_SESSION_KEY)
+
+        errors = []
+        barrier = threading.Barrier(threads_count)
+
+        def worker():
+            try:
+                # Все потоки стартуют одновременно, чтобы запросы пересекались
+                barrier.wait()
+                for _ in range(adds):
+                    DatabaseCartStorage._add_item(cart, product, 1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        expected = min(threads_count * adds, MAX_ITEM_QUANTITY)
+        quantity = CartItem.objects.get(cart=cart, product=product).quantity
+        cart.delete()
+
+        total = threads_count * adds
+        self.stdout.write(
+            f'Добавлений: {total}, ошибок: {len(errors)}, '
+            f'время: {elapsed:.2f} с ({total / elapsed:.0f} в секунду)'
+        )
+        for error in errors[:5]:
+            self.stderr.write(repr(error))
+
+        if errors or quantity != expected:
+            raise CommandError(f'Количество в корзине {quantity}, ожидалось {expected}')
+        self.stdout.write(self.style.SUCCESS(f'Количество в корзине {quantity}, потерь нет'))
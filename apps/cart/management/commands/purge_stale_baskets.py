@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.cart.tasks import purge_stale_baskets, BASKET_TTL, PURGE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Удаляет анонимные корзины и избранное, чья сессия истекла '
+            'или которые не менялись дольше заданного срока')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-days', type=int, default=BASKET_TTL.days,
+                            help='Срок бездействия в днях, после которого запись удаляется')
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE,
+                            help='Сколько записей удалять в одной транзакции')
+
+    def handle(self, *args, **options):
+        reclaimed = purge_stale_baskets(options['ttl_days'], options['batch_size'])
+
+        for table, (rows, size) in reclaimed.items():
+            self.stdout.write(f'{table}: удалено строк {rows}, ~{size / 1024:.1f} КБ')
+
+        total_rows = sum(rows for rows, _ in reclaimed.values())
+        total_size = sum(size for _, size in reclaimed.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего удалено строк: {total_rows}, освобождено ~{total_size / 1024:.1f} КБ'
+        ))
@@ -5,6 +5,9 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from apps.catalog.models import Product
 
 
+# Максимальное количество одного товара в корзине
+MAX_ITEM_QUANTITY = 100
+
 class Cart(models.Model):
     """Модель корзины пользователя"""
     user = models.OneToOneField(
@@ -64,7 +67,7 @@ class CartItem(models.Model):
     )
     quantity = models.PositiveIntegerField(
         default=1,
-        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_ITEM_QUANTITY)],
         verbose_name='Количество'
     )
     price = models.DecimalField(
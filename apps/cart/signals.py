@@ -1,9 +1,12 @@
 from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
 from django.dispatch import receiver
 import logging
 
+from apps.catalog import reservations
+from .cache import set_cart_count
 from .models import Cart
-from .cart_manager import CartManager
+from .storage import CART_SESSION_ID, DatabaseCartStorage, SessionCartStorage
 
 
 logger = logging.getLogger(__name__)
@@ -16,37 +19,53 @@ def merge_cart_on_login(sender, request, user, **kwargs):
     # Получаем secret_key из куки (старый ключ)
     old_session_key = request.COOKIES.get('sessionid')
 
-    if not old_session_key:
-        return
+    if old_session_key:
+        merge_session_cart(request, old_session_key, user)
+        # Резервы товаров корзины переходят к пользователю
+        reservations.transfer(reservations.session_holder(old_session_key),
+                              reservations.user_holder(user))
+
+    remember_user_cart(request, user)
+
+
+def merge_session_cart(request, old_session_key, user):
+    """Переносит товары из сессионной корзины (в сессии или в БД) в корзину пользователя.
 
-    try:
-        logger.debug(f"Ищем корзину с session_key={old_session_key}, user__isnull=True")
-        # Получаем избранное из сессии
-        session_cart = Cart.objects.get(session_key=old_session_key, user__isnull=True)
+    Данные сессии сохраняются при входе (меняется только ее ключ), поэтому позиции
+    анонимной корзины берутся из текущей сессии. Число запросов не зависит
+    от количества товаров в корзине
+    """
+    logger.debug(f"Ищем корзину с session_key={old_session_key}, user__isnull=True")
+    session_items = SessionCartStorage.session_items(request.session)
+    session_cart = Cart.objects.filter(session_key=old_session_key, user__isnull=True).first()
+    if session_cart is None and not session_items:
+        logger.warning(f"Корзина с session_key={old_session_key} не найдена")
+        return
 
+    with transaction.atomic():
         # Получаем или создаем корзину пользователя
         user_cart, created = Cart.objects.get_or_create(user=user)
 
-        # Если корзины разные, переносим товар
-        if session_cart != user_cart:
-            for item in session_cart.items.all():
-                cart_item, created = user_cart.items.get_or_create(
-                    product=item.product,
-                    defaults={
-                        'quantity': item.quantity,
-                        'price': item.price,
-                    }
-                )
+        if session_items:
+            DatabaseCartStorage.materialize_items(user_cart, session_items)
 
-                if not created:
-                    cart_item.quantity += item.quantity
-                    cart_item.save()
+        if session_cart is not None:
+            DatabaseCartStorage.merge_items(session_cart, user_cart)
+            # Удаляем сессионную корзину
+            session_cart.delete()
 
-        # Удаляем сессионную корзину
-        session_cart.delete()
+    # Позиции убираются из сессии только после успешного переноса
+    request.session.pop(SessionCartStorage.SESSION_KEY, None)
+    logger.debug("Сессионная корзина перенесена")
 
-        logger.debug("Сессионное избранное удалено")
 
-    except Cart.DoesNotExist:
-        logger.warning(f"Корзина с session_key={old_session_key} не найдена")
+def remember_user_cart(request, user):
+    """Запоминает в сессии корзину пользователя и обновляет счетчик позиций в шапке"""
+    user_cart = Cart.objects.filter(user=user).first()
+    if user_cart is None:
+        # В сессии мог остаться id анонимной корзины
+        request.session.pop(CART_SESSION_ID, None)
+        return
 
+    request.session[CART_SESSION_ID] = user_cart.pk
+    set_cart_count(user_cart.pk, user_cart.items.count())
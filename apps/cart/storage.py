@@ -0,0 +1,400 @@
+from abc import ABC, abstractmethod
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.catalog.models import Product
+from .cache import get_cart_count, set_cart_count
+from .models import Cart, CartItem, MAX_ITEM_QUANTITY
+
+
+# Ключ сессии, под которым хранится id найденной корзины
+CART_SESSION_ID = 'cart_id'
+# Хранилище корзины анонимного посетителя по умолчанию
+DEFAULT_ANONYMOUS_STORAGE = 'apps.cart.storage.SessionCartStorage'
+
+# Количество при совпадении (cart, product): сумма, но не больше MAX_ITEM_QUANTITY
+_MERGED_QUANTITY_SQL = f"""
+    quantity = CASE
+        WHEN {CartItem._meta.db_table}.quantity + EXCLUDED.quantity > {MAX_ITEM_QUANTITY}
+        THEN {MAX_ITEM_QUANTITY}
+        ELSE {CartItem._meta.db_table}.quantity + EXCLUDED.quantity
+    END,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+def _upsert_items_sql(rows_count):
+    """Вставка позиций или увеличение количества одним запросом.
+
+    Ограничение MAX_ITEM_QUANTITY проверяется в самом запросе, поэтому
+    параллельные добавления не теряют изменений и не нарушают уникальность
+    (cart, product)
+    """
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * rows_count)
+    return f"""
+        INSERT INTO {CartItem._meta.db_table}
+            (cart_id, product_id, quantity, price, created_at, updated_at)
+        VALUES {values}
+        ON CONFLICT (cart_id, product_id) DO UPDATE SET {_MERGED_QUANTITY_SQL}
+    """
+
+
+UPSERT_ITEM_SQL = _upsert_items_sql(1) + ' RETURNING id, quantity, price'
+
+# Перенос всех позиций одной корзины в другую одним запросом
+MERGE_ITEMS_SQL = f"""
+    INSERT INTO {CartItem._meta.db_table}
+        (cart_id, product_id, quantity, price, created_at, updated_at)
+    SELECT %s, product_id, quantity, price, %s, %s
+    FROM {CartItem._meta.db_table}
+    WHERE cart_id = %s
+    ON CONFLICT (cart_id, product_id) DO UPDATE SET {_MERGED_QUANTITY_SQL}
+"""
+
+
+def empty_summary():
+    """Итоги пустой корзины"""
+    return {'items_count': 0, 'total_quantity': 0, 'total_price': Decimal(0)}
+
+
+def get_cart_storage(request):
+    """Возвращает хранилище корзины для посетителя.
+
+    Корзина авторизованного пользователя хранится в БД, анонимного - в хранилище
+    из настройки CART_ANONYMOUS_STORAGE
+    """
+    if request.user.is_authenticated:
+        return DatabaseCartStorage(request)
+    storage_class = import_string(
+        getattr(settings, 'CART_ANONYMOUS_STORAGE', DEFAULT_ANONYMOUS_STORAGE)
+    )
+    return storage_class(request)
+
+
+class BaseCartStorage(ABC):
+    """Хранилище позиций корзины посетителя"""
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def session_key(self):
+        return self.request.session.session_key
+
+    @abstractmethod
+    def add(self, product, quantity):
+        """Добавляет товар и возвращает его количество в корзине.
+
+        Количество ограничено MAX_ITEM_QUANTITY
+        """
+
+    @abstractmethod
+    def remove(self, product, quantity=1):
+        """Уменьшает количество товара, удаляя позицию с последней единицей"""
+
+    @abstractmethod
+    def update_quantity(self, product, quantity):
+        """Устанавливает количество товара. Возвращает False, если товара нет в корзине"""
+
+    @abstractmethod
+    def clear(self):
+        """Удаляет все позиции корзины"""
+
+    @abstractmethod
+    def get_items(self):
+        """Возвращает позиции корзины (CartItem с загруженным товаром)"""
+
+    @abstractmethod
+    def quantities(self):
+        """Возвращает количества товаров в корзине: {id товара: количество}"""
+
+    @abstractmethod
+    def summary(self):
+        """Возвращает количество позиций, товаров и общую стоимость"""
+
+    @abstractmethod
+    def badge_count(self):
+        """Количество позиций для значка в шапке, по возможности без запросов к БД"""
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """Корзина в БД (модели Cart и CartItem).
+
+    Корзина ищется лениво, при первом обращении. Операции чтения для посетителя
+    без корзины не создают ни сессию, ни корзину; они создаются только при
+    добавлении товара
+    """
+    def __init__(self, request):
+        super().__init__(request)
+        self.user = request.user if request.user.is_authenticated else None
+
+        self._cart = None
+        self._cart_resolved = False
+
+    @property
+    def cart(self):
+        """Корзина посетителя; создается, если ее еще нет"""
+        return self.get_cart(create=True)
+
+    def get_cart(self, create=False):
+        """Возвращает корзину пользователя или сессии.
+
+        Если корзины нет, возвращает None, а при create=True создает ее
+        """
+        if not self._cart_resolved:
+            self._cart = self._find_cart()
+            self._cart_resolved = True
+
+        if self._cart is None and create:
+            self._cart = self._create_cart()
+        return self._cart
+
+    def _find_cart(self):
+        """Ищет существующую корзину: по id из сессии, затем по пользователю или сессии"""
+        cart_id = self.request.session.get(CART_SESSION_ID)
+        if cart_id is not None:
+            # Сверяем владельца: после входа в сессии остается id анонимной корзины
+            cart = Cart.objects.filter(pk=cart_id, user=self.user).first()
+            if cart is not None:
+                return cart
+
+        if self.user:
+            cart = Cart.objects.filter(user=self.user).first()
+        elif self.session_key:
+            cart = Cart.objects.filter(session_key=self.session_key, user__isnull=True).first()
+        else:
+            # Нет ни пользователя, ни сессии - значит, нет и корзины
+            return None
+
+        if cart is not None:
+            self._remember_cart(cart)
+        return cart
+
+    def _create_cart(self):
+        """Создает корзину для пользователя или сессии"""
+        # Для авторизованного пользователя
+        if self.user:
+            cart, created = Cart.objects.get_or_create(user=self.user)
+        else:
+            # Для неавторизованного пользователя - по сессии, создаем сессию если её нет
+            if not self.session_key:
+                self.request.session.save()
+            cart, created = Cart.objects.get_or_create(session_key=self.session_key)
+
+        self._remember_cart(cart)
+        return cart
+
+    def _remember_cart(self, cart):
+        """Запоминает id корзины в сессии для поиска по первичному ключу"""
+        if self.request.session.get(CART_SESSION_ID) != cart.pk:
+            self.request.session[CART_SESSION_ID] = cart.pk
+
+    @staticmethod
+    def merge_items(source_cart, target_cart):
+        """Переносит позиции одной корзины в другую одним запросом.
+
+        Количество совпадающих товаров складывается с ограничением MAX_ITEM_QUANTITY
+        """
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(MERGE_ITEMS_SQL, [target_cart.pk, now, now, source_cart.pk])
+
+    @staticmethod
+    def materialize_items(cart, items):
+        """Записывает позиции {id товара: (количество, цена)} в корзину одним запросом.
+
+        Товары, удаленные из каталога, пропускаются
+        """
+        existing = set(Product.objects.filter(pk__in=items).values_list('pk', flat=True))
+        now = timezone.now()
+        params = []
+        for product_id, (quantity, price) in items.items():
+            if product_id in existing:
+                params += [cart.pk, product_id, min(quantity, MAX_ITEM_QUANTITY), price, now, now]
+        if not params:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(_upsert_items_sql(len(params) // 6), params)
+
+    @staticmethod
+    def _add_item(cart, product, quantity=1):
+        """Добавляет товар в корзину (внутренний метод)"""
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_ITEM_SQL, [
+                cart.pk, product.pk, min(quantity, MAX_ITEM_QUANTITY), product.price, now, now
+            ])
+            item_id, item_quantity, price = cursor.fetchone()
+
+        return CartItem(id=item_id, cart=cart, product=product, quantity=item_quantity,
+                        price=price, updated_at=now)
+
+    @staticmethod
+    def _remove_item(cart, product, quantity=1):
+        """Удаляет товар из корзины (внутренний метод)"""
+        items = CartItem.objects.filter(cart=cart, product=product)
+
+        # Уменьшаем количество в запросе, без чтения позиции
+        updated = items.filter(quantity__gt=quantity).update(
+            quantity=F('quantity') - quantity, updated_at=timezone.now()
+        )
+        if not updated:
+            items.filter(quantity__lte=quantity).delete()
+
+    def add(self, product, quantity):
+        return self._add_item(self.cart, product, quantity).quantity
+
+    def remove(self, product, quantity=1):
+        cart = self.get_cart()
+        if cart is not None:
+            self._remove_item(cart, product, quantity)
+
+    def update_quantity(self, product, quantity):
+        cart = self.get_cart()
+        if cart is None:
+            return False
+
+        updated = CartItem.objects.filter(cart=cart, product=product).update(
+            quantity=min(quantity, MAX_ITEM_QUANTITY), updated_at=timezone.now()
+        )
+        return bool(updated)
+
+    def clear(self):
+        cart = self.get_cart()
+        if cart is None:
+            return
+        cart.items.all().delete()
+        set_cart_count(cart.pk, 0)
+
+    def get_items(self):
+        cart = self.get_cart()
+        if cart is None:
+            return CartItem.objects.none()
+        return cart.items.select_related('product').prefetch_related('product__images')
+
+    def quantities(self):
+        cart = self.get_cart()
+        if cart is None:
+            return {}
+        return dict(cart.items.values_list('product_id', 'quantity'))
+
+    def summary(self):
+        """Итоги считаются одним агрегирующим запросом"""
+        cart = self.get_cart()
+        if cart is None:
+            return empty_summary()
+
+        summary = cart.items.aggregate(
+            items_count=Count('id'),
+            total_quantity=Coalesce(Sum('quantity'), 0),
+            total_price=Coalesce(
+                Sum(F('price') * F('quantity'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Decimal(0),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+        set_cart_count(cart.pk, summary['items_count'])
+        return summary
+
+    def badge_count(self):
+        """Счетчик позиций берется из кэша по id корзины из сессии"""
+        cart_id = self.request.session.get(CART_SESSION_ID)
+        if cart_id is None and self.user:
+            # Сессия создана до того, как id корзины стали запоминать при входе
+            cart = self.get_cart()
+            cart_id = cart.pk if cart is not None else None
+        if cart_id is None:
+            return 0
+        return get_cart_count(cart_id)
+
+
+class SessionCartStorage(BaseCartStorage):
+    """Корзина анонимного посетителя в его сессии.
+
+    Позиции хранятся в сессии как {id товара: [количество, цена]} (строковые
+    id и цены - сессия сериализуется в JSON) и живут столько же, сколько сессия.
+    Сессия хранится в БД, поэтому корзина одна на всех узлах и не вытесняется
+    из кэша. Такая корзина не пишет в таблицы корзин; при входе пользователя
+    она переносится в БД (см. materialize_items)
+    """
+    SESSION_KEY = 'cart_items'
+
+    @classmethod
+    def session_items(cls, session):
+        """Позиции корзины из сессии: {id товара: (количество, цена)}"""
+        stored = session.get(cls.SESSION_KEY) or {}
+        return {
+            int(product_id): (quantity, Decimal(price))
+            for product_id, (quantity, price) in stored.items()
+        }
+
+    def _load(self):
+        return self.request.session.get(self.SESSION_KEY, {})
+
+    def _save(self, items):
+        if items:
+            self.request.session[self.SESSION_KEY] = items
+        else:
+            self.request.session.pop(self.SESSION_KEY, None)
+
+    def add(self, product, quantity):
+        items = self._load()
+        current, price = items.get(str(product.pk), (0, str(product.price)))
+        items[str(product.pk)] = [min(current + quantity, MAX_ITEM_QUANTITY), price]
+        self._save(items)
+        return items[str(product.pk)][0]
+
+    def remove(self, product, quantity=1):
+        items = self._load()
+        if str(product.pk) not in items:
+            return
+        current, price = items[str(product.pk)]
+        if current > quantity:
+            items[str(product.pk)] = [current - quantity, price]
+        else:
+            del items[str(product.pk)]
+        self._save(items)
+
+    def update_quantity(self, product, quantity):
+        items = self._load()
+        if str(product.pk) not in items:
+            return False
+        items[str(product.pk)] = [min(quantity, MAX_ITEM_QUANTITY), items[str(product.pk)][1]]
+        self._save(items)
+        return True
+
+    def clear(self):
+        self._save({})
+
+    def get_items(self):
+        items = self._load()
+        if not items:
+            return []
+        products = Product.objects.prefetch_related('images').in_bulk([int(pk) for pk in items])
+        return [
+            CartItem(product=products[int(product_id)], quantity=quantity, price=Decimal(price))
+            for product_id, (quantity, price) in items.items()
+            if int(product_id) in products
+        ]
+
+    def quantities(self):
+        return {int(product_id): quantity for product_id, (quantity, _) in self._load().items()}
+
+    def summary(self):
+        items = self._load()
+        return {
+            'items_count': len(items),
+            'total_quantity': sum(quantity for quantity, _ in items.values()),
+            'total_price': sum((quantity * Decimal(price) for quantity, price in items.values()),
+                               Decimal(0)),
+        }
+
+    def badge_count(self):
+        return len(self._load())
@@ -0,0 +1,187 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, F, Max, OuterRef, Q
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from apps.catalog import reservations
+from apps.catalog.models import Product
+from apps.wishlist.models import Wishlist
+from .cache import CART_COUNT_KEY, CART_COUNT_TIMEOUT
+from .models import Cart, CartItem, MAX_ITEM_QUANTITY
+
+
+# Анонимная корзина или избранное без активности дольше этого срока удаляются
+BASKET_TTL = timedelta(days=30)
+PURGE_BATCH_SIZE = 1000
+
+# Групповые действия админки над большим числом записей выполняются фоновой задачей
+ADMIN_ASYNC_THRESHOLD = 1000
+# Сколько id передается в один запрос групповой операции
+BULK_BATCH_SIZE = 1000
+
+# Установка актуальной цены товара позициям корзин одним запросом
+REPRICE_ITEMS_SQL = f"""
+    UPDATE {CartItem._meta.db_table} AS item
+    SET price = product.price
+    FROM {Product._meta.db_table} AS product
+    WHERE product.id = item.product_id
+        AND item.price <> product.price
+        AND item.{{column}} IN ({{placeholders}})
+"""
+# Поля, по которым отбираются позиции для переоценки
+REPRICE_COLUMNS = ('id', 'cart_id', 'product_id')
+
+
+# Движки сессий, хранящие сессии в таблице django_session
+DB_SESSION_ENGINES = ('django.contrib.sessions.backends.db',
+                      'django.contrib.sessions.backends.cached_db')
+
+
+def _stale_anonymous(queryset, last_activity, ttl):
+    """Анонимные записи, чья сессия истекла или удалена, либо без активности дольше ttl.
+
+    Наличие сессии проверяется запросом, только если сессии хранятся в БД;
+    сессии в кэше (SESSION_ENGINE по умолчанию) истекают раньше ttl
+    """
+    now = timezone.now()
+    queryset = queryset.filter(user__isnull=True).alias(last_activity=last_activity)
+    if settings.SESSION_ENGINE not in DB_SESSION_ENGINES:
+        return queryset.filter(last_activity__lt=now - ttl)
+
+    live_session = Session.objects.filter(session_key=OuterRef('session_key'), expire_date__gt=now)
+    return queryset.alias(
+        has_session=Exists(live_session),
+    ).filter(Q(has_session=False) | Q(last_activity__lt=now - ttl))
+
+
+def _average_row_size(tables):
+    """Средний размер строки таблиц (байт) по статистике PostgreSQL"""
+    if connection.vendor != 'postgresql':
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, pg_total_relation_size(oid) / GREATEST(reltuples, 1) "
+            "FROM pg_class WHERE relname = ANY(%s)",
+            [list(tables)]
+        )
+        return {table: float(size) for table, size in cursor.fetchall()}
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Удаляет записи пакетами, каждый в своей короткой транзакции.
+
+    Возвращает количество удаленных строк по таблицам
+    """
+    deleted = {}
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            _, per_model = queryset.model.objects.filter(pk__in=ids).delete()
+        for label, count in per_model.items():
+            deleted[label] = deleted.get(label, 0) + count
+
+
+def purge_stale_baskets(ttl_days=BASKET_TTL.days, batch_size=PURGE_BATCH_SIZE):
+    """Фоновая задача: удаляет брошенные анонимные корзины и избранное.
+
+    Возвращает словарь {таблица: (удалено строк, освобождено байт)}; байты
+    оцениваются по среднему размеру строки и освобождаются после VACUUM
+    """
+    ttl = timedelta(days=ttl_days)
+    carts = _stale_anonymous(
+        Cart.objects.all(),
+        # Время корзины не обновляется при изменении позиций, берем последнее из них
+        Greatest('updated_at', Coalesce(Max('items__updated_at'), 'updated_at')),
+        ttl
+    )
+    # updated_at избранного обновляется при изменении его товаров (см. apps.wishlist.signals)
+    wishlists = _stale_anonymous(Wishlist.objects.all(), F('updated_at'), ttl)
+
+    deleted = _delete_in_batches(carts, batch_size)
+    deleted.update(_delete_in_batches(wishlists, batch_size))
+
+    tables = {
+        model._meta.label: model._meta.db_table
+        for model in (Cart, CartItem, Wishlist, Wishlist.products.through)
+    }
+    row_sizes = _average_row_size(tables[label] for label in deleted)
+    return {
+        tables[label]: (count, int(count * row_sizes.get(tables[label], 0)))
+        for label, count in deleted.items()
+    }
+
+
+def _batches(ids, batch_size=BULK_BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+def _cart_holders(cart_ids):
+    """Владельцы резервов корзин (см. apps.catalog.reservations)"""
+    User = get_user_model()
+    return [
+        reservations.user_holder(User(pk=user_id)) if user_id is not None
+        else reservations.session_holder(session_key)
+        for user_id, session_key in Cart.objects.filter(pk__in=cart_ids).values_list(
+            'user_id', 'session_key'
+        )
+    ]
+
+
+def clear_carts(cart_ids):
+    """Удаляет позиции корзин пакетами вместе с резервами товара под них.
+
+    Возвращает число удаленных позиций
+    """
+    deleted = 0
+    for batch in _batches(cart_ids):
+        with transaction.atomic():
+            count, _ = CartItem.objects.filter(cart_id__in=batch).delete()
+            reservations.release_holders(_cart_holders(batch))
+        deleted += count
+        # Удаление мимо CartManager - счетчики позиций в шапке обнуляем сами
+        cache.set_many({CART_COUNT_KEY.format(cart_id): 0 for cart_id in batch}, CART_COUNT_TIMEOUT)
+    return deleted
+
+
+def reprice_cart_items(column, ids):
+    """Устанавливает актуальные цены позициям корзин, отобранным по column IN ids.
+
+    column - 'id' (позиции), 'cart_id' (корзины) или 'product_id' (товары).
+    Возвращает число позиций с измененной ценой
+    """
+    if column not in REPRICE_COLUMNS:
+        raise ValueError(f'Недопустимое поле для переоценки: {column}')
+
+    updated = 0
+    for batch in _batches(ids):
+        sql = REPRICE_ITEMS_SQL.format(column=column, placeholders=', '.join(['%s'] * len(batch)))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, batch)
+            updated += cursor.rowcount
+    return updated
+
+
+def duplicate_cart_items(item_ids):
+    """Увеличивает количество в позициях на одну штуку одним UPDATE на пакет.
+
+    Товар может быть в корзине только один раз, поэтому "дубликат" позиции -
+    еще одна штука того же товара. Позиции с MAX_ITEM_QUANTITY штук не меняются.
+    Резерв под новую штуку не берется: недостающее количество резервируется
+    при изменении корзины или при оформлении заказа. Возвращает число измененных позиций
+    """
+    updated = 0
+    for batch in _batches(item_ids):
+        updated += CartItem.objects.filter(
+            pk__in=batch, quantity__lt=MAX_ITEM_QUANTITY
+        ).update(quantity=F('quantity') + 1, updated_at=timezone.now())
+    return updated
@@ -1,3 +1,248 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.catalog import reservations
+from apps.catalog.models import Product, StockReservation
+from apps.catalog.testing import create_subcategory, create_product, create_products
+from .models import Cart, CartItem, MAX_ITEM_QUANTITY
+from .storage import DatabaseCartStorage
+from .tasks import duplicate_cart_items
+
+
+class MergeCartOnLoginTests(TestCase):
+    """Объединение сессионной корзины с корзиной пользователя при входе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_products(create_subcategory(), 20, stock_quantity=10)
+        cls.password = 'Pa55-word!'
+
+    def login_with_session_cart(self, products):
+        """Добавляет товары в корзину анонимно, входит и возвращает число запросов входа"""
+        user = get_user_model().objects.create_user(
+            username=f'user{len(products)}', email=f'user{len(products)}@example.com',
+            password=self.password
+        )
+        # У пользователя уже есть корзина с первым товаром
+        user_cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=user_cart, product=products[0], quantity=MAX_ITEM_QUANTITY - 1)
+
+        for product in products:
+            self.client.post(reverse('cart:add', args=[product.pk]), {'quantity': 2})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('users:login'),
+                             {'username': user.username, 'password': self.password})
+        self.client.logout()
+        return user_cart, len(queries)
+
+    def test_merge_moves_items_and_caps_quantity(self):
+        user_cart, _ = self.login_with_session_cart(self.products[:3])
+
+        quantities = dict(user_cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {
+            self.products[0].pk: MAX_ITEM_QUANTITY,
+            self.products[1].pk: 2,
+            self.products[2].pk: 2,
+        })
+        self.assertFalse(Cart.objects.filter(user__isnull=True).exists())
+
+    def test_query_count_does_not_depend_on_items_count(self):
+        _, few = self.login_with_session_cart(self.products[:2])
+        _, many = self.login_with_session_cart(self.products)
+        self.assertEqual(few, many)
+
+
+class StockReservationTests(TestCase):
+    """Резервирование товара под корзину"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_subcategory(), stock_quantity=5)
+        cls.password = 'Pa55-word!'
+
+    def add(self, quantity):
+        return self.client.post(reverse('cart:add', args=[self.product.pk]),
+                                {'quantity': quantity},
+                                headers={'x-requested-with': 'XMLHttpRequest'})
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock_quantity
+
+    def held(self):
+        return sum(StockReservation.objects.values_list('quantity', flat=True))
+
+    def test_add_reserves_stock(self):
+        self.add(3)
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(self.held(), 3)
+
+    def test_add_rejects_out_of_stock(self):
+        self.add(3)
+        response = self.add(3)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+        # Корзина осталась с зарезервированным количеством
+        self.assertEqual(self.client.session['cart_items'][str(self.product.pk)][0], 3)
+        self.assertEqual(self.stock(), 2)
+
+    def test_remove_and_clear_release_stock(self):
+        self.add(3)
+        self.client.post(reverse('cart:remove', args=[self.product.pk]))
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(self.held(), 2)
+
+        self.client.post(reverse('cart:clear'))
+        self.assertEqual(self.stock(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_login_transfers_reservations(self):
+        user = get_user_model().objects.create_user(username='user', email='user@example.com',
+                                                    password=self.password)
+        self.add(2)
+        self.client.post(reverse('users:login'),
+                         {'username': user.username, 'password': self.password})
+
+        self.assertEqual(list(StockReservation.objects.values_list('holder', 'quantity')),
+                         [(reservations.user_holder(user), 2)])
+        self.assertEqual(self.stock(), 3)
+
+    def test_transfer_caps_quantity(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=2 * MAX_ITEM_QUANTITY)
+        reservations.reserve('session:old', self.product, MAX_ITEM_QUANTITY - 1)
+        reservations.reserve('user:1', self.product, 5)
+
+        reservations.transfer('session:old', 'user:1')
+
+        self.assertEqual(self.held(), MAX_ITEM_QUANTITY)
+        self.assertEqual(self.stock(), MAX_ITEM_QUANTITY)
+
+    def test_release_expired(self):
+        self.add(3)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(reservations.release_expired(), 1)
+        self.assertEqual(self.stock(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_cart_view_does_not_touch_reservations(self):
+        self.add(3)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('cart:detail'))
+
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))])
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+        self.assertEqual(self.stock(), 2)
+
+    def test_add_renews_expired_reservations(self):
+        self.add(3)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        reservations.release_expired()
+        # Пока резерв был снят, часть товара купили
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=1)
+
+        self.add(1)
+
+        self.assertEqual(self.client.session['cart_items'][str(self.product.pk)][0], 1)
+        self.assertEqual(self.held(), 1)
+        self.assertEqual(self.stock(), 0)
+        self.assertGreater(StockReservation.objects.get().expires_at, timezone.now())
+        response = self.client.get(reverse('cart:detail'))
+        self.assertIn('уменьшено на 3 шт.',
+                      ' '.join(str(message) for message in response.context['messages']))
+
+
+class CartBadgeTests(TestCase):
+    """Счетчик позиций корзины в шапке"""
+
+    def test_anonymous_page_does_not_vary_on_cookie(self):
+        response = self.client.get(reverse('home'))
+
+        self.assertEqual(response.context['cart_len'], 0)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+    def test_user_without_cart_id_in_session(self):
+        product = create_product(create_subcategory())
+        user = get_user_model().objects.create_user(username='user', email='user@example.com',
+                                                    password='Pa55-word!')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=product, quantity=2, price=product.price)
+        # Сессия создана до того, как id корзины стали запоминать при входе
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('home'))
+
+        self.assertEqual(response.context['cart_len'], 1)
+        self.assertEqual(self.client.session['cart_id'], cart.pk)
+
+
+class CartAdminTasksTests(TestCase):
+    """Пакетные действия с позициями корзин из админки"""
+
+    def test_duplicate_adds_one_more_unit(self):
+        product, full_product = create_products(create_subcategory(), 2)
+        cart = Cart.objects.create(session_key='admin-duplicate')
+        item = CartItem.objects.create(cart=cart, product=product, quantity=2, price=product.price)
+        full = CartItem.objects.create(cart=cart, product=full_product, quantity=MAX_ITEM_QUANTITY,
+                                       price=full_product.price)
+
+        self.assertEqual(duplicate_cart_items([item.pk, full.pk]), 1)
+
+        self.assertEqual(dict(cart.items.values_list('pk', 'quantity')),
+                         {item.pk: 3, full.pk: MAX_ITEM_QUANTITY})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite не допускает параллельной записи из потоков')
+class ConcurrentAddTests(TransactionTestCase):
+    """Параллельные добавления товара в одну корзину не теряют изменений.
+
+    TransactionTestCase: потоки работают в своих соединениях и должны видеть
+    зафиксированные данные
+    """
+
+    def setUp(self):
+        self.product = create_product(create_subcategory())
+        self.cart = Cart.objects.create(session_key='concurrent-adds')
+
+    def add_concurrently(self, threads_count, adds):
+        errors = []
+        barrier = threading.Barrier(threads_count)
+
+        def worker():
+            try:
+                # Все потоки стартуют одновременно, чтобы запросы пересекались
+                barrier.wait()
+                for _ in range(adds):
+                    DatabaseCartStorage._add_item(self.cart, self.product, 1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        return CartItem.objects.get(cart=self.cart, product=self.product).quantity
+
+    def test_concurrent_adds_keep_all_increments(self):
+        self.assertEqual(self.add_concurrently(threads_count=4, adds=5), 20)
+
+    def test_concurrent_adds_respect_max_quantity(self):
+        self.assertEqual(self.add_concurrently(threads_count=8, adds=20), MAX_ITEM_QUANTITY)
@@ -1,3 +1,5 @@
+import uuid
+
 from django.contrib import messages
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
@@ -7,8 +9,26 @@ from apps.cart.cart_manager import CartManager
 from ..catalog.models import Product
 
 
+def cart_summary(cart_manager):
+    """Итоги корзины для JSON-ответа"""
+    summary = cart_manager.summary()
+    return {
+        'total_price': str(summary['total_price']),
+        'total_quantity': summary['total_quantity'],
+        'items_count': summary['items_count']
+    }
+
+
+def renew_reservations(request, cart_manager):
+    """Продлевает резервы под корзину и сообщает о товарах, которых уже не хватает"""
+    for product, missing in cart_manager.renew_reservations():
+        messages.warning(request, f'Товара "{product.name}" не хватает на складе: '
+                                  f'количество в корзине уменьшено на {missing} шт.')
+
+
 def cart_detail(request):
     """Страница корзины"""
+    # Просмотр корзины ничего не пишет: резервы продлеваются при ее изменении и при оформлении заказа
     cart_manager = CartManager(request)
 
     # # Для AJAX-запросов
@@ -17,7 +37,9 @@ def cart_detail(request):
 
     return render(request, 'cart/cart_detail.html',
                   context={
-                      'cart_manager': cart_manager
+                      'cart_manager': cart_manager,
+                      # Ключ идемпотентности формы оформления заказа
+                      'idempotency_key': uuid.uuid4().hex
                   })
 
 
@@ -31,17 +53,14 @@ def cart_add(request, product_id):
 
     try:
         cart_manager.add(product, quantity)
+        renew_reservations(request, cart_manager)
         message = f'Товар "{product.name}" добавлен в корзину'
 
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({
                 'success': True,
                 'message': message,
-                'cart':{
-                    'total_price': str(cart_manager.get_total_price()),
-                    'total_quantity': cart_manager.get_total_quantity(),
-                    'items_count': cart_manager.count_items()
-                }
+                'cart': cart_summary(cart_manager)
             })
 
         messages.success(request, message)
@@ -70,11 +89,7 @@ def cart_remove(request, product_id):
         return JsonResponse({
             'success': True,
             'message': message,
-            'cart': {
-                'total_price': str(cart_manager.get_total_price()),
-                'total_quantity': cart_manager.get_total_quantity(),
-                'items_count': cart_manager.count_items()
-            }
+            'cart': cart_summary(cart_manager)
         })
 
     messages.success(request, message)
@@ -1,7 +1,17 @@
-from django.contrib import admin
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Prefetch
 from django.utils.html import format_html
 
+from apps.cart.models import CartItem
+from apps.cart.tasks import ADMIN_ASYNC_THRESHOLD, reprice_cart_items
+from apps.tasks.queue import run_or_enqueue
 from .models import Category, SubCategory, Product, ProductImage
+from .thumbnails import thumbnail_url
 
 
 class ProductImageInline(admin.TabularInline):
@@ -13,7 +23,7 @@ class ProductImageInline(admin.TabularInline):
 
     def image_preview(self, obj):
         if obj.image:
-            return format_html(f'<img src="{obj.image.url}" width="50" height="50" />')
+            return format_html('<img src="{}" width="50" height="50" />', thumbnail_url(obj.image, 64))
         return "нет фото"
     image_preview.short_description = 'Превью'
 
@@ -46,24 +56,75 @@ class SubCategoryAdmin(admin.ModelAdmin):
     picture_preview.short_description = 'Изображение'
 
 
+class ProductActionForm(ActionForm):
+    """Форма действий над товарами с полем процента изменения цены"""
+    percent = forms.DecimalField(label='Изменить цену на, %', required=False,
+                                 max_digits=5, decimal_places=2, min_value=-99)
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    fields = ('name', 'slug', 'subcat', 'price', 'description', 'stock_quantity', 'sku')
+    fields = ('name', 'slug', 'subcat', 'brand', 'price', 'description', 'stock_quantity', 'sku')
     readonly_fields = ('slug',)
     list_display = ('name', 'slug', 'price', 'description', 'stock_quantity',
-                    'subcat', 'sku', 'main_image_preview')
-    list_filter = ('subcat__cat', 'subcat')
+                    'subcat', 'sku', 'images_count', 'main_image_preview')
+    list_filter = ('subcat__cat', 'subcat', 'brand')
+    list_select_related = ('subcat', )
     search_fields = ('name', 'description')
     inlines = (ProductImageInline, )
+    actions = ('reprice_selected', 'reprice_carts')
+    action_form = ProductActionForm
+
+    def get_queryset(self, request):
+        """Число фото и главное фото подгружаются для всей страницы списка сразу"""
+        return super().get_queryset(request).annotate(
+            images_count=Count('images')
+        ).prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.filter(is_main=True),
+                     to_attr='main_images')
+        )
 
     def main_image_preview(self, obj):
-        main_img = obj.main_image
-        if main_img:
-            return format_html(f'<img src="{main_img.url}" width="50" height="50" />')
+        if obj.main_images:
+            return format_html('<img src="{}" width="50" height="50" />',
+                               thumbnail_url(obj.main_images[0].image, 64))
+        if obj.images_count:
+            return "Нет главного фото"
         return "Нет фото"
     main_image_preview.short_description = 'Главное фото'
 
     def images_count(self, obj):
         """Метод для отображения количества фото"""
-        return obj.images.count()
-    images_count.short_description = 'Кол-во фото'
\ No newline at end of file
+        return obj.images_count
+    images_count.short_description = 'Кол-во фото'
+    images_count.admin_order_field = 'images_count'
+
+    def reprice_selected(self, request, queryset):
+        """Изменить цены выбранных товаров на заданный процент"""
+        try:
+            percent = ProductActionForm.base_fields['percent'].clean(request.POST.get('percent'))
+        except ValidationError:
+            percent = None
+        if not percent:
+            self.message_user(request, 'Укажите процент изменения цены', messages.ERROR)
+            return
+        factor = 1 + percent / Decimal(100)
+        # Выборка списка содержит аннотации и prefetch - для обновления берем только id
+        changed = Product.objects.filter(pk__in=queryset.values('pk')).bulk_reprice(
+            F('price') * factor
+        )
+        self.message_user(request, f'Изменено цен: {len(changed)}')
+    reprice_selected.short_description = 'Изменить цены выбранных товаров на процент'
+
+    def reprice_carts(self, request, queryset):
+        """Обновить цены выбранных товаров во всех корзинах"""
+        product_ids = list(queryset.values_list('pk', flat=True))
+        # Объем работы определяется числом позиций в корзинах, а не числом товаров
+        items_count = CartItem.objects.filter(product_id__in=product_ids).count()
+        updated = run_or_enqueue(reprice_cart_items, 'product_id', product_ids,
+                                 size=items_count, threshold=ADMIN_ASYNC_THRESHOLD)
+        if updated is None:
+            self.message_user(request, 'Обновление цен в корзинах поставлено в очередь')
+        else:
+            self.message_user(request, f'Обновлено цен в корзинах: {updated}')
+    reprice_carts.short_description = 'Обновить цены в корзинах с выбранными товарами'
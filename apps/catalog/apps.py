@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.catalog'
+
+    def ready(self):
+        import apps.catalog.checks
+        import apps.catalog.signals
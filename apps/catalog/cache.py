@@ -0,0 +1,153 @@
+import time
+
+from django.core.cache import cache, caches, InvalidCacheBackendError
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Prefetch, prefetch_related_objects
+
+from django.urls import reverse
+
+from .models import Category, SubCategory, ProductImage
+
+
+PRODUCT_VERSION_KEY = 'catalog:product_version:{}'
+CATEGORY_TREE_VERSION_KEY = 'catalog:category_tree_version'
+CATEGORY_TREE_KEY = 'catalog:category_tree:{}'
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+# Время жизни закэшированных фрагментов карточек товаров (сек)
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_fragment_cache():
+    """Возвращает кэш, который использует тег {% cache %}"""
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def new_version():
+    """Новая версия - текущее время, поэтому она не повторяется даже после вытеснения из кэша"""
+    return time.time_ns()
+
+
+def bump_product_version(product_id):
+    """Инвалидирует закэшированные фрагменты карточки товара"""
+    cache.set(PRODUCT_VERSION_KEY.format(product_id), new_version(), None)
+
+
+def bump_product_versions(product_ids):
+    """Инвалидирует карточки нескольких товаров одним обращением к кэшу"""
+    version = new_version()
+    cache.set_many({PRODUCT_VERSION_KEY.format(pk): version for pk in product_ids}, None)
+
+
+def get_product_versions(product_ids):
+    """Возвращает версии карточек товаров одним обращением к кэшу"""
+    keys = {PRODUCT_VERSION_KEY.format(pk): pk for pk in product_ids}
+    cached = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in cached.items()}
+
+    missing = {key: new_version() for key, pk in keys.items() if pk not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update({keys[key]: version for key, version in missing.items()})
+    return versions
+
+
+def prepare_product_cards(products):
+    """Проставляет товарам версии карточек и подгружает фото только для тех,
+    чьи фрагменты не найдены в кэше"""
+    products = list(products)
+    versions = get_product_versions([product.pk for product in products])
+
+    image_keys = {}
+    for product in products:
+        product.card_version = versions[product.pk]
+        key = make_template_fragment_key('product_card_image', [product.pk, product.card_version])
+        image_keys[key] = product
+
+    cached = get_fragment_cache().get_many(image_keys)
+    missing = [product for key, product in image_keys.items() if key not in cached]
+    if missing:
+        prefetch_related_objects(
+            missing, Prefetch('images', queryset=ProductImage.objects.all())
+        )
+    return products
+
+
+# Копия дерева категорий в памяти процесса: {'version': ..., 'tree': ...}
+_local_category_tree = {'version': None, 'tree': None}
+
+
+def bump_category_tree_version():
+    """Инвалидирует дерево категорий во всех процессах"""
+    cache.set(CATEGORY_TREE_VERSION_KEY, new_version(), None)
+
+
+def get_category_tree_version():
+    """Возвращает текущую версию дерева категорий"""
+    version = cache.get(CATEGORY_TREE_VERSION_KEY)
+    if version is None:
+        cache.add(CATEGORY_TREE_VERSION_KEY, new_version(), None)
+        version = cache.get(CATEGORY_TREE_VERSION_KEY)
+    return version
+
+
+def build_category_tree():
+    """Строит дерево категорий и подкатегорий из БД (два запроса)"""
+    categories = []
+    by_cat_slug = {}
+    for category in Category.objects.order_by('pk'):
+        item = {
+            'id': category.pk,
+            'name': category.name,
+            'slug': category.slug,
+            'url': category.get_absolute_url(),
+            'picture_url': category.picture.url if category.picture else None,
+            'subcategories': [],
+        }
+        categories.append(item)
+        by_cat_slug[category.slug] = item
+
+    by_subcat_slug = {}
+    by_subcat_id = {}
+    for subcat in SubCategory.objects.select_related('cat').order_by('pk'):
+        item = {
+            'id': subcat.pk,
+            'name': subcat.name,
+            'slug': subcat.slug,
+            'url': subcat.get_absolute_url(),
+            'picture_url': subcat.picture.url if subcat.picture else None,
+            'cat_slug': subcat.cat.slug,
+        }
+        by_cat_slug[subcat.cat.slug]['subcategories'].append(item)
+        by_subcat_slug[subcat.slug] = item
+        by_subcat_id[subcat.pk] = item
+
+    return {
+        'categories': categories,
+        'by_cat_slug': by_cat_slug,
+        'by_subcat_slug': by_subcat_slug,
+        'by_subcat_id': by_subcat_id,
+        # Первые крошки одинаковы для всех страниц каталога
+        'base_breadcrumbs': [
+            {'name': 'Главная', 'url': reverse('home')},
+            {'name': 'Каталог', 'url': reverse('catalog:categories')},
+        ],
+    }
+
+
+def get_category_tree():
+    """Возвращает дерево категорий из памяти процесса, общего кэша или БД"""
+    version = get_category_tree_version()
+    if _local_category_tree['version'] == version:
+        return _local_category_tree['tree']
+
+    key = CATEGORY_TREE_KEY.format(version)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(key, tree, CATEGORY_TREE_TIMEOUT)
+
+    _local_category_tree.update(version=version, tree=tree)
+    return tree
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+# Кэши, которые видит только один процесс
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Проверяет, что кэш по умолчанию общий для процессов.
+
+    Версии карточек и дерева категорий меняют команды и обработчик очереди
+    в отдельных процессах
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кэш по умолчанию ({backend}) не общий для процессов',
+        hint='Сброс карточек товаров и дерева категорий из import_catalog, backfill_discounts '
+             'и run_workers не дойдет до веб-процесса. Используйте FileBasedCache, '
+             'DatabaseCache или RedisCache',
+        id='catalog.W001',
+    )]
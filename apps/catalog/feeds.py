@@ -0,0 +1,295 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from pytils.translit import slugify
+
+from .cache import bump_category_tree_version, bump_product_versions
+from .models import Category, SubCategory, Product, PriceHistory, StockReservation
+from .utils import extract_brand
+
+
+# Колонки файла выгрузки (и загрузки) каталога
+FEED_FIELDS = ('category', 'subcategory', 'name', 'slug', 'sku', 'brand',
+               'description', 'price', 'stock_quantity')
+FEED_FORMATS = ('csv', 'jsonl')
+FEED_BATCH_SIZE = 1000
+
+# Поля товара, которые перезаписывает загрузка; created_at сохраняется
+PRODUCT_UPDATE_FIELDS = ('name', 'description', 'price', 'stock_quantity', 'sku', 'brand',
+                         'subcat', 'old_price', 'discount_percent', 'updated_at')
+
+
+def max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+def integer_range(model, field):
+    """Допустимый диапазон значений целочисленного поля в БД"""
+    return connection.ops.integer_field_range(model._meta.get_field(field).get_internal_type())
+
+
+_slug_length = {model: max_length(model, 'slug') for model in (Category, SubCategory, Product)}
+
+
+class FeedError(ValueError):
+    """Строка файла каталога с ошибкой"""
+    def __init__(self, line, message):
+        super().__init__(f'Строка {line}: {message}')
+        self.line = line
+
+
+def make_slug(model, text):
+    return slugify(text)[:_slug_length[model]]
+
+
+def read_feed(file, feed_format):
+    """Генератор строк файла каталога: (номер строки, словарь полей)"""
+    if feed_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(file, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as e:
+                    yield line, FeedError(line, f'некорректный JSON ({e.msg})')
+
+
+def write_feed(file, rows, feed_format):
+    """Записывает строки каталога по одной. Возвращает их количество"""
+    count = 0
+    if feed_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=FEED_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            count += 1
+    return count
+
+
+def export_rows(batch_size=FEED_BATCH_SIZE):
+    """Генератор строк выгрузки каталога; товары читаются из БД порциями"""
+    products = Product.objects.order_by('pk').values_list(
+        'subcat__cat__name', 'subcat__name', 'name', 'slug', 'sku', 'brand',
+        'description', 'price', 'stock_quantity'
+    )
+    for values in products.iterator(chunk_size=batch_size):
+        yield dict(zip(FEED_FIELDS, values))
+
+
+def parse_row(line, row):
+    """Проверяет строку файла и приводит значения к типам полей товара"""
+    if isinstance(row, FeedError):
+        raise row
+    if not isinstance(row, dict):
+        raise FeedError(line, 'ожидается объект')
+
+    # None - пустое значение, а 0 из JSON - число
+    values = {field: '' if row.get(field) is None else str(row.get(field)).strip()
+              for field in FEED_FIELDS}
+    for field in ('category', 'subcategory', 'name', 'price'):
+        if not values[field]:
+            raise FeedError(line, f'не заполнено поле {field}')
+    if len(values['name']) > max_length(Product, 'name'):
+        raise FeedError(line, 'слишком длинное название')
+
+    try:
+        values['price'] = Decimal(values['price']).quantize(Decimal('0.01'))
+        if not values['price'].is_finite():
+            raise InvalidOperation
+        values['stock_quantity'] = int(values['stock_quantity'] or 0)
+        values['sku'] = int(values['sku']) if values['sku'] else None
+    except (InvalidOperation, ValueError):
+        raise FeedError(line, 'некорректное число')
+    if values['price'] < 0 or values['stock_quantity'] < 0 or (values['sku'] or 0) < 0:
+        raise FeedError(line, 'отрицательное число')
+    # Значения, которые не поместятся в столбцы, прервали бы загрузку всего пакета
+    price_field = Product._meta.get_field('price')
+    if values['price'] >= 10 ** (price_field.max_digits - price_field.decimal_places):
+        raise FeedError(line, 'слишком большая цена')
+    for field in ('stock_quantity', 'sku'):
+        if values[field] is not None and values[field] > integer_range(Product, field)[1]:
+            raise FeedError(line, f'слишком большое значение поля {field}')
+
+    values['slug'] = values['slug'] or make_slug(Product, values['name'])
+    if not values['slug']:
+        raise FeedError(line, 'не удалось построить slug')
+    if len(values['slug']) > _slug_length[Product]:
+        raise FeedError(line, 'слишком длинный slug')
+    return values
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class CatalogImporter:
+    """Загрузка каталога пакетами.
+
+    Категории, подкатегории и товары создаются или обновляются через
+    bulk_create(update_conflicts=True) по slug, изменения цен записываются
+    в историю одним INSERT на пакет. В памяти хранятся только текущий пакет
+    и соответствие категорий их id, поэтому потребление памяти не зависит
+    от размера файла. Ошибки строк не накапливаются, а передаются в on_error
+    по мере чтения.
+
+    Подкатегории с одинаковым названием в разных категориях - разные
+    подкатегории: они ищутся по (категория, название), а slug новых
+    подкатегорий начинается со slug категории
+    """
+    def __init__(self, batch_size=FEED_BATCH_SIZE, on_error=None):
+        self.batch_size = batch_size
+        self.on_error = on_error
+        # slug -> id уже известных категорий, (id категории, название) -> id подкатегорий
+        self.category_ids = {}
+        self.subcategory_ids = {}
+        self.stats = {'created': 0, 'updated': 0, 'repriced': 0, 'skipped': 0}
+
+    def run(self, rows):
+        """Загружает строки (номер строки, словарь полей). Возвращает статистику"""
+        tree_changed = False
+        for batch in batched(rows, self.batch_size):
+            products = {}
+            for line, row in batch:
+                try:
+                    values = parse_row(line, row)
+                except FeedError as e:
+                    self.stats['skipped'] += 1
+                    if self.on_error is not None:
+                        self.on_error(str(e))
+                    continue
+                # Повтор slug в пакете: действует последняя строка
+                products[values['slug']] = values
+            if products:
+                with transaction.atomic():
+                    tree_changed |= self.import_batch(list(products.values()))
+
+        if tree_changed:
+            bump_category_tree_version()
+        return self.stats
+
+    def import_batch(self, rows):
+        """Загружает пакет строк. Возвращает True, если появились новые категории"""
+        tree_changed = self.upsert_categories(rows)
+
+        # Строки товаров блокируются до конца пакета: резерв, взятый параллельно,
+        # ждет загрузки, и вычтенный ниже размер резервов не устаревает
+        locked = Product.objects.select_for_update().filter(slug__in=[row['slug'] for row in rows])
+        existing = {
+            slug: (pk, price, old_price, discount_percent)
+            for slug, pk, price, old_price, discount_percent in locked.values_list(
+                'slug', 'pk', 'price', 'old_price', 'discount_percent'
+            )
+        }
+        # В файле - физический остаток, а stock_quantity - доступный: единицы
+        # в резервах уже вычтены и вернутся при отмене резерва
+        reserved = dict(StockReservation.objects.filter(
+            product_id__in=[pk for pk, *_ in existing.values()]
+        ).values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+
+        products, history = [], []
+        for row in rows:
+            product = Product(
+                name=row['name'],
+                slug=row['slug'],
+                description=row['description'],
+                price=row['price'],
+                stock_quantity=row['stock_quantity'],
+                sku=row['sku'],
+                brand=row['brand'][:max_length(Product, 'brand')] or extract_brand(row['name']),
+                subcat_id=self.subcategory_ids[self.subcategory_key(row)],
+            )
+            if row['slug'] in existing:
+                pk, price, product.old_price, product.discount_percent = existing[row['slug']]
+                product.stock_quantity = max(0, product.stock_quantity - reserved.get(pk, 0))
+                # Как и в Product.save(): в историю пишется прежняя цена
+                if price != product.price:
+                    history.append(PriceHistory(product_id=pk, price=price))
+                    product.set_old_price(price)
+            products.append(product)
+
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['slug'],
+            update_fields=PRODUCT_UPDATE_FIELDS
+        )
+        PriceHistory.objects.bulk_create(history)
+
+        # bulk_create не вызывает сигналы - сбрасываем кэш карточек сами
+        bump_product_versions(pk for pk, *_ in existing.values())
+
+        self.stats['created'] += len(products) - len(existing)
+        self.stats['updated'] += len(existing)
+        self.stats['repriced'] += len(history)
+        return tree_changed
+
+    def subcategory_key(self, row):
+        """Ключ подкатегории строки: (id категории, название)"""
+        return (self.category_ids[make_slug(Category, row['category'])],
+                row['subcategory'][:max_length(SubCategory, 'name')])
+
+    def upsert_categories(self, rows):
+        """Создает недостающие категории и подкатегории пакета.
+
+        Существующие подкатегории не переносятся в другую категорию
+        """
+        categories = {}
+        for row in rows:
+            cat_slug = make_slug(Category, row['category'])
+            if cat_slug not in self.category_ids:
+                categories[cat_slug] = row['category']
+
+        if categories:
+            Category.objects.bulk_create(
+                [Category(name=name[:max_length(Category, 'name')], slug=slug)
+                 for slug, name in categories.items()],
+                update_conflicts=True, unique_fields=['slug'], update_fields=['name']
+            )
+            self.category_ids.update(
+                Category.objects.filter(slug__in=categories).values_list('slug', 'pk')
+            )
+
+        subcategories = {}
+        for row in rows:
+            key = self.subcategory_key(row)
+            if key not in self.subcategory_ids:
+                subcategories[key] = make_slug(
+                    SubCategory, f"{make_slug(Category, row['category'])} {key[1]}"
+                )
+        if not subcategories:
+            return bool(categories)
+
+        # Подкатегории, созданные раньше (в том числе в админке), ищутся по названию
+        for cat_id, name, pk in SubCategory.objects.filter(
+            cat_id__in={cat_id for cat_id, _ in subcategories},
+            name__in={name for _, name in subcategories}
+        ).order_by('-pk').values_list('cat_id', 'name', 'pk'):
+            if (cat_id, name) in subcategories:
+                self.subcategory_ids[(cat_id, name)] = pk
+        missing = {key: slug for key, slug in subcategories.items()
+                   if key not in self.subcategory_ids}
+        if missing:
+            SubCategory.objects.bulk_create(
+                [SubCategory(name=name, slug=slug, cat_id=cat_id)
+                 for (cat_id, name), slug in missing.items()],
+                ignore_conflicts=True
+            )
+            created = dict(SubCategory.objects.filter(
+                slug__in=missing.values()
+            ).values_list('slug', 'pk'))
+            for key, slug in missing.items():
+                self.subcategory_ids[key] = created[slug]
+        return bool(categories or missing)
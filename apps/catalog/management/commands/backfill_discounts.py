@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from apps.catalog.cache import bump_product_versions
+from apps.catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Заполняет поля старой цены и скидки товаров по истории цен'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество товаров, обновляемых за один запрос')
+
+    @staticmethod
+    def update_batch(batch):
+        updated = Product.objects.bulk_update(batch, ['old_price', 'discount_percent'])
+        # bulk_update не вызывает сигналы - сбрасываем кэш карточек сами
+        bump_product_versions(product.pk for product in batch)
+        return updated
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = Product.objects.with_previous_price().only(
+            'id', 'price', 'old_price', 'discount_percent'
+        ).order_by('pk')
+
+        batch = []
+        updated = 0
+        for product in products.iterator(chunk_size=batch_size):
+            old_price, discount_percent = product.old_price, product.discount_percent
+            product.set_old_price(product.previous_price)
+            # Обновляем только товары, у которых значения изменились
+            if (product.old_price, product.discount_percent) != (old_price, discount_percent):
+                batch.append(product)
+
+            if len(batch) >= batch_size:
+                updated += self.update_batch(batch)
+                batch = []
+
+        if batch:
+            updated += self.update_batch(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {updated}'))
@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.catalog.models import Category, SubCategory, Product, StockReservation
+from apps.catalog.reservations import reserve, OutOfStock
+
+
+BENCH_SLUG = 'bench-reservations'
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочная проверка резервов: множество покупателей параллельно '
+            'резервируют один товар; остаток не должен уйти в минус')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=300,
+                            help='Количество покупателей')
+        parser.add_argument('--stock', type=int, default=100,
+                            help='Начальный остаток товара')
+        parser.add_argument('--threads', type=int, default=32,
+                            help='Количество параллельных потоков')
+
+    def handle(self, *args, **options):
+        product = self.create_product(options['stock'])
+        sold, rejected, errors = [], [], []
+        lock = threading.Lock()
+
+        def buy(buyer):
+            try:
+                reserve(f'bench:{buyer}', product, 1)
+                result = sold
+            except OutOfStock:
+                result = rejected
+            except Exception as e:
+                result = errors
+                self.stderr.write(repr(e))
+            finally:
+                connection.close()
+            with lock:
+                result.append(buyer)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(buy, range(options['buyers'])))
+        elapsed = time.perf_counter() - start
+
+        product.refresh_from_db()
+        reserved = StockReservation.objects.filter(product=product).count()
+        self.stdout.write(
+            f'Покупателей: {options["buyers"]}, зарезервировали: {len(sold)}, '
+            f'отказов: {len(rejected)}, ошибок: {len(errors)}, остаток: {product.stock_quantity}, '
+            f'время: {elapsed:.2f} с'
+        )
+
+        expected = min(options['stock'], options['buyers'])
+        product.delete()
+        if errors or len(sold) != expected or reserved != expected or \
+                product.stock_quantity != options['stock'] - expected:
+            raise CommandError('Резервы не сходятся с остатком')
+        self.stdout.write(self.style.SUCCESS('Перепродаж нет'))
+
+    @staticmethod
+    def create_product(stock):
+        category, _ = Category.objects.get_or_create(
+            slug=BENCH_SLUG, defaults={'name': 'Проверка резервов'}
+        )
+        subcategory, _ = SubCategory.objects.get_or_create(
+            slug=BENCH_SLUG, defaults={'name': 'Проверка резервов', 'cat': category}
+        )
+        Product.objects.filter(slug=BENCH_SLUG).delete()
+        return Product.objects.create(
+            name='Популярный товар', slug=BENCH_SLUG, description='Товар для проверки резервов',
+            price=1000, stock_quantity=stock, subcat=subcategory
+        )
@@ -0,0 +1,114 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.catalog.models import Category, SubCategory, Product
+
+
+# Словарь для генерации синтетических названий и описаний
+BRANDS = ('Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Honor', 'Realme', 'Poco', 'Tecno',
+          'Bosch', 'Philips', 'Haier', 'Indesit', 'Redmond', 'Polaris', 'Dexp', 'Lenovo')
+KINDS = ('Смартфон', 'Планшет', 'Ноутбук', 'Телевизор', 'Холодильник', 'Пылесос',
+         'Чайник', 'Микроволновая печь', 'Стиральная машина', 'Наушники', 'Фотоаппарат')
+COLORS = ('черный', 'белый', 'синий', 'серый', 'зеленый', 'красный', 'золотистый')
+WORDS = ('мощный', 'компактный', 'беспроводной', 'экран', 'камера', 'аккумулятор',
+         'память', 'процессор', 'быстрая', 'зарядка', 'корпус', 'металлический', 'тихий',
+         'энергопотребление', 'гарантия', 'режим', 'управление', 'дисплей', 'объем')
+
+QUERIES = ('смартфон samsung', 'холодильник', 'беспроводные наушники', 'ноутбук lenovo',
+           'чайник черный', 'мощный пылесос', 'стиральные машины', 'apple', 'телевизоры')
+
+BENCH_SLUG = 'bench-search'
+
+
+class Command(BaseCommand):
+    help = 'Заполняет каталог синтетическими товарами и замеряет время поиска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=0,
+                            help='Сколько синтетических товаров создать перед замером')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Размер пакета при создании товаров')
+        parser.add_argument('--runs', type=int, default=20,
+                            help='Сколько раз выполнить каждый поисковый запрос')
+        parser.add_argument('--per-page', type=int, default=20,
+                            help='Размер страницы результатов')
+        parser.add_argument('--threshold', type=float, default=50.0,
+                            help='Допустимое время запроса в миллисекундах (p95)')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Удалить синтетические товары после замера')
+
+    def handle(self, *args, **options):
+        if options['products']:
+            self.seed(options['products'], options['batch_size'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE catalog_product')
+
+        timings = []
+        for query in QUERIES:
+            for _ in range(options['runs']):
+                timings.append(self.run_query(query, options['per_page']))
+
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'Товаров: {Product.objects.count()}, запросов: {len(timings)}, '
+            f'p50: {p50:.1f} мс, p95: {p95:.1f} мс, max: {timings[-1]:.1f} мс'
+        )
+
+        if p95 <= options['threshold']:
+            self.stdout.write(self.style.SUCCESS(f'p95 в пределах {options["threshold"]} мс'))
+        else:
+            self.stdout.write(self.style.ERROR(f'p95 превышает {options["threshold"]} мс'))
+
+        if options['cleanup']:
+            deleted, _ = Product.objects.filter(subcat__slug=BENCH_SLUG).delete()
+            SubCategory.objects.filter(slug=BENCH_SLUG).delete()
+            Category.objects.filter(slug=BENCH_SLUG).delete()
+            self.stdout.write(f'Удалено синтетических товаров: {deleted}')
+
+    @staticmethod
+    def run_query(query, per_page):
+        """Выполняет поиск так же, как SearchProducts: COUNT и первая страница"""
+        start = time.perf_counter()
+        queryset = Product.objects.search(query).order_by('-rank', 'pk')
+        queryset.count()
+        list(queryset[:per_page])
+        return (time.perf_counter() - start) * 1000
+
+    def seed(self, total, batch_size):
+        """Создает синтетические товары пакетами через bulk_create"""
+        category, _ = Category.objects.get_or_create(
+            slug=BENCH_SLUG, defaults={'name': 'Синтетические товары'}
+        )
+        subcategory, _ = SubCategory.objects.get_or_create(
+            slug=BENCH_SLUG, defaults={'name': 'Синтетические товары', 'cat': category}
+        )
+        offset = Product.objects.filter(subcat=subcategory).count()
+
+        rnd = random.Random(offset)
+        created = 0
+        while created < total:
+            batch = []
+            for i in range(offset + created, offset + min(created + batch_size, total)):
+                brand = rnd.choice(BRANDS)
+                name = f'{rnd.choice(KINDS)} {brand} {i} {rnd.choice(COLORS)}'
+                batch.append(Product(
+                    name=name,
+                    slug=f'{BENCH_SLUG}-{i}',
+                    description=' '.join(rnd.choices(WORDS, k=20)),
+                    price=Decimal(rnd.randint(500, 300000)),
+                    stock_quantity=rnd.randint(0, 50),
+                    sku=100000000 + i,
+                    brand=brand,
+                    subcat=subcategory,
+                ))
+            Product.objects.bulk_create(batch)
+            created += len(batch)
+            self.stdout.write(f'Создано товаров: {created}/{total}')
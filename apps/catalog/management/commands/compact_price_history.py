@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from apps.catalog.price_history import (compact_price_history, ensure_partitions,
+                                        RAW_HISTORY_DAYS, COMPACT_BATCH_SIZE, PARTITIONS_AHEAD)
+
+
+class Command(BaseCommand):
+    help = ('Создает секции истории цен на следующие месяцы и прореживает историю: '
+            'старше заданного срока остается последняя цена товара за месяц и старая цена')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raw-days', type=int, default=RAW_HISTORY_DAYS,
+                            help='За сколько последних дней история хранится полностью')
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE,
+                            help='Сколько записей удалять в одной транзакции')
+        parser.add_argument('--partitions-ahead', type=int, default=PARTITIONS_AHEAD,
+                            help='На сколько месяцев вперед создавать секции таблицы')
+
+    def handle(self, *args, **options):
+        # Ошибка создания секций не должна отменять прореживание истории
+        try:
+            for name in ensure_partitions(options['partitions_ahead']):
+                self.stdout.write(f'Создана секция {name}')
+        except DatabaseError as e:
+            self.stderr.write(f'Не удалось создать секции истории цен: {e}')
+
+        deleted = compact_price_history(options['raw_days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей истории цен: {deleted}'))
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.catalog.feeds import export_rows, write_feed, FEED_BATCH_SIZE, FEED_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Выгружает каталог товаров в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу выгрузки ("-" - стандартный вывод)')
+        parser.add_argument('--format', choices=FEED_FORMATS,
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=FEED_BATCH_SIZE,
+                            help='Количество товаров, читаемых из БД за один раз')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if feed_format not in FEED_FORMATS:
+            raise CommandError('Укажите формат файла: --format csv или --format jsonl')
+
+        rows = export_rows(options['batch_size'])
+        if path == '-':
+            write_feed(sys.stdout, rows, feed_format)
+            return
+
+        try:
+            with open(path, 'w', encoding='utf-8', newline='') as file:
+                count = write_feed(file, rows, feed_format)
+        except OSError as e:
+            raise CommandError(f'Не удалось записать файл: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Выгружено товаров: {count}'))
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.catalog.feeds import CatalogImporter, read_feed, FEED_BATCH_SIZE, FEED_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Загружает каталог из CSV или JSONL: создает и обновляет категории, подкатегории и товары'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу каталога ("-" - стандартный ввод)')
+        parser.add_argument('--format', choices=FEED_FORMATS,
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=FEED_BATCH_SIZE,
+                            help='Количество товаров, загружаемых за одну транзакцию')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if feed_format not in FEED_FORMATS:
+            raise CommandError('Укажите формат файла: --format csv или --format jsonl')
+
+        importer = CatalogImporter(options['batch_size'], on_error=self.stderr.write)
+        if path == '-':
+            stats = importer.run(read_feed(sys.stdin, feed_format))
+        else:
+            try:
+                with open(path, encoding='utf-8', newline='') as file:
+                    stats = importer.run(read_feed(file, feed_format))
+            except OSError as e:
+                raise CommandError(f'Не удалось открыть файл: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано товаров: {stats["created"]}, обновлено: {stats["updated"]}, '
+            f'изменено цен: {stats["repriced"]}, пропущено строк: {stats["skipped"]}'
+        ))
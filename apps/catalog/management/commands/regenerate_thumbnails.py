@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from apps.catalog.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Создает производные изображения (WebP и JPEG) для загруженных фото товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Обрабатывать только фото без производных')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.order_by('pk')
+        if options['missing_only']:
+            images = images.filter(thumbnails=[])
+
+        processed = failed = 0
+        for product_image in images.iterator():
+            try:
+                product_image.generate_thumbnails()
+                processed += 1
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f'{product_image.image.name}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано фото: {processed}, с ошибками: {failed}'
+        ))
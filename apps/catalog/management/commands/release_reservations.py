@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.catalog.reservations import release_expired, RELEASE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Возвращает на склад товар из истекших резервов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RELEASE_BATCH_SIZE,
+                            help='Сколько резервов освобождать в одной транзакции')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 - выполнить один раз)')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired(options['batch_size'])
+            self.stdout.write(f'Освобождено резервов: {released}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_alter_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_percent',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False, verbose_name='Скидка, %'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='old_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Старая цена'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.11 on 2026-10-18 08:33
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_product_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='catalog_product_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['slug'], name='catalog_product_slug_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subcategory',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='catalog_subcat_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
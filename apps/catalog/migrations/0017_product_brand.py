@@ -0,0 +1,47 @@
+# Generated by Django 5.2.11 on 2026-10-18 08:35
+
+import re
+
+from django.db import migrations, models
+
+
+# Копия apps.catalog.utils.BRAND_RE на момент миграции: миграция не должна
+# зависеть от кода приложения, который может измениться
+BRAND_RE = re.compile(r'\b([A-Za-z][A-Za-z0-9&\-]*)')
+BATCH_SIZE = 1000
+
+
+def extract_brand(name):
+    """Определяет бренд по названию товара (копия apps.catalog.utils.extract_brand)"""
+    match = BRAND_RE.search(name or '')
+    return match.group(1)[:50] if match else ''
+
+
+def fill_brands(apps, schema_editor):
+    """Заполняет бренд существующих товаров по названию, читая товары порциями"""
+    Product = apps.get_model('catalog', 'Product')
+    batch = []
+    for product in Product.objects.only('id', 'name').order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        product.brand = extract_brand(product.name)
+        batch.append(product)
+        if len(batch) == BATCH_SIZE:
+            Product.objects.bulk_update(batch, ['brand'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['brand'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='brand',
+            field=models.CharField(blank=True, db_index=True, max_length=50, verbose_name='Бренд'),
+        ),
+        migrations.RunPython(fill_brands, migrations.RunPython.noop),
+    ]
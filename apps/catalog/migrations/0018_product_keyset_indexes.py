@@ -0,0 +1,25 @@
+# Generated by Django 5.2.11 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_product_brand'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcat', 'price', 'id'], name='catalog_product_subcat_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcat', 'name', 'id'], name='catalog_product_subcat_name'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcat', 'created_at', 'id'], name='catalog_product_subcat_created'),
+        ),
+    ]
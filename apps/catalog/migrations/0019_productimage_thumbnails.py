@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0018_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.2.11 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Секционирование истории цен по месяцам changed_at.
+# Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+# поэтому в БД он (id, changed_at); id по-прежнему уникален благодаря последовательности.
+# Секции создаются от самого старого месяца истории до трех месяцев вперед,
+# следующие создает команда compact_price_history; строки вне секций попадают
+# в секцию по умолчанию
+PARTITION_SQL = """
+ALTER TABLE catalog_pricehistory RENAME TO catalog_pricehistory_old;
+ALTER INDEX catalog_pricehistory_pkey RENAME TO catalog_pricehistory_old_pkey;
+
+CREATE TABLE catalog_pricehistory (
+    id bigint NOT NULL,
+    price numeric(10, 2) NOT NULL,
+    changed_at timestamp with time zone NOT NULL,
+    product_id bigint NOT NULL
+        CONSTRAINT catalog_pricehistory_product_id_fk_catalog_product_id
+        REFERENCES catalog_product (id) DEFERRABLE INITIALLY DEFERRED,
+    CONSTRAINT catalog_pricehistory_pkey PRIMARY KEY (id, changed_at)
+) PARTITION BY RANGE (changed_at);
+
+CREATE TABLE catalog_pricehistory_default PARTITION OF catalog_pricehistory DEFAULT;
+
+DO $$
+DECLARE
+    month timestamp with time zone;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE(history.oldest, now()) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+            date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '3 months',
+            interval '1 month'
+        )
+        FROM (SELECT MIN(changed_at) AS oldest FROM catalog_pricehistory_old) AS history
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF catalog_pricehistory FOR VALUES FROM (%L) TO (%L)',
+            'catalog_pricehistory_p' || to_char(month AT TIME ZONE 'UTC', 'YYYY_MM'),
+            month, month + interval '1 month'
+        );
+    END LOOP;
+END
+$$;
+
+INSERT INTO catalog_pricehistory (id, price, changed_at, product_id)
+SELECT id, price, changed_at, product_id FROM catalog_pricehistory_old;
+DROP TABLE catalog_pricehistory_old;
+
+CREATE SEQUENCE catalog_pricehistory_id_seq OWNED BY catalog_pricehistory.id;
+SELECT setval('catalog_pricehistory_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM catalog_pricehistory;
+ALTER TABLE catalog_pricehistory ALTER COLUMN id SET DEFAULT nextval('catalog_pricehistory_id_seq');
+
+CREATE INDEX catalog_price_product_changed
+    ON catalog_pricehistory (product_id, changed_at DESC) INCLUDE (price);
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE catalog_pricehistory RENAME TO catalog_pricehistory_partitioned;
+ALTER INDEX catalog_pricehistory_pkey RENAME TO catalog_pricehistory_partitioned_pkey;
+ALTER SEQUENCE catalog_pricehistory_id_seq RENAME TO catalog_pricehistory_partitioned_id_seq;
+DROP INDEX catalog_price_product_changed;
+
+CREATE TABLE catalog_pricehistory (
+    id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    price numeric(10, 2) NOT NULL,
+    changed_at timestamp with time zone NOT NULL,
+    product_id bigint NOT NULL
+        CONSTRAINT catalog_pricehistory_product_id_fk_catalog_product_id
+        REFERENCES catalog_product (id) DEFERRABLE INITIALLY DEFERRED
+);
+
+INSERT INTO catalog_pricehistory (id, price, changed_at, product_id)
+SELECT id, price, changed_at, product_id FROM catalog_pricehistory_partitioned;
+DROP TABLE catalog_pricehistory_partitioned;
+
+SELECT setval(pg_get_serial_sequence('catalog_pricehistory', 'id'), COALESCE(MAX(id), 0) + 1, false)
+FROM catalog_pricehistory;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0020_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pricehistory',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='catalog.product'),
+        ),
+        migrations.RunSQL(
+            PARTITION_SQL,
+            UNPARTITION_SQL,
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='pricehistory',
+                    index=models.Index(fields=['product', '-changed_at'], include=('price',), name='catalog_price_product_changed'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0021_pricehistory_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnails_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
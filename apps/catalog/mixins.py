@@ -1,11 +1,21 @@
-from django.db.models import QuerySet
+from urllib.parse import urlencode
+
+from django.db.models import QuerySet, Q, Count
+
+from .cache import prepare_product_cards, CARD_CACHE_TIMEOUT
+from .pagination import paginate_by_cursor, decode_cursor
 
 
 class SortableListViewMixin:
-    """Миксин для добавления сортировки в ListView"""
+    """Миксин для добавления сортировки в ListView.
+
+    При cursor_pagination = True вместо нумерованных страниц используется
+    курсорная пагинация по (поле сортировки, id) без COUNT и OFFSET
+    """
     sort_fields = ('name', 'price', 'created_at')
     default_sort = 'name'
     default_direction = 'asc'
+    cursor_pagination = False
 
     def get_sort_params(self):
         """Получаем параметры сортировки из запроса"""
@@ -30,12 +40,183 @@ class SortableListViewMixin:
         queryset = super().get_queryset()
         ordering = self.get_ordering()
         if ordering:
-            queryset = queryset.order_by(ordering)
+            # id в конце делает порядок однозначным при равных значениях поля
+            pk_ordering = '-pk' if ordering.startswith('-') else 'pk'
+            queryset = queryset.order_by(ordering, pk_ordering)
         return queryset
 
+    def get_cursor(self):
+        """Получаем курсор из запроса, если он относится к текущей сортировке"""
+        cursor = decode_cursor(self.request.GET.get('cursor', ''))
+        if cursor is None:
+            return None
+        sort_by, direction = self.get_sort_params()
+        if (cursor.get('s'), cursor.get('d')) != (sort_by, direction):
+            return None
+        return cursor
+
+    def paginate_queryset(self, queryset, page_size):
+        """Курсорная пагинация вместо Paginator, если она включена"""
+        if not self.cursor_pagination:
+            return super().paginate_queryset(queryset, page_size)
+
+        sort_by, direction = self.get_sort_params()
+        page = paginate_by_cursor(queryset, sort_by, direction, self.get_cursor(), page_size)
+        return None, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         sort_by, direction = self.get_sort_params()
         context['current_sort'] = sort_by
         context['current_direction'] = direction
-        return context
\ No newline at end of file
+        context['cursor_pagination'] = self.cursor_pagination
+        return context
+
+
+class FacetFilterMixin:
+    """Миксин для фильтрации ListView по фасетам с подсчетом количества товаров.
+
+    Все счетчики фасетов считаются одним агрегирующим запросом с группировкой
+    по бренду. Счетчик каждого значения учитывает остальные выбранные фильтры,
+    но не фильтр своего фасета
+    """
+    # (ключ, подпись, нижняя граница, верхняя граница)
+    price_ranges = (
+        ('0-10000', 'До 10 000 ₽', None, 10000),
+        ('10000-30000', '10 000 – 30 000 ₽', 10000, 30000),
+        ('30000-60000', '30 000 – 60 000 ₽', 30000, 60000),
+        ('60000-', 'От 60 000 ₽', 60000, None),
+    )
+
+    def get_filter_params(self):
+        """Получаем выбранные значения фасетов из запроса"""
+        price_keys = {key for key, *_ in self.price_ranges}
+        return {
+            'price': [key for key in self.request.GET.getlist('price') if key in price_keys],
+            'brand': [brand for brand in self.request.GET.getlist('brand') if brand],
+            'in_stock': self.request.GET.get('in_stock') == '1',
+            'discount': self.request.GET.get('discount') == '1',
+        }
+
+    def get_price_condition(self, key):
+        """Возвращает условие для диапазона цен"""
+        for range_key, _, price_from, price_to in self.price_ranges:
+            if range_key == key:
+                condition = Q()
+                if price_from is not None:
+                    condition &= Q(price__gte=price_from)
+                if price_to is not None:
+                    condition &= Q(price__lt=price_to)
+                return condition
+        return Q()
+
+    def get_filter_conditions(self, params):
+        """Возвращает условия для каждого выбранного фасета"""
+        conditions = {}
+        if params['price']:
+            price_condition = Q()
+            for key in params['price']:
+                price_condition |= self.get_price_condition(key)
+            conditions['price'] = price_condition
+        if params['brand']:
+            conditions['brand'] = Q(brand__in=params['brand'])
+        if params['in_stock']:
+            conditions['in_stock'] = Q(stock_quantity__gt=0)
+        if params['discount']:
+            conditions['discount'] = Q(discount_percent__gt=0)
+        return conditions
+
+    def apply_filters(self, queryset):
+        """Применяем фасетные фильтры. Исходная выборка сохраняется для подсчета фасетов"""
+        self.facet_queryset = queryset
+        self.filter_params = self.get_filter_params()
+        self.filter_conditions = self.get_filter_conditions(self.filter_params)
+        for condition in self.filter_conditions.values():
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def _count(self, exclude, condition=None):
+        """Count с учетом всех выбранных фасетов, кроме exclude"""
+        combined = Q()
+        for facet, facet_condition in self.filter_conditions.items():
+            if facet != exclude:
+                combined &= facet_condition
+        if condition is not None:
+            combined &= condition
+        return Count('pk', filter=combined or None)
+
+    def get_facet_counts(self):
+        """Считаем значения всех фасетов одним запросом"""
+        annotations = {
+            'brand_count': self._count('brand'),
+            'in_stock_count': self._count('in_stock', Q(stock_quantity__gt=0)),
+            'discount_count': self._count('discount', Q(discount_percent__gt=0)),
+        }
+        for index, (key, *_) in enumerate(self.price_ranges):
+            annotations[f'price_{index}'] = self._count('price', self.get_price_condition(key))
+
+        rows = self.facet_queryset.order_by().values('brand').annotate(**annotations)
+
+        params = self.filter_params
+        brands = []
+        totals = dict.fromkeys(annotations, 0)
+        for row in rows:
+            for name in annotations:
+                totals[name] += row[name]
+            if row['brand'] and (row['brand_count'] or row['brand'] in params['brand']):
+                brands.append({
+                    'value': row['brand'],
+                    'count': row['brand_count'],
+                    'selected': row['brand'] in params['brand'],
+                })
+        brands.sort(key=lambda item: item['value'].lower())
+
+        return {
+            'price': [
+                {
+                    'value': key,
+                    'label': label,
+                    'count': totals[f'price_{index}'],
+                    'selected': key in params['price'],
+                }
+                for index, (key, label, *_) in enumerate(self.price_ranges)
+            ],
+            'brand': brands,
+            'in_stock': {'count': totals['in_stock_count'], 'selected': params['in_stock']},
+            'discount': {'count': totals['discount_count'], 'selected': params['discount']},
+        }
+
+    def get_filter_query_string(self):
+        """Возвращает выбранные фильтры в виде строки GET-параметров"""
+        params = self.filter_params
+        query = {'price': params['price'], 'brand': params['brand']}
+        if params['in_stock']:
+            query['in_stock'] = 1
+        if params['discount']:
+            query['discount'] = 1
+        return urlencode(query, doseq=True)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['facets'] = self.get_facet_counts()
+        context['get_params'] = self.get_filter_query_string()
+        return context
+
+
+class ProductCardCacheMixin:
+    """Миксин для ListView товаров, выводящих карточки catalog/includes/product_card.html.
+
+    Проставляет версии карточек и подгружает фото только для товаров, чьи
+    фрагменты отсутствуют в кэше, поэтому «теплая» страница не делает запросов за фото
+    """
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        products = prepare_product_cards(context['object_list'])
+
+        context['object_list'] = products
+        if self.get_context_object_name(products):
+            context[self.get_context_object_name(products)] = products
+        if context.get('page_obj') is not None:
+            context['page_obj'].object_list = products
+        context['card_cache_timeout'] = CARD_CACHE_TIMEOUT
+        return context
@@ -1,12 +1,19 @@
 import os
+from decimal import Decimal, ROUND_HALF_UP
 
 from django.urls import reverse
 from django.utils import timezone
 from pytils.translit import slugify
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchVectorField, SearchQuery, SearchRank,
+                                            TrigramWordSimilarity)
 from django.core.validators import MinLengthValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.functions import Greatest
 
-from .utils import product_image_path
+from apps.tasks.queue import enqueue
+from .thumbnails import create_thumbnails, thumbnail_names
+from .utils import product_image_path, extract_brand
 
 
 class Category(models.Model):
@@ -61,6 +68,10 @@ class SubCategory(models.Model):
     class Meta:
         verbose_name = "Подкатегория"
         verbose_name_plural = "Подкатегории"
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'],
+                     name='catalog_subcat_name_trgm'),
+        ]
 
     def get_absolute_url(self):
         return reverse('catalog:products', kwargs={'subcat_slug': self.slug})
@@ -85,6 +96,130 @@ class SubCategory(models.Model):
         return self.name
 
 
+# Конфигурация полнотекстового поиска PostgreSQL (стемминг для русского языка)
+SEARCH_CONFIG = 'russian'
+
+# Сколько цен из словаря {id: цена} изменяется одним запросом
+REPRICE_BATCH_SIZE = 1000
+
+# Запись прежних цен товаров, чья цена изменится, в историю одним запросом.
+# {new_prices} - подзапрос с колонками id и new_price
+REPRICE_HISTORY_SQL = """
+    INSERT INTO {history} (product_id, price, changed_at)
+    SELECT product.id, product.price, %s
+    FROM {product} AS product
+    JOIN ({new_prices}) AS new ON new.id = product.id
+    WHERE product.price <> ROUND(new.new_price, 2)
+    {lock}
+"""
+
+# Изменение цен одним запросом; старая цена и скидка считаются так же, как в set_old_price
+REPRICE_SQL = """
+    UPDATE {product} SET
+        price = ROUND(new.new_price, 2),
+        old_price = CASE WHEN {product}.price > ROUND(new.new_price, 2)
+            THEN {product}.price ELSE NULL END,
+        discount_percent = CASE WHEN {product}.price > ROUND(new.new_price, 2)
+            THEN ROUND(({product}.price - ROUND(new.new_price, 2)) * 100 / {product}.price)
+            ELSE 0 END,
+        updated_at = %s
+    FROM ({new_prices}) AS new
+    WHERE {product}.id = new.id AND {product}.price <> ROUND(new.new_price, 2)
+    RETURNING {product}.id
+"""
+
+
+class ProductQuerySet(models.QuerySet):
+    """QuerySet товаров с пакетной подгрузкой данных для карточек"""
+
+    def with_card_data(self):
+        """Подгружает фото для всей выборки одним запросом"""
+        return self.prefetch_related(
+            models.Prefetch('images', queryset=ProductImage.objects.all())
+        )
+
+    def with_previous_price(self):
+        """Аннотирует последнюю цену из истории, отличную от текущей"""
+        previous_price = PriceHistory.objects.filter(
+            product=models.OuterRef('pk')
+        ).exclude(
+            price=models.OuterRef('price')
+        ).order_by('-changed_at').values('price')[:1]
+
+        return self.annotate(previous_price=models.Subquery(previous_price))
+
+    def bulk_reprice(self, prices):
+        """Изменяет цены товаров выборки и записывает прежние цены в историю.
+
+        prices - словарь {id товара: новая цена} или выражение от полей товара,
+        например F('price') * Decimal('0.9'). Вместо save() для каждого товара
+        выполняются INSERT ... SELECT в историю и UPDATE ... RETURNING на пакет.
+        Возвращает список id товаров, чья цена изменилась
+        """
+        with transaction.atomic():
+            if not isinstance(prices, dict):
+                changed = self._reprice(prices)
+            else:
+                changed = []
+                items = list(prices.items())
+                for start in range(0, len(items), REPRICE_BATCH_SIZE):
+                    batch = dict(items[start:start + REPRICE_BATCH_SIZE])
+                    changed += self.filter(pk__in=batch)._reprice(models.Case(
+                        *[models.When(pk=pk, then=models.Value(price)) for pk, price in batch.items()],
+                        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+                    ))
+
+        # UPDATE не вызывает сигналы - сбрасываем кэш карточек сами.
+        # Импорт внутри метода: модуль cache импортирует модели
+        from .cache import bump_product_versions
+        bump_product_versions(changed)
+        return changed
+
+    def _reprice(self, expression):
+        new_prices = self.annotate(new_price=expression).order_by().values_list('id', 'new_price')
+        new_prices_sql, params = new_prices.query.sql_with_params()
+        tables = {
+            'product': Product._meta.db_table,
+            'history': PriceHistory._meta.db_table,
+            'new_prices': new_prices_sql,
+        }
+        # Строки товаров блокируются, чтобы цена не изменилась между двумя запросами
+        lock = 'FOR UPDATE OF product' if connection.features.has_select_for_update_of else ''
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(REPRICE_HISTORY_SQL.format(lock=lock, **tables), [now, *params])
+            cursor.execute(REPRICE_SQL.format(**tables), [now, *params])
+            return [pk for pk, in cursor.fetchall()]
+
+    def search(self, text):
+        """Полнотекстовый поиск по названию, описанию и артикулу с ранжированием.
+
+        Поисковый вектор хранится в поле search_vector и поддерживается
+        триггером PostgreSQL (см. миграцию 0015)
+        """
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        return self.filter(search_vector=query).annotate(
+            rank=SearchRank(models.F('search_vector'), query)
+        )
+
+    def autocomplete(self, text):
+        """Нечеткий поиск по началу названия с учетом опечаток и транслитерации.
+
+        Запрос сравнивается с названием и с транслитерированным slug товара
+        через триграммные GIN индексы (pg_trgm)
+        """
+        slug_text = slugify(text)
+        return self.filter(
+            models.Q(name__trigram_word_similar=text) |
+            models.Q(slug__trigram_word_similar=slug_text)
+        ).annotate(
+            similarity=Greatest(
+                TrigramWordSimilarity(text, 'name'),
+                TrigramWordSimilarity(slug_text, 'slug'),
+            )
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100, verbose_name='Товар',
                             validators=[
@@ -96,15 +231,40 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock_quantity = models.PositiveIntegerField(default=0, verbose_name='Остаток')
     sku = models.PositiveIntegerField(blank=True, null=True, verbose_name='Артикул')
+    brand = models.CharField(max_length=50, blank=True, db_index=True, verbose_name='Бренд')
+    old_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                    editable=False, verbose_name='Старая цена')
+    discount_percent = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False,
+                                                        verbose_name='Скидка, %')
+    # Заполняется триггером БД при изменении name, description или sku
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     subcat = models.ForeignKey(SubCategory, on_delete=models.PROTECT,
                                related_name='products', verbose_name='Подкатегория')
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='catalog_product_search_gin'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'],
+                     name='catalog_product_name_trgm'),
+            GinIndex(fields=['slug'], opclasses=['gin_trgm_ops'],
+                     name='catalog_product_slug_trgm'),
+            # Индексы для курсорной пагинации списков товаров подкатегории
+            models.Index(fields=['subcat', 'price', 'id'], name='catalog_product_subcat_price'),
+            models.Index(fields=['subcat', 'name', 'id'], name='catalog_product_subcat_name'),
+            models.Index(fields=['subcat', 'created_at', 'id'],
+                         name='catalog_product_subcat_created'),
+        ]
+
+    # Цена и остаток на момент загрузки из БД (см. from_db)
+    _loaded_price = None
+    _loaded_stock = None
 
     def get_absolute_url(self):
         return reverse('catalog:product', kwargs={'product_slug': self.slug})
@@ -114,22 +274,95 @@ class Product(models.Model):
         if not self.slug:
             self.slug = slugify(self.name)
 
+        # Определяем бренд по названию, если он не указан
+        if not self.brand:
+            self.brand = extract_brand(self.name)
+
         # Если при редактировании товара цена изменилась, сохраняем её в PriceHistory
         # Проверяем, существует ли уже товар
         if self.pk:
-            old_product = Product.objects.get(pk=self.pk)
+            old_price = self._loaded_price
+            if old_price is None:
+                # Товар не загружен из БД (или цена не загружена) - узнаем цену запросом
+                old_price = Product.objects.filter(pk=self.pk).values_list('price', flat=True).first()
             # Если цена изменилась
-            if old_product.price != self.price:
+            if old_price is not None and old_price != self.price:
                 PriceHistory.objects.create(
                     product=self,
-                    price=old_product.price,
+                    price=old_price,
                     changed_at=timezone.now()
                 )
+                # Последняя запись истории теперь и есть предыдущая цена
+                self.set_old_price(old_price)
+
+                update_fields = kwargs.get('update_fields')
+                if update_fields is not None:
+                    kwargs['update_fields'] = {*update_fields, 'old_price', 'discount_percent'}
+
+        # Пока объект был загружен, остаток могли изменить резервы корзин, поэтому
+        # значение из объекта не записываем, а прибавляем к остатку в БД разницу
+        # с загруженным (правка в админке "+5 шт." не затирает чужие резервы)
+        stock_delta = 0
+        if self._loaded_stock is not None and not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [field.name for field in self._meta.concrete_fields
+                                 if not field.primary_key and field.attname not in deferred]
+            if 'stock_quantity' in update_fields:
+                stock_delta = self.stock_quantity - self._loaded_stock
+            # Пустой список отменил бы сохранение и post_save (сброс кэша карточки)
+            kwargs['update_fields'] = [name for name in update_fields
+                                       if name != 'stock_quantity'] or ['updated_at']
         super().save(*args, **kwargs)
+        if stock_delta:
+            Product.objects.filter(pk=self.pk).update(
+                stock_quantity=Greatest(models.F('stock_quantity') + stock_delta, 0)
+            )
+        self._loaded_price = self.price
+        self._loaded_stock = self.stock_quantity
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем цену на момент загрузки, чтобы при сохранении не запрашивать ее из БД
+        instance._loaded_price = instance.price if 'price' in field_names else None
+        instance._loaded_stock = (instance.stock_quantity if 'stock_quantity' in field_names
+                                  else None)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Значения копируются в объект минуя from_db - обновляем загруженные значения сами
+        if fields is None or 'price' in fields:
+            self._loaded_price = self.price
+        if fields is None or 'stock_quantity' in fields:
+            self._loaded_stock = self.stock_quantity
+
+    def set_old_price(self, previous_price):
+        """Заполняет хранимые поля старой цены и скидки по предыдущей цене"""
+        if previous_price is not None and previous_price > self.price:
+            self.old_price = previous_price
+            # Половина округляется от нуля, как ROUND в REPRICE_SQL (round() округлял бы к четному)
+            self.discount_percent = int(((previous_price - self.price) / previous_price * 100).quantize(
+                Decimal('1'), rounding=ROUND_HALF_UP
+            ))
+        else:
+            self.old_price = None
+            self.discount_percent = 0
+
+    def _has_prefetched_images(self):
+        """Проверяет, подгружены ли фото через prefetch_related"""
+        return 'images' in getattr(self, '_prefetched_objects_cache', {})
 
     @property
     def main_image(self):
         """Возвращает главное фото товара"""
+        if self._has_prefetched_images():
+            # Фото уже отсортированы: главное идет первым
+            images = self.images.all()
+            return images[0].image if images else None
+
         main = self.images.filter(is_main=True).first()
         if main:
             return main.image
@@ -140,39 +373,65 @@ class Product(models.Model):
     @property
     def additional_images(self):
         """Возвращает дополнительные фото"""
+        if self._has_prefetched_images():
+            return [img for img in self.images.all() if not img.is_main]
         return self.images.filter(is_main=False)
 
     def get_old_price(self):
         """Возвращает предыдущую цену, если она была выше ткущей"""
-        try:
-            # Получаем последнюю запись из истории цен
-            last_price = self.prices.exclude(price=self.price).first()
-            if last_price and last_price.price > self.price:
-                return last_price.price
-            return None
-        except:
-            return None
+        return self.old_price
 
     def get_discount_percent(self):
         """Возвращает процент скидки"""
-        old_price = self.get_old_price()
-        if old_price and old_price > self.price:
-            discount = ((old_price - self.price) / old_price) * 100
-            return round(discount)
-        return 0
+        return self.discount_percent
 
     def __str__(self):
         return self.name
 
 
 class PriceHistory(models.Model):
-    """Модель для истории цен товара"""
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='prices')
+    """Модель для истории цен товара.
+
+    В PostgreSQL таблица секционирована по месяцам changed_at (см. миграцию 0021
+    и модуль price_history), первичный ключ в БД - (id, changed_at)
+    """
+    # Отдельный индекс по product не нужен: его заменяет составной индекс ниже
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='prices',
+                                db_index=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     changed_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-changed_at']
+        indexes = [
+            # Последняя цена товара (with_previous_price) читается только из индекса
+            models.Index(fields=['product', '-changed_at'], include=['price'],
+                         name='catalog_price_product_changed'),
+        ]
+
+
+class StockReservation(models.Model):
+    """Временный резерв товара под корзину покупателя.
+
+    Зарезервированные единицы вычитаются из Product.stock_quantity в момент
+    резервирования и возвращаются при отмене или истечении резерва
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    # Владелец резерва: 'user:<id>' или 'session:<ключ сессии>'
+    holder = models.CharField(max_length=64, verbose_name='Владелец')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Истекает')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+        constraints = [
+            models.UniqueConstraint(fields=('holder', 'product'), name='unique_reservation_per_holder')
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} x {self.quantity} ({self.holder})'
 
 
 class ProductImage(models.Model):
@@ -182,6 +441,10 @@ class ProductImage(models.Model):
                               max_length=500)
     is_main = models.BooleanField(default=False, verbose_name='Главное фото')
     order = models.PositiveIntegerField(default=0, verbose_name='Порядок сортировки')
+    # Ширины созданных производных изображений (пусто, пока они не готовы)
+    thumbnails = models.JSONField(default=list, blank=True, editable=False)
+    # Номер пересоздания производных (см. thumbnail_name)
+    thumbnails_version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -197,6 +460,9 @@ class ProductImage(models.Model):
             )
         ]
 
+    # Имя файла на момент загрузки из БД (см. from_db)
+    _loaded_image_name = None
+
     def save(self, *args, **kwargs):
         # Автоматически устанавливаем порядковый номер, если не указан
         if self.order == 0 and not self.pk:
@@ -205,19 +471,60 @@ class ProductImage(models.Model):
             self.order = (max_order or 0) + 1
 
         # Если это главное фото, убираем флаг is_main у остальных фотографий товара
-        if self.is_main:
+        update_fields = kwargs.get('update_fields')
+        if self.is_main and (update_fields is None or 'is_main' in update_fields):
             ProductImage.objects.filter(
                 product=self.product,
                 is_main=True
             ).exclude(pk=self.pk).update(is_main=False)
+
+        # Если файл загружен заново, старые производные больше не нужны
+        image_changed = self.image.name != self._loaded_image_name
+        if image_changed:
+            if self._loaded_image_name and self.thumbnails:
+                enqueue('apps.catalog.tasks.delete_files',
+                        thumbnail_names(self._loaded_image_name, self.thumbnails,
+                                        self.thumbnails_version))
+            self.thumbnails = []
+
         super().save(*args, **kwargs)
+        self._loaded_image_name = self.image.name
+
+        # Производные создаются один раз на загрузку фоновой задачей
+        if image_changed and self.image:
+            enqueue('apps.catalog.tasks.generate_thumbnails', self.pk, self.image.name)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем имя файла, чтобы при сохранении понять, загружен ли новый
+        instance._loaded_image_name = instance.image.name if 'image' in field_names else None
+        return instance
+
+    def generate_thumbnails(self):
+        """Создает производные изображения и сохраняет список их ширин.
+
+        Новые файлы пишутся под именами следующей версии, а прежние удаляются
+        только после фиксации транзакции: если сохранение не удастся, страницы
+        продолжат ссылаться на целые прежние файлы
+        """
+        stale = thumbnail_names(self.image.name, self.thumbnails, self.thumbnails_version)
+        version = self.thumbnails_version + 1
+        self.thumbnails = create_thumbnails(self.image, version)
+        self.thumbnails_version = version
+        # Сохранение вызывает post_save, который сбрасывает кэш карточки товара
+        self.save(update_fields=['thumbnails', 'thumbnails_version'])
+        if stale:
+            transaction.on_commit(lambda: enqueue('apps.catalog.tasks.delete_files', stale))
 
     def __str__(self):
         return f"Фото для {self.product.name} (ID: {self.pk})"
 
     def delete(self, *args, **kwargs):
-        # При удалении фото удаляем и файл
-        storage = self.image.storage
-        if storage.exists(self.image.name):
-            storage.delete(self.image.name)
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        names = [self.image.name, *thumbnail_names(self.image.name, self.thumbnails,
+                                                   self.thumbnails_version)]
+        result = super().delete(*args, **kwargs)
+        # Файлы удаляются фоновой задачей, вне потока запроса, и только после
+        # фиксации удаления: при откате фото остается со своими файлами
+        transaction.on_commit(lambda: enqueue('apps.catalog.tasks.delete_files', names))
+        return result
\ No newline at end of file
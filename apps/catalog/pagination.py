@@ -0,0 +1,105 @@
+from datetime import datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q
+
+
+CURSOR_SALT = 'catalog.cursor'
+
+
+class CursorPage:
+    """Страница курсорной (keyset) пагинации.
+
+    В отличие от Page не знает общего числа страниц: переход выполняется
+    только на соседние страницы по курсорам next_cursor и previous_cursor
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def encode_cursor(sort_by, direction, value, pk, reverse=False):
+    """Кодирует позицию (значение поля сортировки, id) в подписанную строку"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    return signing.dumps(
+        {'s': sort_by, 'd': direction, 'v': value, 'id': pk, 'r': reverse},
+        salt=CURSOR_SALT
+    )
+
+
+def decode_cursor(cursor):
+    """Декодирует курсор. Возвращает None, если курсор поврежден"""
+    try:
+        return signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+
+
+def paginate_by_cursor(queryset, sort_by, direction, cursor, page_size):
+    """Возвращает страницу, начинающуюся после позиции курсора.
+
+    Вместо OFFSET используется условие (field, id) > (value, id), поэтому
+    стоимость любой страницы одинакова при наличии индекса (..., field, id)
+    """
+    field = queryset.model._meta.get_field(sort_by)
+    descending = direction == 'desc'
+    reverse = False
+
+    if cursor is not None:
+        reverse = cursor['r']
+        value = field.to_python(cursor['v'])
+        # При движении назад условие и порядок сортировки инвертируются
+        greater = descending == reverse
+        lookup = 'gt' if greater else 'lt'
+        boundary = 'gte' if greater else 'lte'
+        queryset = queryset.filter(
+            Q(**{f'{sort_by}__{boundary}': value}),
+            Q(**{f'{sort_by}__{lookup}': value}) | Q(**{f'pk__{lookup}': cursor['id']})
+        )
+
+    if descending != reverse:
+        ordering = (f'-{sort_by}', '-pk')
+    else:
+        ordering = (sort_by, 'pk')
+
+    # Запрашиваем на одну запись больше, чтобы узнать, есть ли следующая страница
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if reverse:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, cursor is not None
+
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_by, direction, getattr(last, sort_by), last.pk)
+    if rows and has_previous:
+        first = rows[0]
+        previous_cursor = encode_cursor(sort_by, direction, getattr(first, sort_by), first.pk,
+                                        reverse=True)
+
+    return CursorPage(rows, next_cursor, previous_cursor)
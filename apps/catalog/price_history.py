@@ -0,0 +1,178 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+from .models import PriceHistory
+
+
+# История за последние дни хранится полностью - по ней строятся графики цен
+RAW_HISTORY_DAYS = 90
+COMPACT_BATCH_SIZE = 5000
+# На сколько месяцев вперед создаются секции таблицы истории
+PARTITIONS_AHEAD = 3
+
+PARTITIONED_TABLE_SQL = "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass"
+PARTITIONS_SQL = """
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = %s::regclass
+"""
+# Границы секции подставляются в текст: параметры в DDL не поддерживаются
+CREATE_PARTITION_SQL = """
+    CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+    FOR VALUES FROM ('{start}') TO ('{end}')
+"""
+# Секция по умолчанию (см. миграцию 0021) принимает записи, для месяца которых
+# еще нет секции. Пока в ней есть записи месяца, секцию этого месяца создать
+# нельзя: секция по умолчанию отсоединяется, ее записи месяца переносятся
+# в новую секцию, и она присоединяется обратно
+DEFAULT_PARTITION_ROWS_SQL = """
+    SELECT 1 FROM {default} WHERE changed_at >= %s AND changed_at < %s LIMIT 1
+"""
+DETACH_DEFAULT_PARTITION_SQL = "ALTER TABLE {table} DETACH PARTITION {default}"
+MOVE_DEFAULT_PARTITION_ROWS_SQL = """
+    WITH moved AS (
+        DELETE FROM {default} WHERE changed_at >= %s AND changed_at < %s RETURNING *
+    )
+    INSERT INTO {table} SELECT * FROM moved
+"""
+ATTACH_DEFAULT_PARTITION_SQL = "ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"
+# Условие по changed_at позволяет PostgreSQL затронуть только одну секцию.
+# Подзапрос возвращает не больше пакета id лишних записей месяца
+DELETE_HISTORY_SQL = """
+    DELETE FROM {table}
+    WHERE changed_at >= %s AND changed_at < %s AND id IN ({redundant})
+"""
+
+
+def month_start(value):
+    """Начало месяца (UTC), в который попадает value"""
+    return value.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0,
+                                                     microsecond=0)
+
+
+def next_month(value):
+    """Начало следующего месяца для value - начала месяца"""
+    return (value + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(start):
+    return f'{PriceHistory._meta.db_table}_p{start:%Y_%m}'
+
+
+def default_partition_name():
+    return f'{PriceHistory._meta.db_table}_default'
+
+
+def _create_partition(cursor, name, start, end, default):
+    """Создает секцию месяца, перенося в нее записи месяца из секции по умолчанию"""
+    table = PriceHistory._meta.db_table
+    partition = connection.ops.quote_name(name)
+    create_sql = CREATE_PARTITION_SQL.format(partition=partition, table=table,
+                                             start=start.isoformat(), end=end.isoformat())
+    if default is not None:
+        cursor.execute(DEFAULT_PARTITION_ROWS_SQL.format(default=default), [start, end])
+        if cursor.fetchone() is None:
+            default = None
+    if default is None:
+        cursor.execute(create_sql)
+        return
+
+    with transaction.atomic():
+        cursor.execute(DETACH_DEFAULT_PARTITION_SQL.format(table=table, default=default))
+        cursor.execute(create_sql)
+        cursor.execute(MOVE_DEFAULT_PARTITION_ROWS_SQL.format(table=table, default=default),
+                       [start, end])
+        cursor.execute(ATTACH_DEFAULT_PARTITION_SQL.format(table=table, default=default))
+
+
+def ensure_partitions(months_ahead=PARTITIONS_AHEAD):
+    """Создает недостающие месячные секции истории цен до months_ahead месяцев вперед.
+
+    Записи месяца, уже попавшие в секцию по умолчанию, переносятся в новую
+    секцию. Возвращает имена созданных секций. Если таблица не секционирована
+    (не PostgreSQL), ничего не делает
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    table = PriceHistory._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITIONED_TABLE_SQL, [table])
+        if cursor.fetchone() is None:
+            return []
+        cursor.execute(PARTITIONS_SQL, [table])
+        existing = {name for name, in cursor.fetchall()}
+        default = default_partition_name()
+        default = connection.ops.quote_name(default) if default in existing else None
+
+        created = []
+        start = month_start(timezone.now())
+        for _ in range(months_ahead + 1):
+            end = next_month(start)
+            name = partition_name(start)
+            if name not in existing:
+                _create_partition(cursor, name, start, end, default)
+                created.append(name)
+            start = end
+    return created
+
+
+def compact_price_history(raw_days=RAW_HISTORY_DAYS, batch_size=COMPACT_BATCH_SIZE):
+    """Прореживает историю цен старше raw_days дней. Возвращает число удаленных записей.
+
+    Для каждого товара в каждом месяце остается последняя запись. Кроме того,
+    всегда остается запись, которая показывается как старая цена: последняя
+    с ценой, отличной от текущей (см. ProductQuerySet.with_previous_price).
+    Месяцы обрабатываются по очереди, лишние записи месяца удаляются пакетами
+    по batch_size: id пакета выбирает подзапрос внутри DELETE, в память
+    приложения они не загружаются
+    """
+    cutoff = timezone.now() - timedelta(days=raw_days)
+    oldest = PriceHistory.objects.filter(changed_at__lt=cutoff).order_by(
+        'changed_at'
+    ).values_list('changed_at', flat=True).first()
+    if oldest is None:
+        return 0
+
+    previous_price = PriceHistory.objects.filter(
+        product=OuterRef('product_id')
+    ).exclude(
+        price=OuterRef('product__price')
+    ).order_by('-changed_at').values('pk')[:1]
+
+    deleted = 0
+    start = month_start(oldest)
+    while start < cutoff:
+        end = min(next_month(start), cutoff)
+        redundant = PriceHistory.objects.filter(
+            changed_at__gte=start, changed_at__lt=end
+        ).exclude(
+            # Coalesce: если старой цены нет, сравнение с NULL исключило бы все записи
+            pk=Coalesce(Subquery(previous_price), Value(0))
+        ).annotate(
+            rank=Window(RowNumber(), partition_by=[F('product_id')],
+                        order_by=F('changed_at').desc())
+        ).filter(rank__gt=1).values_list('pk', flat=True)[:batch_size]
+        redundant_sql, redundant_params = redundant.query.sql_with_params()
+        sql = DELETE_HISTORY_SQL.format(table=PriceHistory._meta.db_table,
+                                        redundant=redundant_sql)
+        params = [connection.ops.adapt_datetimefield_value(start),
+                  connection.ops.adapt_datetimefield_value(end), *redundant_params]
+
+        # Последняя запись товара в месяце и старая цена не удаляются, поэтому
+        # пакет за пакетом находятся только еще не удаленные лишние записи
+        while True:
+            # Удаление мимо ORM: сигналы на каждую запись не нужны - старая цена
+            # и последние записи месяцев не удаляются, карточки товаров не меняются
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                removed = cursor.rowcount
+            deleted += removed
+            if removed < batch_size:
+                break
+        start = next_month(start)
+    return deleted
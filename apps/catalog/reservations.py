@@ -0,0 +1,305 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from apps.cart.models import MAX_ITEM_QUANTITY
+from .models import Product, StockReservation
+
+
+# Сколько держится резерв без продления
+RESERVATION_TTL = timedelta(minutes=30)
+RELEASE_BATCH_SIZE = 500
+
+# Увеличение резерва владельца одним запросом; срок резерва продлевается
+UPSERT_RESERVATION_SQL = f"""
+    INSERT INTO {StockReservation._meta.db_table}
+        (product_id, holder, quantity, expires_at, created_at)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (holder, product_id) DO UPDATE SET
+        quantity = {StockReservation._meta.db_table}.quantity + EXCLUDED.quantity,
+        expires_at = EXCLUDED.expires_at
+    RETURNING quantity
+"""
+
+# Перенос резервов одного владельца другому одним запросом. Как и количество
+# в корзине, резерв при сложении ограничен MAX_ITEM_QUANTITY
+TRANSFER_RESERVATIONS_SQL = f"""
+    INSERT INTO {StockReservation._meta.db_table}
+        (product_id, holder, quantity, expires_at, created_at)
+    SELECT product_id, %s, quantity, %s, %s
+    FROM {StockReservation._meta.db_table}
+    WHERE holder = %s
+    ON CONFLICT (holder, product_id) DO UPDATE SET
+        quantity = CASE
+            WHEN {StockReservation._meta.db_table}.quantity + EXCLUDED.quantity > {MAX_ITEM_QUANTITY}
+            THEN {MAX_ITEM_QUANTITY}
+            ELSE {StockReservation._meta.db_table}.quantity + EXCLUDED.quantity
+        END,
+        expires_at = EXCLUDED.expires_at
+"""
+
+
+class OutOfStock(ValueError):
+    """Недостаточно товара на складе"""
+    def __init__(self, product):
+        if product is None:
+            super().__init__('Недостаточно товара на складе')
+        else:
+            super().__init__(f'Недостаточно товара "{product.name}" на складе')
+        self.product = product
+
+
+def user_holder(user):
+    return f'user:{user.pk}'
+
+
+def session_holder(session_key):
+    return f'session:{session_key}'
+
+
+def get_holder(request, create=True):
+    """Возвращает владельца резервов для текущего посетителя.
+
+    Анонимному посетителю без сессии сессия создается только при create=True,
+    иначе возвращается None (резервов у него быть не может)
+    """
+    if request.user.is_authenticated:
+        return user_holder(request.user)
+    if not request.session.session_key:
+        if not create:
+            return None
+        request.session.save()
+    return session_holder(request.session.session_key)
+
+
+def _take_stock(product_id, quantity):
+    """Списывает quantity единиц со склада, если их хватает.
+
+    Условный UPDATE блокирует только строку товара и только на время запроса,
+    поэтому покупатели разных товаров не ждут друг друга, а остаток не
+    уходит в минус при любом числе параллельных покупателей
+    """
+    return Product.objects.filter(pk=product_id, stock_quantity__gte=quantity).update(
+        stock_quantity=F('stock_quantity') - quantity
+    )
+
+
+def _return_stock(product_id, quantity):
+    Product.objects.filter(pk=product_id).update(stock_quantity=F('stock_quantity') + quantity)
+
+
+def _quantity_case(quantities):
+    """Выражение "количество для товара" для обновления нескольких товаров одним запросом"""
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField()
+    )
+
+
+def take_stock(quantities):
+    """Списывает со склада {id товара: количество} одним запросом - все или ничего.
+
+    Если какого-то товара не хватает, изменения откатываются и вызывается OutOfStock
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+
+    enough = reduce(or_, (
+        Q(pk=product_id, stock_quantity__gte=quantity) for product_id, quantity in quantities.items()
+    ))
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(enough).update(
+                stock_quantity=F('stock_quantity') - _quantity_case(quantities)
+            )
+            if updated != len(quantities):
+                raise OutOfStock(None)
+    except OutOfStock:
+        # Изменения откачены - ищем товар, которого не хватило, для сообщения
+        for product in Product.objects.filter(pk__in=quantities):
+            if product.stock_quantity < quantities[product.pk]:
+                raise OutOfStock(product)
+        raise
+
+
+def return_stock(quantities):
+    """Возвращает на склад {id товара: количество} одним запросом"""
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if quantities:
+        Product.objects.filter(pk__in=quantities).update(
+            stock_quantity=F('stock_quantity') + _quantity_case(quantities)
+        )
+
+
+def held_quantity(holder, product):
+    """Размер резерва владельца на товар"""
+    return StockReservation.objects.filter(holder=holder, product=product).values_list(
+        'quantity', flat=True
+    ).first() or 0
+
+
+@transaction.atomic
+def reserve(holder, product, quantity):
+    """Резервирует еще quantity единиц товара. Возвращает размер резерва после этого.
+
+    Если товара не хватает, вызывает OutOfStock
+    """
+    if not _take_stock(product.pk, quantity):
+        raise OutOfStock(product)
+
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_RESERVATION_SQL,
+                       [product.pk, holder, quantity, now + RESERVATION_TTL, now])
+        return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def release(holder, product, quantity=None):
+    """Возвращает на склад quantity единиц из резерва владельца (None - весь резерв)"""
+    reservation = StockReservation.objects.select_for_update().filter(
+        holder=holder, product=product
+    ).first()
+    if reservation is None:
+        return
+
+    if quantity is None or quantity >= reservation.quantity:
+        _return_stock(product.pk, reservation.quantity)
+        reservation.delete()
+    elif quantity > 0:
+        _return_stock(product.pk, quantity)
+        reservation.quantity -= quantity
+        reservation.save(update_fields=['quantity'])
+
+
+@transaction.atomic
+def ensure_reserved(holder, product, quantity):
+    """Приводит резерв владельца к quantity единиц, докупая недостающие или возвращая лишние"""
+    current = StockReservation.objects.select_for_update().filter(
+        holder=holder, product=product
+    ).values_list('quantity', flat=True).first() or 0
+    if quantity > current:
+        reserve(holder, product, quantity - current)
+    elif quantity < current:
+        release(holder, product, current - quantity)
+
+
+@transaction.atomic
+def renew(holder, quantities):
+    """Продлевает резервы владельца под корзину {id товара: количество}.
+
+    Резервы, которые уже истекли и вернулись на склад, берутся заново, насколько
+    хватает остатка. Возвращает {id товара: сколько единиц зарезервировать не удалось}
+    """
+    reservations = StockReservation.objects.select_for_update().filter(holder=holder)
+    held = dict(reservations.values_list('product_id', 'quantity'))
+    now = timezone.now()
+    reservations.update(expires_at=now + RESERVATION_TTL)
+
+    shortfall = {}
+    for product_id, quantity in quantities.items():
+        missing = quantity - held.get(product_id, 0)
+        if missing <= 0:
+            continue
+        if not _take_stock(product_id, missing):
+            stock = Product.objects.filter(pk=product_id).values_list(
+                'stock_quantity', flat=True
+            ).first() or 0
+            available = min(stock, missing)
+            if available and not _take_stock(product_id, available):
+                available = 0
+            shortfall[product_id] = missing - available
+            missing = available
+        if missing:
+            with connection.cursor() as cursor:
+                cursor.execute(UPSERT_RESERVATION_SQL,
+                               [product_id, holder, missing, now + RESERVATION_TTL, now])
+    return shortfall
+
+
+def _release_reservations(rows):
+    """Возвращает на склад резервы [(id, id товара, количество)] и удаляет их.
+
+    Вызывается в транзакции, строки резервов должны быть заблокированы
+    """
+    totals = {}
+    for _, product_id, quantity in rows:
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    return_stock(totals)
+    deleted, _ = StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return deleted
+
+
+def release_all(holder):
+    """Отменяет все резервы владельца"""
+    return release_holders([holder])
+
+
+@transaction.atomic
+def release_holders(holders):
+    """Отменяет все резервы нескольких владельцев; число запросов не зависит от их количества"""
+    rows = list(StockReservation.objects.select_for_update().filter(holder__in=holders).values_list(
+        'pk', 'product_id', 'quantity'
+    ))
+    return _release_reservations(rows)
+
+
+@transaction.atomic
+def transfer(old_holder, new_holder):
+    """Передает резервы другому владельцу (при входе пользователя), продлевая их.
+
+    Единицы сверх MAX_ITEM_QUANTITY, которые не поместятся в объединенную
+    корзину, возвращаются на склад
+    """
+    old = dict(StockReservation.objects.select_for_update().filter(
+        holder=old_holder
+    ).values_list('product_id', 'quantity'))
+    if not old:
+        return
+    new = dict(StockReservation.objects.select_for_update().filter(
+        holder=new_holder, product_id__in=old
+    ).values_list('product_id', 'quantity'))
+    return_stock({
+        product_id: quantity + new.get(product_id, 0) - MAX_ITEM_QUANTITY
+        for product_id, quantity in old.items()
+    })
+
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(TRANSFER_RESERVATIONS_SQL,
+                       [new_holder, now + RESERVATION_TTL, now, old_holder])
+    StockReservation.objects.filter(holder=old_holder).delete()
+
+
+@transaction.atomic
+def consume(holder):
+    """Списывает резервы владельца как проданные (товар на склад не возвращается).
+
+    Возвращает словарь {id товара: количество}
+    """
+    reservations = StockReservation.objects.select_for_update().filter(holder=holder)
+    consumed = dict(reservations.values_list('product_id', 'quantity'))
+    reservations.delete()
+    return consumed
+
+
+def release_expired(batch_size=RELEASE_BATCH_SIZE):
+    """Возвращает на склад истекшие резервы пакетами. Возвращает число освобожденных резервов.
+
+    SKIP LOCKED позволяет запускать несколько сборщиков параллельно и не ждать
+    резервов, которые в этот момент продлевает или списывает покупатель
+    """
+    released = 0
+    while True:
+        with transaction.atomic():
+            rows = list(StockReservation.objects.select_for_update(skip_locked=True).filter(
+                expires_at__lt=timezone.now()
+            ).values_list('pk', 'product_id', 'quantity')[:batch_size])
+            if not rows:
+                return released
+            released += _release_reservations(rows)
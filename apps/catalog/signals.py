@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_product_version, bump_category_tree_version
+from .models import Category, SubCategory, Product, ProductImage, PriceHistory
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_category_tree(sender, instance, **kwargs):
+    """Сбрасываем кэш дерева категорий при изменении категории или подкатегории"""
+    bump_category_tree_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_card(sender, instance, **kwargs):
+    """Сбрасываем кэш карточки при изменении товара"""
+    bump_product_version(instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=PriceHistory)
+@receiver(post_delete, sender=PriceHistory)
+def invalidate_product_card_related(sender, instance, **kwargs):
+    """Сбрасываем кэш карточки при изменении фото или истории цен товара"""
+    bump_product_version(instance.product_id)
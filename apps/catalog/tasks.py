@@ -0,0 +1,25 @@
+from django.core.files.storage import default_storage
+
+from .models import ProductImage
+from .reservations import release_expired
+
+
+def generate_thumbnails(image_id, image_name):
+    """Фоновая задача: создает производные изображения фото товара"""
+    product_image = ProductImage.objects.filter(pk=image_id).first()
+    # Фото удалено или заменено после постановки задачи
+    if product_image is None or product_image.image.name != image_name:
+        return
+    product_image.generate_thumbnails()
+
+
+def delete_files(names):
+    """Фоновая задача: удаляет файлы из хранилища"""
+    for name in names:
+        if name and default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def release_expired_reservations():
+    """Фоновая задача: возвращает на склад товар из истекших резервов"""
+    return release_expired()
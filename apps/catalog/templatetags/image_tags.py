@@ -0,0 +1,38 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from apps.catalog.thumbnails import srcset, thumbnail_url
+
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail(image, width):
+    """Возвращает URL производного изображения нужной ширины"""
+    return thumbnail_url(image, int(width))
+
+
+@register.simple_tag
+def responsive_image(image, width, sizes=None, **attrs):
+    """Выводит <picture> с WebP и JPEG производными изображения товара.
+
+    width - ширина, под которую подбирается изображение по умолчанию (src),
+    sizes - значение атрибута sizes (по умолчанию {width}px)
+    """
+    attrs = flatatt(attrs)
+    webp_srcset = srcset(image, 'webp')
+    if not webp_srcset:
+        # Производные еще не готовы - выводим оригинал
+        return format_html('<img src="{}"{}>', image.url, attrs)
+
+    sizes = sizes or f'{width}px'
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}>'
+        '</picture>',
+        webp_srcset, sizes,
+        thumbnail_url(image, int(width)), srcset(image, 'jpg'), sizes, attrs
+    )
@@ -0,0 +1,26 @@
+"""Общие данные для тестов: категории, подкатегории и товары каталога"""
+from .models import Category, SubCategory, Product
+
+
+def create_subcategory(name='Подкатегория', slug='subcategory', category=None):
+    """Создает подкатегорию, а если категория не передана - и категорию"""
+    if category is None:
+        category = Category.objects.create(name='Категория', slug='category')
+    return SubCategory.objects.create(name=name, slug=slug, cat=category)
+
+
+def create_product(subcategory, name='Товар', slug='product', **fields):
+    """Создает товар подкатегории. Описание и цена по умолчанию, если не переданы"""
+    fields = {'description': 'Описание', 'price': 100, **fields}
+    return Product.objects.create(name=name, slug=slug, subcat=subcategory, **fields)
+
+
+def create_products(subcategory, count, **fields):
+    """Создает товары "Товар 0", "Товар 1"... со slug product-0, product-1...
+
+    Цены по умолчанию 100, 101... - у каждого товара своя
+    """
+    return [
+        create_product(subcategory, f'Товар {i}', f'product-{i}', **{'price': 100 + i, **fields})
+        for i in range(count)
+    ]
@@ -1,3 +1,750 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from apps.tasks.models import Task
+from apps.tasks.queue import claim_task, run_task
+
+from . import reservations
+from .cache import get_category_tree, _local_category_tree
+from .feeds import CatalogImporter, integer_range, make_slug
+from .models import Category, SubCategory, Product, PriceHistory, ProductImage
+from .pagination import decode_cursor, encode_cursor, paginate_by_cursor
+from .price_history import (compact_price_history, ensure_partitions, month_start, next_month,
+                            partition_name, PARTITIONS_SQL)
+from .testing import create_subcategory, create_product, create_products
+from .thumbnails import srcset, thumbnail_names, thumbnail_url
+
+
+class BulkRepriceTests(TestCase):
+    """Пакетное изменение цен товаров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_products(create_subcategory(), 10, price=200)
+
+    def prices(self):
+        return dict(Product.objects.values_list('pk', 'price'))
+
+    def test_mapping_reprices_and_writes_history(self):
+        first, second, third = self.products[:3]
+
+        changed = Product.objects.bulk_reprice({first.pk: Decimal('150'), second.pk: Decimal('250'),
+                                                third.pk: Decimal('200')})
+
+        # Цена третьего товара не изменилась - ни UPDATE, ни записи истории
+        self.assertEqual(sorted(changed), sorted([first.pk, second.pk]))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.price, first.old_price, first.discount_percent),
+                         (Decimal('150'), Decimal('200'), 25))
+        self.assertEqual((second.price, second.old_price, second.discount_percent),
+                         (Decimal('250'), None, 0))
+        self.assertEqual(sorted(PriceHistory.objects.values_list('product_id', 'price')),
+                         sorted([(first.pk, Decimal('200')), (second.pk, Decimal('200'))]))
+
+    def test_expression_reprices_queryset(self):
+        queryset = Product.objects.filter(pk__in=[p.pk for p in self.products[:5]])
+
+        changed = queryset.bulk_reprice(F('price') * Decimal('0.9'))
+
+        self.assertEqual(len(changed), 5)
+        prices = self.prices()
+        self.assertEqual({prices[p.pk] for p in self.products[:5]}, {Decimal('180')})
+        self.assertEqual({prices[p.pk] for p in self.products[5:]}, {Decimal('200')})
+        self.assertEqual(PriceHistory.objects.count(), 5)
+
+    def test_query_count_does_not_depend_on_products_count(self):
+        with CaptureQueriesContext(connection) as few:
+            Product.objects.bulk_reprice({self.products[0].pk: Decimal('150')})
+        with CaptureQueriesContext(connection) as many:
+            Product.objects.bulk_reprice({p.pk: Decimal('120') for p in self.products})
+
+        self.assertEqual(len(few), len(many))
+
+    def test_discount_rounding_matches_save(self):
+        """Скидка 0,5% округляется одинаково в save() и в bulk_reprice"""
+        saved, repriced = self.products[:2]
+        saved.price = Decimal('199')
+        saved.save()
+        Product.objects.bulk_reprice({repriced.pk: Decimal('199')})
+
+        repriced.refresh_from_db()
+        self.assertEqual(saved.discount_percent, 1)
+        self.assertEqual(repriced.discount_percent, saved.discount_percent)
+
+    def test_refresh_from_db_updates_loaded_price(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        Product.objects.filter(pk=product.pk).bulk_reprice({product.pk: Decimal('150')})
+        product.refresh_from_db()
+
+        product.price = Decimal('100')
+        product.save()
+
+        # В историю попала цена из БД на момент изменения, а не цена первой загрузки
+        self.assertEqual(list(PriceHistory.objects.order_by('pk').values_list('price', flat=True)),
+                         [Decimal('200'), Decimal('150')])
+        self.assertEqual(product.old_price, Decimal('150'))
+
+
+class ProductStockSaveTests(TestCase):
+    """Сохранение товара не затирает остаток, измененный резервами"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_subcategory(), stock_quantity=10)
+
+    def stock(self):
+        return Product.objects.values_list('stock_quantity', flat=True).get(pk=self.product.pk)
+
+    def test_full_save_keeps_reserved_stock(self):
+        product = Product.objects.get(pk=self.product.pk)
+        # Пока товар открыт в админке, покупатель положил 3 штуки в корзину
+        reservations.reserve('session:buyer', product, 3)
+
+        product.name = 'Новое название'
+        product.save()
+
+        self.assertEqual(self.stock(), 7)
+        self.assertEqual(Product.objects.get(pk=product.pk).name, 'Новое название')
+
+    def test_stock_change_is_applied_as_difference(self):
+        product = Product.objects.get(pk=self.product.pk)
+        reservations.reserve('session:buyer', product, 3)
+
+        product.stock_quantity += 5
+        product.save()
+
+        self.assertEqual(self.stock(), 12)
+        reservations.release('session:buyer', product)
+        self.assertEqual(self.stock(), 15)
+
+
+class CatalogImporterTests(TestCase):
+    """Загрузка каталога из файла"""
+
+    def row(self, category, subcategory, name, price, **fields):
+        return {'category': category, 'subcategory': subcategory, 'name': name,
+                'price': price, 'description': 'Описание', **fields}
+
+    def run_import(self, rows, batch_size=2):
+        errors = []
+        importer = CatalogImporter(batch_size, on_error=errors.append)
+        stats = importer.run(enumerate(rows, start=2))
+        return stats, errors
+
+    def test_same_subcategory_name_in_different_categories(self):
+        self.run_import([
+            self.row('Ноутбуки', 'Аксессуары', 'Сумка для ноутбука', '1000'),
+            self.row('Смартфоны', 'Аксессуары', 'Чехол для смартфона', '500'),
+            self.row('Смартфоны', 'Аксессуары', 'Стекло для смартфона', '300'),
+        ])
+
+        subcategories = SubCategory.objects.filter(name='Аксессуары')
+        self.assertEqual(subcategories.count(), 2)
+        self.assertEqual(
+            {subcat.cat.name: subcat.products.count() for subcat in subcategories},
+            {'Ноутбуки': 1, 'Смартфоны': 2}
+        )
+
+    def test_existing_subcategory_is_reused_and_not_moved(self):
+        category = Category.objects.create(name='Смартфоны', slug=make_slug(Category, 'Смартфоны'))
+        subcategory = SubCategory.objects.create(name='Аксессуары', slug='aksessuary', cat=category)
+
+        self.run_import([
+            self.row('Смартфоны', 'Аксессуары', 'Чехол для смартфона', '500'),
+            self.row('Ноутбуки', 'Аксессуары', 'Сумка для ноутбука', '1000'),
+        ])
+
+        subcategory.refresh_from_db()
+        self.assertEqual(subcategory.cat, category)
+        self.assertEqual(Product.objects.get(name='Чехол для смартфона').subcat, subcategory)
+        self.assertNotEqual(Product.objects.get(name='Сумка для ноутбука').subcat, subcategory)
+
+    def test_reimport_updates_products_and_writes_history(self):
+        rows = [self.row('Смартфоны', 'Телефоны', f'Телефон {i}', '1000', stock_quantity='5')
+                for i in range(3)]
+        stats, _ = self.run_import(rows)
+        self.assertEqual(stats['created'], 3)
+
+        rows[0]['price'] = '800'
+        stats, _ = self.run_import(rows)
+
+        self.assertEqual((stats['created'], stats['updated'], stats['repriced']), (0, 3, 1))
+        product = Product.objects.get(name='Телефон 0')
+        self.assertEqual((product.price, product.old_price, product.discount_percent),
+                         (Decimal('800'), Decimal('1000'), 20))
+        self.assertEqual(list(PriceHistory.objects.values_list('product_id', 'price')),
+                         [(product.pk, Decimal('1000'))])
+
+    def test_reimport_keeps_reserved_stock_off_sale(self):
+        row = self.row('Смартфоны', 'Телефоны', 'Телефон', '1000', stock_quantity='10')
+        self.run_import([row])
+        product = Product.objects.get()
+        reservations.reserve('session:buyer', product, 3)
+
+        # В файле снова физический остаток: 10 штук, 3 из них в корзине покупателя
+        self.run_import([row])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 7)
+
+        reservations.release('session:buyer', product)
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 10)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        stats, errors = self.run_import([
+            self.row('Смартфоны', 'Телефоны', 'Телефон', 'дорого'),
+            self.row('Смартфоны', 'Телефоны', '', '100'),
+            self.row('Смартфоны', 'Телефоны', 'Телефон 2', '100'),
+        ])
+
+        self.assertEqual((stats['created'], stats['skipped']), (1, 2))
+        self.assertEqual(errors, ['Строка 2: некорректное число',
+                                  'Строка 3: не заполнено поле name'])
+
+    def test_zero_from_json_is_a_value_and_none_is_empty(self):
+        stats, errors = self.run_import([
+            self.row('Смартфоны', 'Телефоны', 'Подарок', 0, stock_quantity=0, sku=0),
+            self.row('Смартфоны', 'Телефоны', 'Телефон', None),
+        ])
+
+        self.assertEqual((stats['created'], stats['skipped']), (1, 1))
+        self.assertEqual(errors, ['Строка 3: не заполнено поле price'])
+        self.assertEqual(Product.objects.values_list('price', 'stock_quantity', 'sku').get(),
+                         (Decimal('0'), 0, 0))
+
+    def test_values_not_fitting_columns_do_not_abort_batch(self):
+        _, max_sku = integer_range(Product, 'sku')
+        stats, errors = self.run_import([
+            self.row('Смартфоны', 'Телефоны', 'Телефон 1', '100', sku='-1'),
+            self.row('Смартфоны', 'Телефоны', 'Телефон 2', '100', sku=str(max_sku + 1)),
+            self.row('Смартфоны', 'Телефоны', 'Телефон 3', '100', slug='s' * 101),
+            self.row('Смартфоны', 'Телефоны', 'Телефон 4', '100000000'),
+            self.row('Смартфоны', 'Телефоны', 'Телефон 5', 'NaN'),
+            self.row('Смартфоны', 'Телефоны', 'Т' * 101, '100'),
+            self.row('Смартфоны', 'Телефоны', 'Телефон 7', '100', sku=str(max_sku)),
+        ], batch_size=10)
+
+        self.assertEqual((stats['created'], stats['skipped']), (1, 6))
+        self.assertEqual(errors, [
+            'Строка 2: отрицательное число',
+            'Строка 3: слишком большое значение поля sku',
+            'Строка 4: слишком длинный slug',
+            'Строка 5: слишком большая цена',
+            'Строка 6: некорректное число',
+            'Строка 7: слишком длинное название',
+        ])
+        self.assertEqual(Product.objects.get().name, 'Телефон 7')
+
+
+class PriceHistoryCompactionTests(TestCase):
+    """Прореживание и секционирование истории цен"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subcategory = create_subcategory()
+        cls.product = create_product(cls.subcategory)
+
+    def add_history(self, product, *entries):
+        history = PriceHistory.objects.bulk_create(
+            PriceHistory(product=product, price=price) for _, price in entries
+        )
+        # changed_at заполняется при создании (auto_now_add) - задаем дату отдельно
+        for entry, (changed_at, _) in zip(history, entries):
+            PriceHistory.objects.filter(pk=entry.pk).update(changed_at=changed_at)
+        return history
+
+    def test_keeps_last_entry_of_month_and_previous_price(self):
+        first = month_start(timezone.now() - timedelta(days=200))
+        second = next_month(first)
+        day = timedelta(days=1)
+        history = self.add_history(
+            self.product,
+            (first, 150), (first + day, 140), (first + 2 * day, 130), (first + 3 * day, 120),
+            # Последняя цена, отличная от текущей (100), показывается как старая
+            (second, 110), (second + day, 100), (second + 2 * day, 100),
+            # Свежая история не прореживается
+            (timezone.now() - day, 100), (timezone.now(), 100),
+        )
+
+        deleted = compact_price_history(batch_size=2)
+
+        self.assertEqual(deleted, 4)
+        kept = [history[i].pk for i in (3, 4, 6, 7, 8)]
+        self.assertEqual(sorted(PriceHistory.objects.values_list('pk', flat=True)), sorted(kept))
+
+    def test_products_are_compacted_independently(self):
+        other = create_product(self.subcategory, 'Товар 2', 'product-2')
+        start = month_start(timezone.now() - timedelta(days=200))
+        for product in (self.product, other):
+            self.add_history(product, *[(start + timedelta(hours=i), 100) for i in range(5)])
+
+        self.assertEqual(compact_price_history(batch_size=3), 8)
+        self.assertEqual(sorted(PriceHistory.objects.values_list('product_id', flat=True)),
+                         sorted([self.product.pk, other.pk]))
+
+    def test_nothing_to_compact(self):
+        self.add_history(self.product, (timezone.now(), 120))
+
+        self.assertEqual(compact_price_history(), 0)
+        self.assertEqual(PriceHistory.objects.count(), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Секционирование есть только в PostgreSQL')
+    def test_ensure_partitions_moves_rows_from_default_partition(self):
+        table = PriceHistory._meta.db_table
+        # Месяц, для которого секции еще нет: запись попадает в секцию по умолчанию
+        start = month_start(timezone.now())
+        for _ in range(5):
+            start = next_month(start)
+        [entry] = self.add_history(self.product, (start + timedelta(days=1), 90))
+
+        created = ensure_partitions(months_ahead=5)
+
+        self.assertIn(partition_name(start), created)
+        self.assertEqual(ensure_partitions(months_ahead=5), [])
+        with connection.cursor() as cursor:
+            cursor.execute(PARTITIONS_SQL, [table])
+            partitions = {name for name, in cursor.fetchall()}
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {table} WHERE id = %s',
+                           [entry.pk])
+            [(partition,)] = cursor.fetchall()
+        self.assertTrue(set(created) <= partitions)
+        self.assertEqual(partition, partition_name(start))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск есть только в PostgreSQL')
+class SearchProductsTests(TestCase):
+    """Полнотекстовый поиск товаров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subcategory = create_subcategory()
+        cls.in_name = create_product(cls.subcategory, 'Ноутбук игровой', 'noutbuk',
+                                     description='Мощная видеокарта', sku=123456)
+        cls.in_description = create_product(cls.subcategory, 'Сумка', 'sumka',
+                                            description='Подходит для ноутбуков до 15 дюймов')
+        create_product(cls.subcategory, 'Смартфон', 'smartfon', description='Большой экран')
+
+    def search(self, query, **params):
+        return self.client.get(reverse('catalog:search'), {'q': query, **params})
+
+    def test_name_match_ranks_above_description_match(self):
+        response = self.search('ноутбуки')
+
+        # Запрос приводится к основе слова: "ноутбуки" находит "Ноутбук" и "ноутбуков"
+        self.assertEqual(list(response.context['products']), [self.in_name, self.in_description])
+
+    def test_search_by_sku(self):
+        response = self.search('123456')
+
+        self.assertEqual(list(response.context['products']), [self.in_name])
+
+    def test_empty_query_finds_nothing(self):
+        response = self.search('  ')
+
+        self.assertEqual(list(response.context['products']), [])
+        self.assertEqual(response.context['title'], 'Поиск')
+
+    def test_pages_do_not_overlap(self):
+        for i in range(25):
+            create_product(self.subcategory, f'Планшет {i}', f'planshet-{i}')
+
+        first = [product.pk for product in self.search('планшет').context['products']]
+        second = [product.pk for product in self.search('планшет', page=2).context['products']]
+
+        # У всех товаров одинаковый ранг - порядок страниц задает id
+        self.assertEqual((len(first), len(second)), (20, 5))
+        self.assertEqual(first + second, sorted(first + second))
+
+
+class AutocompleteTests(TestCase):
+    """Подсказки поиска"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subcategory = create_subcategory('Ноутбуки', 'noutbuki')
+        cls.product = create_product(cls.subcategory, 'Ноутбук игровой', 'noutbuk-igrovoj',
+                                     price=1000)
+
+    def setUp(self):
+        cache.clear()
+
+    def autocomplete(self, query, **params):
+        return self.client.get(reverse('catalog:autocomplete'), {'q': query, **params})
+
+    def test_short_query_is_answered_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.autocomplete(' н ')
+
+        self.assertEqual(response.json(), {'products': [], 'subcategories': []})
+
+    def test_response_is_cacheable(self):
+        response = self.autocomplete('н')
+
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+    def test_post_is_not_allowed(self):
+        response = self.client.post(reverse('catalog:autocomplete'), {'q': 'ноутбук'})
+
+        self.assertEqual(response.status_code, 405)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Триграммный поиск есть только в PostgreSQL')
+    def test_typo_and_transliteration(self):
+        for query in ('нотбук', 'noutbuk'):
+            with self.subTest(query=query):
+                data = self.autocomplete(query).json()
+                self.assertEqual(data['products'][0], {
+                    'name': 'Ноутбук игровой',
+                    'url': self.product.get_absolute_url(),
+                    'price': '1000.00',
+                })
+
+        data = self.autocomplete('ноутбуки').json()
+        self.assertEqual(data['subcategories'],
+                         [{'name': 'Ноутбуки', 'url': self.subcategory.get_absolute_url()}])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Триграммный поиск есть только в PostgreSQL')
+    def test_normalized_query_is_served_from_cache(self):
+        first = self.autocomplete('Ноутбук').json()
+
+        with self.assertNumQueries(0):
+            second = self.autocomplete('  ноутбук ').json()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.autocomplete('ноутбук', limit=100).json()['products']), 1)
+
+
+class FacetFilterTests(TestCase):
+    """Фасетные фильтры списка товаров подкатегории"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subcategory = create_subcategory('Смартфоны', 'smartfony')
+        products = [
+            # (название, бренд, цена, остаток, скидка)
+            ('Apple 1', 'Apple', 5000, 5, 0),
+            ('Apple 2', 'Apple', 20000, 0, 10),
+            ('Samsung 1', 'Samsung', 20000, 3, 10),
+            ('Samsung 2', 'Samsung', 70000, 0, 0),
+            ('Xiaomi 1', 'Xiaomi', 5000, 2, 0),
+        ]
+        cls.products = {
+            name: create_product(cls.subcategory, name, make_slug(Product, name), brand=brand,
+                                 price=price, stock_quantity=stock, discount_percent=discount)
+            for name, brand, price, stock, discount in products
+        }
+        # Товары других подкатегорий не учитываются
+        create_product(create_subcategory('Планшеты', 'planshety', cls.subcategory.cat),
+                       'Apple 3', 'apple-3', brand='Apple', stock_quantity=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **params):
+        url = reverse('catalog:products', kwargs={'subcat_slug': self.subcategory.slug})
+        return self.client.get(url, params)
+
+    def counts(self, facets):
+        return {
+            'price': [item['count'] for item in facets['price']],
+            'brand': {item['value']: item['count'] for item in facets['brand']},
+            'in_stock': facets['in_stock']['count'],
+            'discount': facets['discount']['count'],
+        }
+
+    def test_counts_ignore_own_facet_only(self):
+        response = self.get(brand='Apple', in_stock='1')
+
+        self.assertEqual([product.name for product in response.context['products']], ['Apple 1'])
+        self.assertEqual(self.counts(response.context['facets']), {
+            # Цены и скидки - среди товаров Apple в наличии
+            'price': [1, 0, 0, 0],
+            # Бренды - среди всех товаров в наличии
+            'brand': {'Apple': 1, 'Samsung': 1, 'Xiaomi': 1},
+            # Наличие - среди всех товаров Apple
+            'in_stock': 1,
+            'discount': 0,
+        })
+
+    def test_counts_match_filtered_queryset(self):
+        params = {'price': ['0-10000', '10000-30000'], 'discount': '1'}
+        facets = self.get(**params).context['facets']
+
+        products = Product.objects.filter(subcat=self.subcategory, price__lt=30000)
+        for item in facets['brand']:
+            self.assertEqual(item['count'],
+                             products.filter(brand=item['value'], discount_percent__gt=0).count())
+        self.assertEqual(facets['in_stock']['count'],
+                         products.filter(discount_percent__gt=0, stock_quantity__gt=0).count())
+        self.assertEqual(facets['discount']['count'], products.filter(discount_percent__gt=0).count())
+
+    def test_selected_brand_without_matches_is_kept(self):
+        response = self.get(brand='Xiaomi', discount='1')
+
+        self.assertEqual(list(response.context['products']), [])
+        self.assertEqual(response.context['facets']['brand'], [
+            {'value': 'Apple', 'count': 1, 'selected': False},
+            {'value': 'Samsung', 'count': 1, 'selected': False},
+            {'value': 'Xiaomi', 'count': 0, 'selected': True},
+        ])
+
+    def test_unknown_price_range_is_ignored(self):
+        response = self.get(price='1-2')
+
+        self.assertEqual(response.context['facets']['price'][0]['selected'], False)
+        self.assertEqual(response.context['get_params'], '')
+
+
+class CursorPaginationTests(TestCase):
+    """Курсорная пагинация списков товаров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subcategory = create_subcategory()
+        # Равные цены проверяют порядок по id внутри одного значения
+        cls.products = [
+            create_product(cls.subcategory, f'Товар {i}', f'product-{i}', price=price)
+            for i, price in enumerate([300, 100, 200, 200, 100, 300, 200])
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, sort_by, direction, page_size=2):
+        """Проходит все страницы вперед, возвращает список страниц (списки id)"""
+        queryset = Product.objects.all()
+        pages, cursor = [], None
+        while True:
+            page = paginate_by_cursor(queryset, sort_by, direction, cursor, page_size)
+            pages.append([product.pk for product in page])
+            if not page.has_next():
+                return pages, page
+            cursor = decode_cursor(page.next_cursor)
+
+    def test_pages_cover_listing_in_order(self):
+        for sort_by in ('price', 'name', 'created_at'):
+            for direction in ('asc', 'desc'):
+                with self.subTest(sort_by=sort_by, direction=direction):
+                    ordering = (f'-{sort_by}', '-pk') if direction == 'desc' else (sort_by, 'pk')
+                    expected = list(Product.objects.order_by(*ordering).values_list('pk', flat=True))
+
+                    pages, _ = self.walk(sort_by, direction)
+
+                    self.assertEqual(sum(pages, []), expected)
+                    self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+
+    def test_last_page(self):
+        pages, last = self.walk('price', 'asc', page_size=7)
+
+        self.assertEqual(len(pages), 1)
+        self.assertFalse(last.has_next())
+        self.assertFalse(last.has_previous())
+        self.assertFalse(last.has_other_pages())
+
+    def test_previous_cursor_returns_previous_page(self):
+        queryset = Product.objects.all()
+        first = paginate_by_cursor(queryset, 'price', 'desc', None, 3)
+        second = paginate_by_cursor(queryset, 'price', 'desc', decode_cursor(first.next_cursor), 3)
+
+        back = paginate_by_cursor(queryset, 'price', 'desc',
+                                  decode_cursor(second.previous_cursor), 3)
+
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor('price', 'asc', Decimal('199.90'), 7)
+
+        self.assertEqual(decode_cursor(cursor),
+                         {'s': 'price', 'd': 'asc', 'v': '199.90', 'id': 7, 'r': False})
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = encode_cursor('price', 'asc', '100', 1)
+        value, signature = cursor.rsplit(':', 1)
+
+        self.assertIsNone(decode_cursor(f'{value}:{signature[::-1]}'))
+        self.assertIsNone(decode_cursor('garbage'))
+
+    def test_view_starts_over_on_invalid_cursor(self):
+        url = reverse('catalog:products', kwargs={'subcat_slug': self.subcategory.slug})
+        first = self.client.get(url, {'sort': 'price'}).context['products']
+        # Курсор другой сортировки не применяется
+        name_cursor = encode_cursor('name', 'asc', 'Товар 5', self.products[5].pk)
+
+        for cursor in ('garbage', name_cursor):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(url, {'sort': 'price', 'cursor': cursor})
+                self.assertEqual(list(response.context['products']), list(first))
+                self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+
+class CategoryTreeCacheTests(TestCase):
+    """Кэш дерева категорий и его сброс"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subcategory = create_subcategory('Смартфоны', 'smartfony')
+        cls.product = create_product(cls.subcategory)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tree_is_built_once(self):
+        with self.assertNumQueries(2):
+            get_category_tree()
+        with self.assertNumQueries(0):
+            get_category_tree()
+
+    def test_other_process_reads_tree_from_cache(self):
+        tree = get_category_tree()
+        # Другой процесс: своей копии дерева в памяти у него нет
+        _local_category_tree.update(version=None, tree=None)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_category_tree(), tree)
+
+    def test_renaming_subcategory_invalidates_tree(self):
+        get_category_tree()
+
+        self.subcategory.name = 'Телефоны'
+        self.subcategory.save()
+
+        self.assertEqual(get_category_tree()['by_subcat_slug']['smartfony']['name'], 'Телефоны')
+
+    def test_deleting_category_invalidates_tree(self):
+        category = Category.objects.create(name='Пустая', slug='empty')
+        response = self.client.get(reverse('catalog:category', kwargs={'cat_slug': 'empty'}))
+        self.assertEqual(response.status_code, 200)
+
+        category.delete()
+
+        self.assertNotIn('empty', get_category_tree()['by_cat_slug'])
+        response = self.client.get(reverse('catalog:category', kwargs={'cat_slug': 'empty'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_product_list_takes_subcategory_from_tree(self):
+        get_category_tree()
+        url = reverse('catalog:products', kwargs={'subcat_slug': 'smartfony'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(list(response.context['products']), [self.product])
+        self.assertFalse([query for query in queries.captured_queries
+                          if SubCategory._meta.db_table in query['sql']])
+        response = self.client.get(reverse('catalog:products', kwargs={'subcat_slug': 'unknown'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_product_breadcrumbs_come_from_tree(self):
+        response = self.client.get(self.product.get_absolute_url())
+
+        self.assertEqual([crumb['name'] for crumb in response.context['breadcrumbs']],
+                         ['Главная', 'Каталог', 'Категория', 'Смартфоны', 'Товар'])
+
+
+class ThumbnailTests(TestCase):
+    """Производные изображения фото товара"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_subcategory())
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def upload(self, width, height, name='photo.png'):
+        buffer = BytesIO()
+        Image.new('RGBA', (width, height), (255, 0, 0, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def run_tasks(self):
+        """Выполняет все задачи из очереди, как рабочий процесс run_workers"""
+        while (task := claim_task()) is not None:
+            self.assertTrue(run_task(task), task.last_error)
+
+    def create_image(self, width=800, height=400):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=self.upload(width, height))
+        self.run_tasks()
+        image.refresh_from_db()
+        return image
+
+    def test_derivatives_are_created_in_background(self):
+        image = self.create_image()
+
+        self.assertEqual((image.thumbnails, image.thumbnails_version), ([64, 240, 600], 1))
+        for name in thumbnail_names(image.image.name, image.thumbnails, 1):
+            self.assertTrue(default_storage.exists(name), name)
+        self.assertTrue(thumbnail_url(image.image, 300, 'webp').endswith('_600w_v1.webp'))
+        self.assertTrue(thumbnail_url(image.image, 2000).endswith('_600w_v1.jpg'))
+
+    def test_small_original_keeps_its_width(self):
+        image = self.create_image(width=40, height=20)
+
+        self.assertEqual(image.thumbnails, [40])
+        self.assertEqual(srcset(image.image).rsplit(' ', 1)[1], '40w')
+
+    def test_regeneration_deletes_stale_files_after_commit(self):
+        image = self.create_image()
+        stale = thumbnail_names(image.image.name, image.thumbnails, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.generate_thumbnails()
+            # До фиксации страницы еще ссылаются на прежние файлы
+            self.assertFalse(Task.objects.filter(name='apps.catalog.tasks.delete_files').exists())
+        self.run_tasks()
+
+        image.refresh_from_db()
+        self.assertEqual(image.thumbnails_version, 2)
+        self.assertFalse(any(default_storage.exists(name) for name in stale))
+        self.assertTrue(all(default_storage.exists(name)
+                            for name in thumbnail_names(image.image.name, image.thumbnails, 2)))
+
+    def test_replacing_image_deletes_old_derivatives(self):
+        image = self.create_image()
+        stale = thumbnail_names(image.image.name, image.thumbnails, 1)
+
+        image.image = self.upload(300, 300, 'other.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.run_tasks()
+
+        image.refresh_from_db()
+        self.assertFalse(any(default_storage.exists(name) for name in stale))
+        self.assertEqual(image.thumbnails, [64, 240])
+
+    def test_deleting_image_removes_files_after_commit(self):
+        image = self.create_image()
+        names = [image.image.name, *thumbnail_names(image.image.name, image.thumbnails, 1)]
+
+        # Удаление откатилось - файлы на месте
+        with self.assertRaises(ValueError), transaction.atomic():
+            ProductImage.objects.get(pk=image.pk).delete()
+            raise ValueError
+        self.assertFalse(Task.objects.filter(name='apps.catalog.tasks.delete_files').exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.run_tasks()
+
+        self.assertFalse(any(default_storage.exists(name) for name in names))
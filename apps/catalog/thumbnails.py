@@ -0,0 +1,108 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+# Ширины производных изображений (px)
+THUMBNAIL_WIDTHS = (64, 240, 600, 1200)
+# Форматы производных: (расширение файла, формат Pillow)
+THUMBNAIL_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+THUMBNAIL_QUALITY = 82
+
+
+def thumbnail_name(name, width, extension, version=0):
+    """Функция формирует путь производного изображения рядом с оригиналом.
+
+    version - номер пересоздания производных: новые файлы получают новые имена
+    и не перезаписывают те, на которые ссылаются страницы
+    """
+    root = os.path.splitext(name)[0]
+    suffix = f"_v{version}" if version else ""
+    return f"{root}_{width}w{suffix}.{extension}"
+
+
+def _to_rgb(image):
+    """Переводит изображение в RGB, заливая прозрачный фон белым (для JPEG)"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def create_thumbnails(image_file, version=0):
+    """Создает производные изображения всех размеров и форматов.
+
+    Возвращает список созданных ширин. Ширины больше оригинала пропускаются,
+    чтобы не увеличивать изображение; оригинал уже самой маленькой ширины
+    сохраняется в своем размере, и ширина производной - его настоящая ширина
+    """
+    storage = image_file.storage
+    with storage.open(image_file.name, 'rb') as file:
+        original = Image.open(file)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    widths = [width for width in THUMBNAIL_WIDTHS if width <= original.width]
+    if not widths:
+        # Дескриптор srcset должен совпадать с настоящей шириной файла
+        widths = [original.width]
+
+    for width in widths:
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.Resampling.LANCZOS)
+
+        for extension, image_format in THUMBNAIL_FORMATS:
+            image = resized if image_format == 'WEBP' else _to_rgb(resized)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+            buffer = BytesIO()
+            image.save(buffer, image_format, quality=THUMBNAIL_QUALITY, optimize=True)
+
+            path = thumbnail_name(image_file.name, width, extension, version)
+            # Файл этой версии мог остаться от прерванной попытки; на него никто
+            # не ссылается. Удаляем его, иначе storage добавит суффикс к имени
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(buffer.getvalue()))
+
+    return widths
+
+
+def thumbnail_names(name, widths, version=0):
+    """Возвращает пути всех производных изображения"""
+    return [
+        thumbnail_name(name, width, extension, version)
+        for width in widths
+        for extension, _ in THUMBNAIL_FORMATS
+    ]
+
+
+def thumbnail_url(image_file, width, extension='jpg'):
+    """Возвращает URL производной ближайшей ширины не меньше width или оригинала"""
+    widths = getattr(image_file.instance, 'thumbnails', None) or []
+    version = getattr(image_file.instance, 'thumbnails_version', 0)
+    for available in widths:
+        if available >= width:
+            return image_file.storage.url(
+                thumbnail_name(image_file.name, available, extension, version)
+            )
+    if widths:
+        return image_file.storage.url(
+            thumbnail_name(image_file.name, widths[-1], extension, version)
+        )
+    return image_file.url
+
+
+def srcset(image_file, extension='jpg'):
+    """Возвращает значение атрибута srcset по доступным производным"""
+    widths = getattr(image_file.instance, 'thumbnails', None) or []
+    version = getattr(image_file.instance, 'thumbnails_version', 0)
+    return ', '.join(
+        f"{image_file.storage.url(thumbnail_name(image_file.name, width, extension, version))} {width}w"
+        for width in widths
+    )
@@ -10,5 +10,7 @@ urlpatterns = [
     path('category/<slug:cat_slug>/', views.ShowCategory.as_view(), name='category'),
     path('products/<slug:subcat_slug>/', views.ShowProducts.as_view(), name='products'),
     path('product/<slug:product_slug>/', views.ShowProduct.as_view(), name='product'),
+    path('search/', views.SearchProducts.as_view(), name='search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
 
 ]
\ No newline at end of file
@@ -1,7 +1,12 @@
 import os
+import re
 from django.urls import reverse
 
 
+# Бренд - первое слово в названии, записанное латиницей (например, "Смартфон Apple iPhone")
+BRAND_RE = re.compile(r'\b([A-Za-z][A-Za-z0-9&\-]*)')
+
+
 def product_image_path(instance, filename):
     """Функция формирует путь для сохранения изображения товара"""
     # Получаем расширение файла
@@ -18,48 +23,38 @@ def product_image_path(instance, filename):
     return path
 
 
+def extract_brand(name):
+    """Функция определяет бренд по названию товара"""
+    match = BRAND_RE.search(name or '')
+    return match.group(1)[:50] if match else ''
+
+
 def get_breadcrumbs(request, view_name, obj=None):
-    """Функция для составления хлебных крошек"""
-    breadcrumbs = []
+    """Функция для составления хлебных крошек.
 
-    # Главная страница
-    breadcrumbs.append({
-        'name': 'Главная',
-        'url': reverse('home')
-    })
+    Для категории и подкатегории obj - узел дерева категорий (словарь),
+    для товара - объект Product. Названия и ссылки берутся из закэшированного дерева
+    """
+    # Импорт внутри функции: модуль cache импортирует модели, а модели - этот модуль
+    from .cache import get_category_tree
 
-    # Каталог
-    breadcrumbs.append({
-        'name': 'Каталог',
-        'url': reverse('catalog:categories')
-    })
+    tree = get_category_tree()
+    breadcrumbs = list(tree['base_breadcrumbs'])
 
     if view_name == 'catalog:category' and obj:
-        breadcrumbs.append({
-            'name': obj.name,
-            'url': obj.get_absolute_url()
-        })
+        breadcrumbs.append({'name': obj['name'], 'url': obj['url']})
     elif view_name == 'catalog:products' and obj:
-        breadcrumbs.append({
-            'name': obj.cat.name,
-            'url': obj.cat.get_absolute_url()
-        })
-        breadcrumbs.append({
-            'name': obj.name,
-            'url': obj.get_absolute_url()
-        })
+        category = tree['by_cat_slug'][obj['cat_slug']]
+        breadcrumbs.append({'name': category['name'], 'url': category['url']})
+        breadcrumbs.append({'name': obj['name'], 'url': obj['url']})
     elif view_name == 'catalog:product' and obj:
-        breadcrumbs.append({
-            'name': obj.subcat.cat.name,
-            'url': obj.subcat.cat.get_absolute_url()
-        })
-        breadcrumbs.append({
-            'name': obj.subcat.name,
-            'url': obj.subcat.get_absolute_url()
-        })
+        subcat = tree['by_subcat_id'][obj.subcat_id]
+        category = tree['by_cat_slug'][subcat['cat_slug']]
+        breadcrumbs.append({'name': category['name'], 'url': category['url']})
+        breadcrumbs.append({'name': subcat['name'], 'url': subcat['url']})
         breadcrumbs.append({
             'name': obj.name,
             'url': obj.get_absolute_url()
         })
 
-    return breadcrumbs
\ No newline at end of file
+    return breadcrumbs
@@ -1,18 +1,31 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.http import JsonResponse, Http404
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_GET
 from django.views.generic import ListView, DetailView
 
 from dns_django import settings
-from .models import Category, SubCategory, Product
+from .models import SubCategory, Product
+from .cache import get_category_tree
 from .utils import get_breadcrumbs
-from .mixins import SortableListViewMixin
+from .mixins import SortableListViewMixin, FacetFilterMixin, ProductCardCacheMixin
 
 
 class ShowCategories(ListView):
     """Класс представление формирует список категорий"""
-    model = Category
     template_name = 'catalog/categories.html'
     context_object_name = 'categories'
 
+    def get_queryset(self):
+        # Категории берутся из закэшированного дерева, а не из БД
+        return get_category_tree()['categories']
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Категории'
@@ -22,48 +35,92 @@ class ShowCategories(ListView):
 
 class ShowCategory(DetailView):
     """Класс представление формирует карточку категории (список подкатегорий)"""
-    model = Category
     template_name = 'catalog/category.html'
     slug_url_kwarg = 'cat_slug' # Переменная, которая передается в url
 
-    # def get_object(self, queryset=None):
-    #     return get_object_or_404(Category, slug=self.kwargs[self.slug_url_kwarg])
+    def get_object(self, queryset=None):
+        """Категория берется из закэшированного дерева категорий"""
+        category = get_category_tree()['by_cat_slug'].get(self.kwargs[self.slug_url_kwarg])
+        if category is None:
+            raise Http404('Категория не найдена')
+        return category
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['title'] = self.object.name
-        context['category'] = self.object.subcat.all()
+        context['title'] = self.object['name']
+        context['category'] = self.object['subcategories']
         context['breadcrumbs'] = get_breadcrumbs(self.request, 'catalog:category',
                                                  self.object)
         return context
 
 
-class ShowProducts(SortableListViewMixin, ListView):
+class ShowProducts(ProductCardCacheMixin, SortableListViewMixin, FacetFilterMixin, ListView):
     """Класс представление формирует список товаров"""
     model = Product
     template_name = 'catalog/products.html'
     context_object_name = 'products'
     paginate_by = 2
+    cursor_pagination = True
 
     def get_queryset(self):
+        # Получаем подкатегорию из закэшированного дерева категорий
+        self.subcategory = get_category_tree()['by_subcat_slug'].get(self.kwargs.get('subcat_slug'))
+        if self.subcategory is None:
+            raise Http404('Подкатегория не найдена')
+
         queryset = super().get_queryset()
-        # Возвращает товары выбранной подкатегории
-        queryset = queryset.filter(subcat__slug=self.kwargs.get('subcat_slug'))
-        return queryset
+        # Возвращает товары выбранной подкатегории: id уже известен, JOIN не нужен
+        queryset = queryset.filter(subcat_id=self.subcategory['id'])
+        # Применяем фильтры по цене, наличию, скидке и бренду
+        # Фото подгружаются в ProductCardCacheMixin только для некэшированных карточек
+        return self.apply_filters(queryset)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Получаем наименование подкатегории
-        subcategory_slug = self.kwargs.get('subcat_slug')
-        subcategory = SubCategory.objects.get(slug=subcategory_slug)
+        subcategory = self.subcategory
 
-        context['title'] = subcategory
+        context['title'] = subcategory['name']
         context['default_image'] = settings.DEFAULT_PRODUCT_IMAGE
         context['breadcrumbs'] = get_breadcrumbs(self.request, 'catalog:products',
                                                  subcategory)
         return context
 
 
+class SearchProducts(ProductCardCacheMixin, SortableListViewMixin, ListView):
+    """Класс представление формирует результаты полнотекстового поиска товаров"""
+    model = Product
+    template_name = 'catalog/search.html'
+    context_object_name = 'products'
+    paginate_by = 20
+    sort_fields = ('rank', 'name', 'price', 'created_at')
+    default_sort = 'rank'
+    default_direction = 'desc'
+
+    def get_search_query(self):
+        """Возвращает строку поиска из запроса"""
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        query = self.get_search_query()
+        if not query:
+            return Product.objects.none()
+
+        queryset = Product.objects.search(query)
+        ordering = self.get_ordering()
+        # Дополнительная сортировка по id делает порядок страниц стабильным
+        return queryset.order_by(ordering, 'pk')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.get_search_query()
+        context['title'] = f'Поиск: {query}' if query else 'Поиск'
+        context['search_query'] = query
+        context['get_params'] = urlencode({'q': query})
+        context['default_image'] = settings.DEFAULT_PRODUCT_IMAGE
+        context['breadcrumbs'] = get_breadcrumbs(self.request, 'catalog:search')
+        return context
+
+
 class ShowProduct(DetailView):
     """Класс представление формирует карточку продукта"""
     model = Product
@@ -75,4 +132,62 @@ class ShowProduct(DetailView):
         context['default_image'] = settings.DEFAULT_PRODUCT_IMAGE
         context['breadcrumbs'] = get_breadcrumbs(self.request, 'catalog:product',
                                                  self.object)
-        return context
\ No newline at end of file
+        return context
+
+
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_DEFAULT_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+AUTOCOMPLETE_CACHE_TIMEOUT = 60 * 5
+
+
+@require_GET
+@cache_control(public=True, max_age=AUTOCOMPLETE_CACHE_TIMEOUT)
+def autocomplete(request):
+    """Подсказки поиска: товары и подкатегории по началу запроса (JSON)"""
+    # Нормализуем запрос, чтобы "Айфон " и "айфон" попадали в один ключ кэша
+    query = ' '.join(request.GET.get('q', '').lower().split())
+    try:
+        limit = int(request.GET.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT))
+    except ValueError:
+        limit = AUTOCOMPLETE_DEFAULT_LIMIT
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+
+    if len(query) < AUTOCOMPLETE_MIN_LENGTH:
+        return JsonResponse({'products': [], 'subcategories': []})
+
+    cache_key = 'catalog:autocomplete:{}:{}'.format(
+        limit, hashlib.md5(query.encode()).hexdigest()
+    )
+    data = cache.get(cache_key)
+    if data is None:
+        products = Product.objects.autocomplete(query).order_by(
+            '-similarity', 'name'
+        ).values('name', 'slug', 'price')[:limit]
+
+        subcategories = SubCategory.objects.filter(
+            name__trigram_word_similar=query
+        ).annotate(
+            similarity=TrigramWordSimilarity(query, 'name')
+        ).order_by('-similarity', 'name').values('name', 'slug')[:limit]
+
+        data = {
+            'products': [
+                {
+                    'name': product['name'],
+                    'url': reverse('catalog:product', kwargs={'product_slug': product['slug']}),
+                    'price': str(product['price']),
+                }
+                for product in products
+            ],
+            'subcategories': [
+                {
+                    'name': subcat['name'],
+                    'url': reverse('catalog:products', kwargs={'subcat_slug': subcat['slug']}),
+                }
+                for subcat in subcategories
+            ],
+        }
+        cache.set(cache_key, data, AUTOCOMPLETE_CACHE_TIMEOUT)
+
+    return JsonResponse(data)
@@ -0,0 +1,20 @@
+from django.contrib import admin
+
+from .models import Order, OrderItem
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    fields = ('product', 'product_name', 'price', 'quantity')
+    raw_id_fields = ('product', )
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'total_quantity', 'total_price', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('id', 'user__username', 'user__email')
+    readonly_fields = ('idempotency_key', 'created_at', 'updated_at')
+    raw_id_fields = ('user', )
+    inlines = (OrderItemInline, )
@@ -0,0 +1,70 @@
+from django.db import IntegrityError, transaction
+
+from apps.catalog import reservations
+from .models import Order, OrderItem
+
+
+class EmptyCart(ValueError):
+    """Попытка оформить заказ из пустой корзины"""
+    def __init__(self):
+        super().__init__('Корзина пуста')
+
+
+def checkout(cart_manager, idempotency_key):
+    """Оформляет заказ из корзины и возвращает его.
+
+    Заказ и его позиции создаются, товар списывается со склада, а корзина
+    очищается в одной транзакции; число запросов не зависит от размера корзины.
+    Повторный вызов с тем же ключом возвращает уже созданный заказ
+    """
+    try:
+        return _checkout(cart_manager, idempotency_key)
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел создать заказ первым
+        order = Order.objects.filter(idempotency_key=idempotency_key).first()
+        if order is None:
+            raise
+        return order
+
+
+@transaction.atomic
+def _checkout(cart_manager, idempotency_key):
+    order = Order.objects.filter(idempotency_key=idempotency_key).first()
+    if order is not None:
+        return order
+
+    items = list(cart_manager.get_items())
+    if not items:
+        raise EmptyCart()
+
+    request = cart_manager.request
+    # Заказ создается до списания товара: повторный запрос с тем же ключом
+    # ждет на уникальном индексе и получает IntegrityError, ничего не списав
+    order = Order.objects.create(
+        user=request.user if request.user.is_authenticated else None,
+        session_key=request.session.session_key,
+        idempotency_key=idempotency_key,
+        total_price=sum(item.get_cost() for item in items),
+        total_quantity=sum(item.quantity for item in items)
+    )
+
+    # Зарезервированный товар уже снят со склада - докупаем только то, что не покрыто
+    # резервом (например, резерв истек), а лишний резерв возвращаем
+    holder = reservations.get_holder(request, create=False)
+    held = reservations.consume(holder) if holder is not None else {}
+    needed = {item.product_id: item.quantity for item in items}
+    reservations.take_stock({
+        product_id: quantity - held.get(product_id, 0) for product_id, quantity in needed.items()
+    })
+    reservations.return_stock({
+        product_id: quantity - needed.get(product_id, 0) for product_id, quantity in held.items()
+    })
+
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=item.product_id, product_name=item.product.name,
+                  price=item.price, quantity=item.quantity)
+        for item in items
+    ])
+
+    cart_manager.clear()
+    return order
@@ -0,0 +1,100 @@
+from django.db import models
+from django.conf import settings
+
+from apps.catalog.models import Product
+
+
+class Order(models.Model):
+    """Модель заказа"""
+    STATUS_NEW = 'new'
+    STATUS_PAID = 'paid'
+    STATUS_SHIPPED = 'shipped'
+    STATUS_CANCELED = 'canceled'
+    STATUS_CHOICES = (
+        (STATUS_NEW, 'Новый'),
+        (STATUS_PAID, 'Оплачен'),
+        (STATUS_SHIPPED, 'Отправлен'),
+        (STATUS_CANCELED, 'Отменен'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='orders',
+        verbose_name='Пользователь',
+        null=True,
+        blank=True
+    )
+    session_key = models.CharField(
+        max_length=40,
+        verbose_name='Ключ сессии',
+        null=True,
+        blank=True
+    )
+    # Ключ идемпотентности: повторная отправка формы с тем же ключом не создает второй заказ
+    idempotency_key = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Ключ идемпотентности'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_NEW,
+        verbose_name='Статус'
+    )
+    total_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        verbose_name='Сумма заказа'
+    )
+    total_quantity = models.PositiveIntegerField(verbose_name='Количество товаров')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Заказ'
+        verbose_name_plural = 'Заказы'
+        ordering = ('-created_at', )
+
+    def __str__(self):
+        return f'Заказ №{self.pk}'
+
+
+class OrderItem(models.Model):
+    """Модель товара в заказе.
+
+    Название и цена копируются из корзины при оформлении, чтобы заказ
+    не менялся вместе с каталогом
+    """
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name='Заказ'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        related_name='order_items',
+        verbose_name='Товар',
+        null=True
+    )
+    product_name = models.CharField(max_length=100, verbose_name='Название товара')
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name='Цена'
+    )
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Товар в заказе'
+        verbose_name_plural = 'Товары в заказе'
+
+    def __str__(self):
+        return f'{self.product_name} x {self.quantity}'
+
+    def get_cost(self):
+        """Возвращает стоимость позиции"""
+        return self.price * self.quantity
@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.cart.models import CartItem
+from apps.catalog.models import Product, StockReservation
+from apps.catalog.testing import create_subcategory, create_products
+from .models import Order
+
+
+class CheckoutTests(TestCase):
+    """Оформление заказа из корзины"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_products(create_subcategory(), 10, stock_quantity=10)
+        cls.user = get_user_model().objects.create_user(username='user', email='user@example.com',
+                                                        password='Pa55-word!')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fill_cart(self, products, quantity=2):
+        for product in products:
+            self.client.post(reverse('cart:add', args=[product.pk]), {'quantity': quantity})
+
+    def order(self, key):
+        return self.client.post(reverse('orders:create'), {'idempotency_key': key})
+
+    def test_checkout_creates_order_and_clears_cart(self):
+        self.fill_cart(self.products[:3])
+
+        response = self.order('key-1')
+
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('orders:detail', args=[order.pk]))
+        self.assertEqual(order.total_quantity, 6)
+        self.assertEqual(order.total_price, 2 * (100 + 101 + 102))
+        self.assertEqual(dict(order.items.values_list('product_id', 'quantity')),
+                         {product.pk: 2 for product in self.products[:3]})
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:3]])
+                 .values_list('stock_quantity', flat=True)),
+            [8, 8, 8]
+        )
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_retry_with_same_key_returns_same_order(self):
+        self.fill_cart(self.products[:2])
+        first = self.order('key-1')
+        # Повторная отправка формы (корзина уже пуста) возвращает тот же заказ
+        second = self.order('key-1')
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(first.url, second.url)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 8)
+
+    def test_missing_key_is_rejected(self):
+        self.fill_cart(self.products[:1])
+
+        response = self.client.post(reverse('orders:create'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(CartItem.objects.exists())
+
+    def test_query_count_does_not_depend_on_items_count(self):
+        self.fill_cart(self.products[:1])
+        with CaptureQueriesContext(connection) as few:
+            self.order('key-1')
+
+        self.fill_cart(self.products)
+        with CaptureQueriesContext(connection) as many:
+            self.order('key-2')
+
+        self.assertEqual(Order.objects.get(idempotency_key='key-2').items.count(), len(self.products))
+        self.assertEqual(len(few), len(many))
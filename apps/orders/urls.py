@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+
+app_name = 'orders'
+
+urlpatterns = [
+    path('create/', views.order_create, name='create'),
+    path('<int:order_id>/', views.order_detail, name='detail'),
+]
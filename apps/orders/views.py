@@ -0,0 +1,46 @@
+from django.contrib import messages
+from django.http import Http404, HttpResponseBadRequest
+from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import require_POST
+
+from apps.cart.cart_manager import CartManager
+from .checkout import checkout
+from .models import Order
+
+
+@require_POST
+def order_create(request):
+    """Оформление заказа из корзины"""
+    # Ключ выдается вместе со страницей корзины, поэтому повторная отправка формы
+    # (двойной клик, обновление страницы) возвращает тот же заказ
+    idempotency_key = request.POST.get('idempotency_key')
+    if not idempotency_key:
+        # Без ключа повторная отправка создала бы второй заказ
+        return HttpResponseBadRequest('Не передан ключ идемпотентности')
+
+    try:
+        order = checkout(CartManager(request), idempotency_key[:64])
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('cart:detail')
+
+    return redirect('orders:detail', order_id=order.pk)
+
+
+def order_detail(request, order_id):
+    """Страница заказа"""
+    order = get_object_or_404(Order, pk=order_id)
+
+    if request.user.is_authenticated:
+        is_owner = order.user_id == request.user.pk
+    else:
+        session_key = request.session.session_key
+        is_owner = order.user_id is None and session_key is not None and order.session_key == session_key
+    if not is_owner:
+        raise Http404('Заказ не найден')
+
+    return render(request, 'orders/order_detail.html',
+                  context={
+                      'order': order,
+                      'items': order.items.select_related('product')
+                  })
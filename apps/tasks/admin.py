@@ -0,0 +1,22 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'updated_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', )
+    readonly_fields = ('created_at', 'updated_at', 'locked_at', 'last_error')
+
+    actions = ['retry_tasks']
+
+    def retry_tasks(self, request, queryset):
+        """Повторить выбранные задачи"""
+        updated = queryset.exclude(status=Task.STATUS_RUNNING).update(
+            status=Task.STATUS_PENDING, attempts=0, run_at=timezone.now()
+        )
+        self.message_user(request, f'Поставлено в очередь задач: {updated}')
+    retry_tasks.short_description = 'Повторить выбранные задачи'
@@ -0,0 +1,96 @@
+import logging
+import multiprocessing
+import signal
+import time
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Как часто (сек) возвращать брошенные задачи в очередь, чистить выполненные
+# и проверять срок периодических задач (settings.PERIODIC_TASKS)
+MAINTENANCE_INTERVAL = 60
+
+
+def worker_loop(poll_interval, burst, keep_done):
+    """Цикл рабочего процесса: берет задачи из очереди и выполняет их"""
+    # При запуске процессов через spawn (Windows, macOS) Django нужно инициализировать заново
+    django.setup()
+    from apps.tasks.queue import (
+        claim_task, run_task, requeue_stale_tasks, purge_done_tasks, run_periodic_tasks
+    )
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    last_maintenance = 0
+    last_periodic_runs = {}
+    try:
+        while not stopping:
+            if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                requeue_stale_tasks()
+                purge_done_tasks(keep_done)
+                run_periodic_tasks(last_periodic_runs)
+                last_maintenance = time.monotonic()
+
+            task = claim_task()
+            if task is None:
+                if burst:
+                    break
+                time.sleep(poll_interval)
+                continue
+            run_task(task)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает пул процессов, выполняющих фоновые задачи из очереди в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help='Количество рабочих процессов')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза (сек) между проверками пустой очереди')
+        parser.add_argument('--burst', action='store_true',
+                            help='Завершиться, когда очередь опустеет')
+        parser.add_argument('--keep-done-hours', type=int, default=24,
+                            help='Сколько часов хранить выполненные задачи')
+
+    def handle(self, *args, **options):
+        worker_args = (
+            options['poll_interval'],
+            options['burst'],
+            timedelta(hours=options['keep_done_hours']),
+        )
+        # Соединения с БД нельзя разделять между процессами
+        connections.close_all()
+
+        workers = [
+            multiprocessing.Process(target=worker_loop, args=worker_args, daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Запущено рабочих процессов: {len(workers)}')
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+
+        self.stdout.write(self.style.SUCCESS('Рабочие процессы остановлены'))
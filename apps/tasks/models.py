@@ -0,0 +1,39 @@
+from django.db import models
+
+
+class Task(models.Model):
+    """Модель фоновой задачи в очереди"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнена'),
+        (STATUS_FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=200, verbose_name='Функция')
+    args = models.JSONField(default=list, blank=True, verbose_name='Позиционные аргументы')
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name='Именованные аргументы')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(default=5, verbose_name='Максимум попыток')
+    run_at = models.DateTimeField(verbose_name='Запустить после')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            # Выборка очередной задачи: WHERE status = 'pending' ORDER BY run_at
+            models.Index(fields=['status', 'run_at'], name='tasks_task_status_run_at'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
@@ -0,0 +1,136 @@
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# Задержка перед повтором: BACKOFF_BASE * 2 ** (номер попытки - 1) секунд
+BACKOFF_BASE = 10
+# Задача, которая выполняется дольше, считается брошенной (процесс завершился аварийно)
+STALE_AFTER = timedelta(minutes=30)
+
+
+def enqueue(func, *args, delay=0, max_attempts=5, **kwargs):
+    """Ставит вызов func(*args, **kwargs) в очередь.
+
+    func - функция уровня модуля или путь к ней строкой. Аргументы должны
+    сериализоваться в JSON. Задача записывается в текущей транзакции, поэтому
+    при ее откате в очередь ничего не попадет
+    """
+    name = func if isinstance(func, str) else f'{func.__module__}.{func.__qualname__}'
+    return Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def run_or_enqueue(func, *args, size, threshold):
+    """Выполняет func(*args) сразу или ставит в очередь, если объем работы size больше threshold.
+
+    Возвращает результат func или None, если вызов поставлен в очередь
+    """
+    if size > threshold:
+        enqueue(func, *args)
+        return None
+    return func(*args)
+
+
+def get_backoff(attempts):
+    """Возвращает задержку перед следующей попыткой"""
+    return timedelta(seconds=BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+def claim_task():
+    """Берет в работу очередную задачу. Возвращает None, если очередь пуста.
+
+    SELECT ... FOR UPDATE SKIP LOCKED позволяет нескольким процессам
+    разбирать очередь параллельно, не блокируя друг друга
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        task = Task.objects.select_for_update(skip_locked=True).filter(
+            status=Task.STATUS_PENDING,
+            run_at__lte=now,
+        ).order_by('run_at').first()
+        if task is None:
+            return None
+
+        task.status = Task.STATUS_RUNNING
+        task.attempts += 1
+        task.locked_at = now
+        task.save(update_fields=['status', 'attempts', 'locked_at', 'updated_at'])
+    return task
+
+
+def run_task(task):
+    """Выполняет задачу и записывает результат: успех, повтор с задержкой или ошибку"""
+    try:
+        func = import_string(task.name)
+        func(*task.args, **task.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts < task.max_attempts:
+            task.status = Task.STATUS_PENDING
+            task.run_at = timezone.now() + get_backoff(task.attempts)
+            logger.warning(f'Задача {task.pk} ({task.name}) завершилась ошибкой, '
+                           f'повтор в {task.run_at}')
+        else:
+            task.status = Task.STATUS_FAILED
+            logger.error(f'Задача {task.pk} ({task.name}) не выполнена за '
+                         f'{task.attempts} попыток')
+        task.last_error = error
+        task.locked_at = None
+        task.save(update_fields=['status', 'run_at', 'last_error', 'locked_at', 'updated_at'])
+        return False
+
+    task.status = Task.STATUS_DONE
+    task.locked_at = None
+    task.last_error = ''
+    task.save(update_fields=['status', 'locked_at', 'last_error', 'updated_at'])
+    return True
+
+
+def requeue_stale_tasks():
+    """Возвращает в очередь задачи, брошенные аварийно завершившимися процессами"""
+    return Task.objects.filter(
+        status=Task.STATUS_RUNNING,
+        locked_at__lt=timezone.now() - STALE_AFTER,
+    ).update(status=Task.STATUS_PENDING, locked_at=None, run_at=timezone.now())
+
+
+def purge_done_tasks(older_than):
+    """Удаляет выполненные задачи старше older_than"""
+    deleted, _ = Task.objects.filter(
+        status=Task.STATUS_DONE,
+        updated_at__lt=timezone.now() - older_than,
+    ).delete()
+    return deleted
+
+
+def run_periodic_tasks(last_runs):
+    """Выполняет периодические задачи из settings.PERIODIC_TASKS, у которых подошел срок.
+
+    last_runs - {путь к функции: time.monotonic() последнего запуска}, его хранит
+    рабочий процесс. Задачи выполняются каждым процессом, поэтому они должны
+    допускать параллельный запуск (release_expired берет строки с SKIP LOCKED)
+    """
+    for name, interval in getattr(settings, 'PERIODIC_TASKS', {}).items():
+        if time.monotonic() - last_runs.get(name, float('-inf')) < interval:
+            continue
+        last_runs[name] = time.monotonic()
+        try:
+            import_string(name)()
+        except Exception:
+            logger.exception(f'Периодическая задача {name} завершилась ошибкой')
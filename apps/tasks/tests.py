@@ -0,0 +1,145 @@
+import threading
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import (enqueue, claim_task, run_task, requeue_stale_tasks, purge_done_tasks,
+                    run_periodic_tasks, BACKOFF_BASE, STALE_AFTER)
+
+
+# Вызовы задач из тестов: [(args, kwargs)]
+calls = []
+
+
+def record_call(*args, **kwargs):
+    calls.append((args, kwargs))
+
+
+def failing_task():
+    raise ValueError('Сбой задачи')
+
+
+class TaskQueueTests(TestCase):
+    """Очередь фоновых задач в БД"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        task = enqueue(record_call, 1, 'два', flag=True)
+
+        self.assertEqual(task.name, 'apps.tasks.tests.record_call')
+        claimed = claim_task()
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts),
+                         (task.pk, Task.STATUS_RUNNING, 1))
+        self.assertTrue(run_task(claimed))
+
+        self.assertEqual(calls, [((1, 'два'), {'flag': True})])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.locked_at), (Task.STATUS_DONE, None))
+        self.assertIsNone(claim_task())
+
+    def test_rolled_back_task_is_not_queued(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            enqueue(record_call)
+            raise ValueError
+
+        self.assertFalse(Task.objects.exists())
+
+    def test_delayed_task_waits_and_oldest_goes_first(self):
+        enqueue(record_call, 'позже', delay=60)
+        first = enqueue(record_call, 'первая')
+        second = enqueue(record_call, 'вторая')
+
+        self.assertEqual(claim_task().pk, first.pk)
+        self.assertEqual(claim_task().pk, second.pk)
+        self.assertIsNone(claim_task())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        task = enqueue(failing_task, max_attempts=2)
+
+        before = timezone.now()
+        with self.assertLogs('apps.tasks.queue', 'WARNING'):
+            self.assertFalse(run_task(claim_task()))
+
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.STATUS_PENDING, 1))
+        self.assertIn('Сбой задачи', task.last_error)
+        self.assertGreaterEqual(task.run_at, before + timedelta(seconds=BACKOFF_BASE))
+        # Повтор еще не наступил
+        self.assertIsNone(claim_task())
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        with self.assertLogs('apps.tasks.queue', 'ERROR'):
+            self.assertFalse(run_task(claim_task()))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.STATUS_FAILED, 2))
+        self.assertIsNone(claim_task())
+
+    def test_stale_running_task_is_requeued(self):
+        task = enqueue(record_call)
+        claim_task()
+        Task.objects.filter(pk=task.pk).update(locked_at=timezone.now() - STALE_AFTER * 2)
+
+        self.assertEqual(requeue_stale_tasks(), 1)
+        self.assertEqual(claim_task().pk, task.pk)
+
+    def test_purge_keeps_recent_and_unfinished_tasks(self):
+        old, recent = enqueue(record_call), enqueue(record_call)
+        pending = enqueue(record_call)
+        Task.objects.filter(pk__in=[old.pk, recent.pk]).update(status=Task.STATUS_DONE)
+        Task.objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(purge_done_tasks(timedelta(days=1)), 1)
+        self.assertEqual(sorted(Task.objects.values_list('pk', flat=True)),
+                         sorted([recent.pk, pending.pk]))
+
+    @override_settings(PERIODIC_TASKS={'apps.tasks.tests.record_call': 60,
+                                       'apps.tasks.tests.failing_task': 60})
+    def test_periodic_tasks_run_once_per_interval(self):
+        last_runs = {}
+
+        # Ошибка одной задачи не мешает остальным
+        with self.assertLogs('apps.tasks.queue', 'ERROR'):
+            run_periodic_tasks(last_runs)
+        run_periodic_tasks(last_runs)
+        self.assertEqual(len(calls), 1)
+
+        last_runs['apps.tasks.tests.record_call'] -= 60
+        run_periodic_tasks(last_runs)
+        self.assertEqual(len(calls), 2)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SKIP LOCKED поддерживает только PostgreSQL')
+class ConcurrentClaimTests(TransactionTestCase):
+    """Параллельные рабочие процессы не ждут друг друга и не берут одну задачу"""
+
+    def test_locked_task_is_skipped(self):
+        locked = enqueue(record_call, 'первая')
+        free = enqueue(record_call, 'вторая')
+        is_locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    Task.objects.select_for_update().get(pk=locked.pk)
+                    is_locked.set()
+                    release.wait(timeout=10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            is_locked.wait(timeout=10)
+            claimed = claim_task()
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(claimed.pk, free.pk)
+        self.assertEqual(Task.objects.get(pk=locked.pk).status, Task.STATUS_PENDING)
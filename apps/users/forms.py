@@ -1,7 +1,11 @@
 from datetime import datetime
 from django import forms
 from django.contrib.auth import get_user_model
-from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm, UserCreationForm
+from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm, PasswordResetForm, \
+    UserCreationForm
+from django.template import loader
+
+from apps.tasks.queue import enqueue
 
 
 User = get_user_model()
@@ -61,3 +65,18 @@ class UserPasswordChangeForm(PasswordChangeForm):
                                     widget=forms.PasswordInput(attrs={'class': 'form-contact'}))
     new_password2 = forms.CharField(label='Повтор пароля',
                                     widget=forms.PasswordInput(attrs={'class': 'form-contact'}))
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Форма сброса пароля, отправляющая письмо фоновой задачей, а не в потоке запроса"""
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_message = None
+        if html_email_template_name is not None:
+            html_message = loader.render_to_string(html_email_template_name, context)
+
+        enqueue('apps.users.tasks.send_email', subject, body, from_email, [to_email],
+                html_message=html_message)
@@ -0,0 +1,9 @@
+from django.core.mail import EmailMultiAlternatives
+
+
+def send_email(subject, body, from_email, recipient_list, html_message=None):
+    """Фоновая задача: отправляет письмо"""
+    message = EmailMultiAlternatives(subject, body, from_email, recipient_list)
+    if html_message is not None:
+        message.attach_alternative(html_message, 'text/html')
+    message.send()
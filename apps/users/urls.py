@@ -3,6 +3,7 @@ from django.contrib.auth.views import LogoutView, PasswordChangeDoneView, Passwo
     PasswordResetCompleteView, PasswordResetDoneView
 
 from . import views
+from .forms import QueuedPasswordResetForm
 
 
 app_name = 'users'
@@ -19,6 +20,7 @@ urlpatterns = [
         template_name='users/password_change_done.html'), name='password_change_done'),
     path('password-reset/', PasswordResetView.as_view(
         template_name='users/password_reset_form.html',
+        form_class=QueuedPasswordResetForm,
         email_template_name='users/password_reset_email.html',
         success_url=reverse_lazy('users:password_reset_done')
     ),
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count
 
 from .models import Wishlist
 
@@ -9,7 +10,12 @@ class WishlistAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'updated_at')
     search_fields = ('user__username', 'user__email')
     filter_horizontal = ('products', )
+    list_select_related = ('user', )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(items_count=Count('products'))
 
     def get_items_count(self, obj):
-        return obj.products.count()
-    get_items_count.short_description = 'Количество товаров'
\ No newline at end of file
+        return obj.items_count
+    get_items_count.short_description = 'Количество товаров'
+    get_items_count.admin_order_field = 'items_count'
\ No newline at end of file
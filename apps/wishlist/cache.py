@@ -0,0 +1,68 @@
+from django.core.cache import cache
+
+from apps.catalog.cache import new_version
+from .models import Wishlist
+
+
+WISHLIST_VERSION_KEY = 'wishlist:version:{}'
+# Ключ сессии, под которым хранятся id избранного, его версия и id товаров
+WISHLIST_SESSION_KEY = 'wishlist'
+
+
+def bump_wishlist_version(wishlist_id):
+    """Инвалидирует копии списка товаров избранного во всех сессиях"""
+    version = new_version()
+    cache.set(WISHLIST_VERSION_KEY.format(wishlist_id), version, None)
+    return version
+
+
+def get_wishlist_version(wishlist_id):
+    """Возвращает текущую версию избранного"""
+    version = cache.get(WISHLIST_VERSION_KEY.format(wishlist_id))
+    if version is None:
+        version = bump_wishlist_version(wishlist_id)
+    return version
+
+
+def remember_wishlist(request, wishlist, product_ids=None):
+    """Сохраняет в сессии id товаров избранного с его текущей версией.
+
+    wishlist может быть None - тогда запоминается, что избранного нет
+    """
+    if wishlist is None:
+        data = {'id': None, 'version': None, 'products': []}
+    else:
+        if product_ids is None:
+            product_ids = wishlist.products.values_list('id', flat=True)
+        data = {
+            'id': wishlist.pk,
+            'version': get_wishlist_version(wishlist.pk),
+            'products': list(product_ids),
+        }
+    request.session[WISHLIST_SESSION_KEY] = data
+    return data
+
+
+def get_wishlist_product_ids(request):
+    """Возвращает множество id товаров в избранном.
+
+    Список берется из сессии и перечитывается из БД только если избранное
+    изменилось (в том числе в другой сессии того же пользователя)
+    """
+    data = request.session.get(WISHLIST_SESSION_KEY)
+
+    if data is None:
+        if request.user.is_authenticated:
+            wishlist = Wishlist.objects.filter(user=request.user).first()
+        elif request.session.session_key:
+            wishlist = Wishlist.objects.filter(session_key=request.session.session_key).first()
+        else:
+            # Без сессии избранного нет, и сессию ради него не создаем
+            return set()
+        data = remember_wishlist(request, wishlist)
+
+    elif data['id'] is not None and data['version'] != get_wishlist_version(data['id']):
+        wishlist = Wishlist.objects.filter(pk=data['id']).first()
+        data = remember_wishlist(request, wishlist)
+
+    return set(data['products'])
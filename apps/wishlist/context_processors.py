@@ -1,22 +1,13 @@
-from .models import Wishlist
+from django.utils.functional import SimpleLazyObject
 
+from .cache import get_wishlist_product_ids
 
-def wishlist_products(request):
-    """Добавляет список ID товаров в избранном в контекст шаблона"""
-    wishlist_products = []
-
-    if request.user.is_authenticated:
-        wishlist = Wishlist.objects.filter(user=request.user).first()
-    else:
-        if request.session.session_key:
-            session_key = request.session.session_key
-            wishlist = Wishlist.objects.filter(session_key=session_key).first()
-        else:
-            wishlist = None
 
-    if wishlist:
-        wishlist_products = wishlist.products.values_list('id', flat=True)
+def wishlist_products(request):
+    """Добавляет множество ID товаров в избранном в контекст шаблона.
 
+    Значение вычисляется лениво - только если шаблон его использует
+    """
     return {
-        'wishlist_products': list(wishlist_products)
-    }
\ No newline at end of file
+        'wishlist_products': SimpleLazyObject(lambda: get_wishlist_product_ids(request))
+    }
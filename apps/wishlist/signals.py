@@ -1,7 +1,11 @@
 from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import m2m_changed
 from django.dispatch import receiver
+from django.utils import timezone
 import logging
 
+from .cache import bump_wishlist_version, remember_wishlist
 from .models import Wishlist
 
 
@@ -15,28 +19,62 @@ def merge_wishlist_on_login(sender, request, user, **kwargs):
     # Получаем secret_key из куки (старый ключ)
     old_session_key = request.COOKIES.get('sessionid')
 
-    if not old_session_key:
+    merged = bool(old_session_key) and merge_session_wishlist(old_session_key, user)
+
+    # В сессии могли остаться товары анонимного избранного
+    user_wishlist = Wishlist.objects.filter(user=user).first()
+    if merged:
+        bump_wishlist_version(user_wishlist.pk)
+    remember_wishlist(request, user_wishlist)
+
+
+@receiver(m2m_changed, sender=Wishlist.products.through)
+def touch_wishlist_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Обновляет время изменения избранного при добавлении и удалении товаров.
+
+    Изменение связей не сохраняет сам Wishlist, а по updated_at брошенное
+    анонимное избранное удаляется (см. apps.cart.tasks.purge_stale_baskets)
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
         return
+    if reverse:
+        # Товары изменены со стороны товара: product.wishlist.add(...)
+        if not pk_set:
+            return
+        wishlists = Wishlist.objects.filter(pk__in=pk_set)
+    else:
+        wishlists = Wishlist.objects.filter(pk=instance.pk)
+    wishlists.update(updated_at=timezone.now())
+
+
+def merge_session_wishlist(old_session_key, user):
+    """Переносит товары из сессионного избранного в избранное пользователя.
 
-    try:
-        logger.debug(f"Ищем избранное с session_key={old_session_key}, user__isnull=True")
-        # Получаем избранное из сессии
-        session_wishlist = Wishlist.objects.get(session_key=old_session_key, user__isnull=True)
-        logger.info(f"Найдено избранное в сессии с {session_wishlist.products.count()} товарами")
+    Возвращает True, если избранное пользователя изменилось. Число запросов
+    не зависит от количества товаров в избранном
+    """
+    logger.debug(f"Ищем избранное с session_key={old_session_key}, user__isnull=True")
+    session_wishlist = Wishlist.objects.filter(session_key=old_session_key, user__isnull=True).first()
+    if session_wishlist is None:
+        logger.warning(f"Избранное с session_key={old_session_key} не найдено")
+        return False
 
+    through = Wishlist.products.through
+    with transaction.atomic():
         # Получаем или создаем избранное пользователя
         user_wishlist, created = Wishlist.objects.get_or_create(user=user)
 
-        # Добавляем товары из сессии в избранное пользователя
-        for product in session_wishlist.products.all():
-            if not user_wishlist.products.filter(id=product.id).exists():
-                user_wishlist.products.add(product)
-            else:
-                logger.info(f"Товар уже есть в избранном: {product.name}")
+        # Добавляем товары из сессии одним запросом, уже добавленные пропускаются
+        through.objects.bulk_create(
+            [
+                through(wishlist_id=user_wishlist.pk, product_id=product_id)
+                for product_id in session_wishlist.products.values_list('id', flat=True)
+            ],
+            ignore_conflicts=True
+        )
 
         # Удаляем временное избранное
         session_wishlist.delete()
-        logger.debug("Сессионное избранное удалено")
 
-    except Wishlist.DoesNotExist:
-        logger.warning(f"Избранное с session_key={old_session_key} не найдено")
\ No newline at end of file
+    logger.debug("Сессионное избранное удалено")
+    return True
@@ -1,3 +1,78 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.cart.tasks import BASKET_TTL, purge_stale_baskets
+from apps.catalog.testing import create_subcategory, create_products
+from .models import Wishlist
+
+
+class MergeWishlistOnLoginTests(TestCase):
+    """Объединение сессионного избранного с избранным пользователя при входе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_products(create_subcategory(), 20)
+        cls.password = 'Pa55-word!'
+
+    def login_with_session_wishlist(self, products):
+        """Добавляет товары в избранное анонимно, входит и возвращает число запросов входа"""
+        user = get_user_model().objects.create_user(
+            username=f'user{len(products)}', email=f'user{len(products)}@example.com',
+            password=self.password
+        )
+        # Первый товар уже в избранном пользователя
+        user_wishlist = Wishlist.objects.create(user=user)
+        user_wishlist.products.add(products[0])
+
+        for product in products:
+            self.client.post(reverse('wishlist:add', args=[product.pk]), HTTP_REFERER='/')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('users:login'),
+                             {'username': user.username, 'password': self.password})
+        self.client.logout()
+        return user_wishlist, len(queries)
+
+    def test_merge_adds_missing_products(self):
+        user_wishlist, _ = self.login_with_session_wishlist(self.products[:3])
+
+        self.assertEqual(set(user_wishlist.products.values_list('id', flat=True)),
+                         {product.pk for product in self.products[:3]})
+        self.assertFalse(Wishlist.objects.filter(user__isnull=True).exists())
+
+    def test_query_count_does_not_depend_on_products_count(self):
+        _, few = self.login_with_session_wishlist(self.products[:2])
+        _, many = self.login_with_session_wishlist(self.products)
+        self.assertEqual(few, many)
+
+
+class WishlistActivityTests(TestCase):
+    """Изменение товаров избранного продлевает его жизнь"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_products(create_subcategory(), 2)
+
+    def test_adding_product_keeps_wishlist_from_purge(self):
+        self.client.post(reverse('wishlist:add', args=[self.products[0].pk]), HTTP_REFERER='/')
+        wishlist = Wishlist.objects.get()
+        Wishlist.objects.update(updated_at=timezone.now() - BASKET_TTL - timedelta(days=1))
+
+        self.client.post(reverse('wishlist:add', args=[self.products[1].pk]), HTTP_REFERER='/')
+        purge_stale_baskets()
+
+        self.assertTrue(Wishlist.objects.filter(pk=wishlist.pk).exists())
+
+    def test_idle_wishlist_is_purged(self):
+        self.client.post(reverse('wishlist:add', args=[self.products[0].pk]), HTTP_REFERER='/')
+        Wishlist.objects.update(updated_at=timezone.now() - BASKET_TTL - timedelta(days=1))
+
+        purge_stale_baskets()
 
-# Create your tests here.
+        self.assertFalse(Wishlist.objects.exists())
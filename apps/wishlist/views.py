@@ -3,6 +3,8 @@ from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.decorators.http import require_POST
 
+from .cache import (bump_wishlist_version, get_wishlist_product_ids, remember_wishlist,
+                    WISHLIST_SESSION_KEY)
 from .models import Wishlist, Product
 from dns_django import settings
 
@@ -30,6 +32,11 @@ def get_wishlist(request):
             wishlist.user = None
             wishlist.save()
 
+    # Запоминаем в сессии товары избранного, если там другое избранное или его нет
+    data = request.session.get(WISHLIST_SESSION_KEY)
+    if data is None or data['id'] != wishlist.pk:
+        remember_wishlist(request, wishlist)
+
     return wishlist
 
 def wishlist_detail(request):
@@ -49,22 +56,29 @@ def wishlist_add(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     wishlist = get_wishlist(request)
 
-    if wishlist.products.filter(id=product.id).exists():
+    product_ids = get_wishlist_product_ids(request)
+
+    if product.id in product_ids:
         wishlist.products.remove(product)
+        product_ids.discard(product.id)
         added = False
         message = f'Товар "{product.name}" удален из избранного'
     else:
         wishlist.products.add(product)
+        product_ids.add(product.id)
         added = True
         message = f'Товар "{product.name}" добавлен в избранное'
 
+    bump_wishlist_version(wishlist.pk)
+    remember_wishlist(request, wishlist, product_ids)
+
     # Проверяем, AJAX ли запрос
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'added' : added,
             'product_id': product.id,
             'message': message,
-            'wishlist_count': wishlist.products.count()
+            'wishlist_count': len(product_ids)
         })
     else:
         messages.success(request, message)
@@ -75,6 +89,8 @@ def wishlist_clear(request):
     """Очистка избранного"""
     wishlist = get_object_or_404(Wishlist, user=request.user)
     wishlist.products.clear()
+    bump_wishlist_version(wishlist.pk)
+    remember_wishlist(request, wishlist, [])
     messages.success(request, 'Список избранного очищен')
     return redirect('wishlist:detail')
 
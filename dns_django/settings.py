@@ -26,11 +26,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'apps.main',
     'apps.users',
     'apps.catalog',
     'apps.cart',
     'apps.wishlist',
+    'apps.tasks',
+    'apps.orders',
 ]
 
 MIDDLEWARE = [
@@ -58,6 +61,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'apps.wishlist.context_processors.wishlist_products',
+                'apps.cart.context_processors.cart_len',
             ],
         },
     },
@@ -79,6 +83,41 @@ DATABASES = {
 }
 
 
+# Кэш версий карточек товаров, дерева категорий и фрагментов шаблонов. Версии
+# меняют и отдельные процессы (import_catalog, backfill_discounts, run_workers),
+# поэтому кэш должен быть общим для всех процессов (см. проверку catalog.W001).
+# По умолчанию - файловый кэш в каталоге проекта: он общий для процессов одного
+# узла и не требует отдельного сервиса. При нескольких узлах нужен Redis:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://redis:6379/1
+FILE_CACHE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+CACHES = {
+    'default': {
+        'BACKEND': env('CACHE_BACKEND', FILE_CACHE_BACKEND),
+        'LOCATION': env('CACHE_LOCATION', str(BASE_DIR / '.cache' / 'django')),
+    }
+}
+if CACHES['default']['BACKEND'] == FILE_CACHE_BACKEND:
+    # Файловый кэш пересчитывает файлы при каждой записи, поэтому их число
+    # ограничено; при переполнении удаляется четверть записей. Потеря версии
+    # карточки безопасна: новая версия только сбрасывает ее фрагменты
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 30000, 'CULL_FREQUENCY': 4}
+
+# Сессии (в том числе корзина анонимного посетителя) хранятся в отдельном кэше,
+# а не в django_session: изменение корзины или избранного не пишет в PostgreSQL.
+# Отдельный кэш - чтобы вытеснение карточек товаров не завершало сессии.
+# В рабочем окружении лучше Redis:
+# SESSION_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache SESSION_CACHE_LOCATION=redis://redis:6379/2
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+SESSION_CACHE_ALIAS = 'sessions'
+CACHES['sessions'] = {
+    'BACKEND': env('SESSION_CACHE_BACKEND', FILE_CACHE_BACKEND),
+    'LOCATION': env('SESSION_CACHE_LOCATION', str(BASE_DIR / '.cache' / 'sessions')),
+}
+if CACHES['sessions']['BACKEND'] == FILE_CACHE_BACKEND:
+    # Сессий больше, чем карточек; при переполнении удаляется десятая часть случайных сессий
+    CACHES['sessions']['OPTIONS'] = {'MAX_ENTRIES': 100000, 'CULL_FREQUENCY': 10}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -154,6 +193,16 @@ EMAIL_ADMIN = EMAIL_HOST_USER
 DEFAULT_USER_IMAGE = MEDIA_URL + 'users/default.png'
 DEFAULT_PRODUCT_IMAGE = MEDIA_URL + 'catalog/products/placeholder.png'
 
+# Хранилище корзины анонимного посетителя (корзины пользователей всегда в БД)
+CART_ANONYMOUS_STORAGE = 'apps.cart.storage.SessionCartStorage'
+
+# Периодические задачи, которые выполняют рабочие процессы очереди (run_workers):
+# путь к функции -> интервал в секундах. Без запущенного run_workers резервы товара
+# из брошенных корзин не вернутся на склад (или запускайте release_reservations --interval)
+PERIODIC_TASKS = {
+    'apps.catalog.tasks.release_expired_reservations': 60,
+}
+
 # Настройки логирования
 LOGGING = {
     'version': 1,
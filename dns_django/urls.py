@@ -12,6 +12,7 @@ urlpatterns = [
     path('catalog/', include('apps.catalog.urls', namespace='catalog')),
     path('cart/', include('apps.cart.urls', namespace='cart')),
     path('wishlist/', include('apps.wishlist.urls', namespace='wishlist')),
+    path('orders/', include('apps.orders.urls', namespace='orders')),
 ]
 
 # Необходимо для отображения файлов в режиме отладки